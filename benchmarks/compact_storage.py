@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Benchmark the memory held by `Dandelion.data` with and without `Dandelion.compact`.
+
+Usage:
+    python benchmarks/compact_storage.py [n_cells ...]
+
+Defaults to 10^4 and 4 x 10^4 cells (roughly 2.5 x 10^4 and 10^5 contigs), using the table from
+`sanitize_data.airr_table` with random sequences and germline alignments of 400 and 1000 nucleotides.
+Reported are the deep memory usage of the sanitized table, of the compacted table, and of the compacted
+table with the sequences offloaded to a temporary folder, not counting the memory-mapped Arrow columns,
+followed by the time taken to compact and to build the metadata of the plain and compacted objects.
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# helpers shared by the benchmarks, importable from any working directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sanitize_data import airr_table
+from dandelion.utilities._core import Dandelion, update_metadata
+
+
+def random_sequences(n, length, rng):
+    """`n` random nucleotide sequences of `length`."""
+    letters = np.frombuffer(b'ACGT', dtype=np.uint8)
+    raw = letters[rng.integers(0, 4, n * length)].tobytes().decode()
+    return ([raw[i * length:(i + 1) * length] for i in range(n)])
+
+
+def main(sizes):
+    for n_cells in sizes:
+        data = airr_table(n_cells)
+        rng = np.random.default_rng(0)
+        data['sequence'] = random_sequences(data.shape[0], 400, rng)
+        data['germline_alignment'] = random_sequences(data.shape[0], 1000,
+                                                      rng)
+        vdj = Dandelion(data, initialize=False)
+        plain = vdj.data.memory_usage(deep=True).sum()
+        start = time.perf_counter()
+        vdj.compact()
+        elapsed = time.perf_counter() - start
+        compact = vdj.data.memory_usage(deep=True).sum()
+        with tempfile.TemporaryDirectory() as store:
+            offloaded = Dandelion(data, initialize=False)
+            offloaded.compact(store=store)
+            usage = offloaded.data.memory_usage(deep=True)
+            mapped = [
+                d for d in offloaded.data
+                if offloaded.data[d].dtype == 'string[pyarrow]'
+            ]
+            on_disk = usage.sum() - usage[mapped].sum()
+            del offloaded
+        print('{:>9,} contigs: plain {:.0f}MB, compact {:.0f}MB, offloaded {:.0f}MB'
+              .format(data.shape[0], plain / 2**20, compact / 2**20,
+                      on_disk / 2**20))
+        timings = []
+        for obj in [Dandelion(data, initialize=False), vdj]:
+            start = time.perf_counter()
+            update_metadata(obj)
+            timings.append(time.perf_counter() - start)
+        print('{:>19} compact in {:.2f}s, metadata plain {:.2f}s, compact {:.2f}s'
+              .format('', elapsed, *timings))
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [10**4, 4 * 10**4])
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Benchmark the memory taken by copies of `Dandelion` objects.
+
+Usage:
+    python benchmarks/copy_on_write.py [n_cells ...]
+
+Defaults to 5 x 10^3 and 2 x 10^4 cells. The table from `sanitize_data.airr_table` is given random amino acid
+sequence alignments and clones of about three cells, and a network is generated. Reported are the time and the
+peak of memory allocated, traced with `tracemalloc`, by `copy.deepcopy` of the object, by `Dandelion.copy`
+followed by reading `.data` from both objects, and by generating the network again, relative to the memory
+taken by the object itself.
+"""
+import copy
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+# helpers shared by the benchmarks, importable from any working directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sanitize_data import airr_table
+from dandelion.utilities._core import Dandelion
+from dandelion.tools._network import generate_network
+
+AA = np.frombuffer(b'ACDEFGHIKLMNPQRSTVWY', dtype=np.uint8)
+
+
+def traced(f, *args, **kwargs):
+    """Time and peak of memory allocated by `f`."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    f(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return (elapsed, peak)
+
+
+def copied(vdj):
+    out = vdj.copy()
+    out.data, vdj.data
+    return (out)
+
+
+def main(sizes):
+    for n_cells in sizes:
+        data = airr_table(n_cells)
+        rng = np.random.default_rng(0)
+        raw = AA[rng.integers(0, len(AA), data.shape[0] * 120)].tobytes()
+        data['sequence_alignment_aa'] = [
+            raw[i * 120:(i + 1) * 120].decode() for i in range(data.shape[0])
+        ]
+        cells = data['cell_id'].unique()
+        clones = dict(zip(cells, rng.integers(0, len(cells) // 3,
+                                              len(cells))))
+        data['clone_id'] = data['cell_id'].map(clones).astype(str)
+        tracemalloc.start()
+        vdj = Dandelion(data)
+        generate_network(vdj, verbose=False)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print('{:>9,} contigs, object of {:.0f}MB'.format(
+            data.shape[0], size / 2**20))
+        for name, f in [('deepcopy', copy.deepcopy),
+                        ('Dandelion.copy', copied),
+                        ('generate_network', generate_network)]:
+            elapsed, peak = traced(f, vdj, **({
+                'verbose': False
+            } if f is generate_network else {}))
+            print('{:>19} {:.2f}s, peak {:.1f}x the object'.format(
+                name, elapsed, peak / size))
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [5 * 10**3, 2 * 10**4])
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""
+Benchmark the contig checks of `pp.filter_contigs` on synthetic AIRR tables.
+
+Usage:
+    python benchmarks/filter_contigs.py [n_cells ...]
+
+Defaults to 10^5 and 10^6 cells. The table from `initialize_metadata.synthetic_data` is given a
+sequence_alignment column so that contigs with identical sequences are merged, as well as tested for umi
+counts, doublets and calls of the wrong locus. The full checks are also timed in chunks over all cpus.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+# helpers shared by the benchmarks, importable from any working directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from initialize_metadata import synthetic_data
+from dandelion.preprocessing._preprocessing import (FilterContigs,
+                                                    FilterContigsLite,
+                                                    _check_contigs)
+
+
+def main(sizes):
+    for n_cells in sizes:
+        data = synthetic_data(n_cells)
+        rng = np.random.default_rng(0)
+        data['sequence_alignment'] = np.where(
+            rng.random(data.shape[0]) < 0.3, 'ACGT' * 100, data['junction_aa'])
+        start = time.perf_counter()
+        tofilter = FilterContigs(data, True, 2, True)
+        full = time.perf_counter() - start
+        start = time.perf_counter()
+        FilterContigsLite(data)
+        lite = time.perf_counter() - start
+        start = time.perf_counter()
+        _check_contigs(data, False, True, 2, True, n_jobs=-1)
+        parallel = time.perf_counter() - start
+        print(
+            '{:>9,} cells {:>10,} contigs: full {:.2f}s, lite {:.2f}s, full on {} cpus {:.2f}s ({:,} contigs dropped)'
+            .format(n_cells, data.shape[0], full, lite, os.cpu_count(),
+                    parallel, len(tofilter.drop_contig)))
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [10**5, 10**6])
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+"""
+Benchmark `pp.filter_contigs` with an `AnnData` on synthetic AIRR tables, to check that it scales linearly.
+
+Usage:
+    python benchmarks/filter_contigs_anndata.py [n_cells ...]
+
+Defaults to 2.5 x 10^4 to 4 x 10^5 cells, doubling each time. The table is `sanitize_data.airr_table`, and the
+AnnData holds 95% of its cells plus as many cells without contigs, so that the has_contig, contig_QC_pass and filter_missing annotations all
+have work to do. The time per cell should stay flat as the number of cells grows.
+"""
+import os
+import sys
+import time
+
+import anndata as ad
+import numpy as np
+import pandas as pd
+
+# helpers shared by the benchmarks, importable from any working directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sanitize_data import airr_table
+from dandelion.preprocessing._preprocessing import filter_contigs
+
+
+def main(sizes):
+    for n_cells in sizes:
+        data = airr_table(n_cells)
+        cells = data['cell_id'].unique()
+        rng = np.random.default_rng(0)
+        kept = cells[rng.random(len(cells)) < 0.95]
+        extra = np.char.add('rna', np.arange(len(cells)).astype(str))
+        adata = ad.AnnData(obs=pd.DataFrame(
+            index=np.concatenate([kept, extra]).astype(str)))
+        start = time.perf_counter()
+        vdj, adata_ = filter_contigs(data, adata)
+        elapsed = time.perf_counter() - start
+        print('{:>9,} cells {:>10,} contigs: {:7.2f}s  ({:.1f} us per cell)'.
+              format(n_cells, data.shape[0], elapsed,
+                     elapsed / n_cells * 1e6))
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or
+         [25000 * 2**i for i in range(5)])
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Benchmark the hamming clustering step of `tl.find_clones` on synthetic repertoires.
+
+Usage:
+    python benchmarks/find_clones.py [n_contigs ...]
+
+Synthetic junctions are drawn as clonal families around random roots, with V gene usage skewed so that a
+few V/J/length groups are very large, as with IGHV3-23/IGHJ4 in real data. The legacy pairwise engine is
+only timed for the smaller repertoires.
+"""
+import math
+import sys
+import time
+
+import numpy as np
+
+from dandelion.utilities._utilities import Tree
+from dandelion.tools._tools import _cluster_groups, clustering
+from scipy.spatial.distance import pdist, squareform
+from distance import hamming
+
+AA = np.array(list('ACDEFGHIKLMNPQRSTVWY'))
+
+
+def synthetic_groups(n_contigs, seed=0):
+    """Simulate unique junctions grouped by V/J/length."""
+    rng = np.random.default_rng(seed)
+    v_usage = 1 / np.arange(1, 51)
+    v = rng.choice(50, size=n_contigs, p=v_usage / v_usage.sum())
+    j = rng.choice(6, size=n_contigs, p=[.5, .2, .1, .1, .05, .05])
+    length = rng.integers(12, 20, size=n_contigs)
+    family = rng.integers(0, max(1, n_contigs // 5), size=n_contigs)
+    seq_grp = Tree()
+    for vv, jj, ll, ff, mut in zip(v, j, length, family,
+                                   rng.integers(0, 4, size=n_contigs)):
+        root = np.random.default_rng(ff).choice(AA, size=ll)
+        root[rng.integers(0, ll, size=mut)] = rng.choice(AA, size=mut)
+        seq_grp[('IGHV' + str(vv), 'IGHJ' + str(jj))][ll][''.join(root)].value = 1
+    return (seq_grp)
+
+
+def legacy_groups(seq_grp, identity):
+    """Pairwise pdist + `clustering` as used before the vectorised engine."""
+    clones = Tree()
+    for g in seq_grp:
+        for l in seq_grp[g]:
+            seq_ = list(seq_grp[g][l])
+            tr = math.floor(int(l) * (1 - identity))
+            if len(seq_) > 1:
+                d_mat = np.tril(
+                    squareform(
+                        pdist(
+                            np.array(seq_).reshape(-1, 1),
+                            lambda x, y: hamming(x[0], y[0]))))
+                source, target = d_mat.nonzero()
+                dist = {(s, t): d_mat[s, t] for s, t in zip(source, target)}
+                seq_tmp_dict = clustering(dist, tr, seq_)
+            else:
+                seq_tmp_dict = {seq_[0]: tuple([seq_[0]])}
+            clones_tmp = sorted(list(set(seq_tmp_dict.values())),
+                                key=len,
+                                reverse=True)
+            for x in range(0, len(clones_tmp)):
+                clones[g][l][x + 1] = clones_tmp[x]
+    return (clones)
+
+
+def main(sizes):
+    for n in sizes:
+        seq_grp = synthetic_groups(n)
+        largest = max(
+            len(seq_grp[g][l]) for g in seq_grp for l in seq_grp[g])
+        start = time.perf_counter()
+        _cluster_groups(seq_grp, 0.85)
+        vectorised = time.perf_counter() - start
+        if n <= 10**4:
+            start = time.perf_counter()
+            legacy_groups(seq_grp, 0.85)
+            legacy = '{:.2f}s'.format(time.perf_counter() - start)
+        else:
+            legacy = 'skipped'
+        print('{:>9} contigs, largest group {:>6}: vectorised {:.2f}s, legacy {}'.
+              format(n, largest, vectorised, legacy))
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [10**4, 10**5, 10**6])
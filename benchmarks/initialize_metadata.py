@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Benchmark the `.metadata` initialisation of `Dandelion` on synthetic repertoires.
+
+Usage:
+    python benchmarks/initialize_metadata.py [n_cells ...]
+
+Defaults to 10^5 and 10^6 cells. Each cell gets one to four contigs drawn from a mix of BCR and TCR loci, with
+multiple V/J/C calls and blank calls sprinkled in so that every branch of the locus, productive, isotype and
+V(D)J status derivation is exercised. The synthetic table is assigned to an uninitialised `Dandelion` so that only
+the contig aggregation and metadata derivation are timed.
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from dandelion.utilities._core import Dandelion, Query, update_metadata
+
+LOCI = {
+    'IGH': ('IGHV', 'IGHD', 'IGHJ', ['IGHM', 'IGHD', 'IGHG1', 'IGHA1']),
+    'IGK': ('IGKV', '', 'IGKJ', ['IGKC']),
+    'IGL': ('IGLV', '', 'IGLJ', ['IGLC2', 'IGLC3']),
+    'TRB': ('TRBV', 'TRBD', 'TRBJ', ['TRBC1', 'TRBC2']),
+    'TRA': ('TRAV', '', 'TRAJ', ['TRAC']),
+}
+
+
+def _calls(rng, prefix, n, genes):
+    """Allelic gene calls with the odd ambiguous call."""
+    calls = np.char.add(
+        np.char.add(prefix, rng.integers(1, genes, size=n).astype(str)),
+        '*01').astype(object)
+    multi = rng.random(n) < 0.05
+    calls[multi] = calls[multi] + ',' + prefix + '1*02'
+    return (calls)
+
+
+def synthetic_data(n_cells, seed=0):
+    """Simulate an AIRR table with `n_cells` cells."""
+    rng = np.random.default_rng(seed)
+    n_per = rng.integers(1, 5, size=n_cells)
+    cell_id = np.repeat(np.char.add('cell', np.arange(n_cells).astype(str)),
+                        n_per)
+    n = len(cell_id)
+    bcr = rng.random(n_cells) < 0.7
+    locus = np.empty(n, dtype=object)
+    heavy = rng.random(n) < 0.5
+    light = np.where(rng.random(n) < 0.6, 'IGK', 'IGL')
+    locus[:] = np.where(np.repeat(bcr, n_per),
+                        np.where(heavy, 'IGH', light),
+                        np.where(heavy, 'TRB', 'TRA'))
+    v_call, d_call, j_call, c_call = (np.empty(n, dtype=object)
+                                      for _ in range(4))
+    for l, (v, d, j, c) in LOCI.items():
+        idx = np.flatnonzero(locus == l)
+        v_call[idx] = _calls(rng, v, len(idx), 60)
+        d_call[idx] = _calls(rng, d, len(idx), 20) if d else ''
+        j_call[idx] = _calls(rng, j, len(idx), 6)
+        c_call[idx] = np.array(c, dtype=object)[rng.integers(0,
+                                                             len(c),
+                                                             size=len(idx))]
+    c_call[rng.random(n) < 0.1] = ''
+    data = pd.DataFrame({
+        'sequence_id':
+        np.char.add(np.char.add(cell_id, '_contig_'),
+                    np.arange(n).astype(str)),
+        'cell_id':
+        cell_id,
+        'locus':
+        locus,
+        'productive':
+        np.where(rng.random(n) < 0.9, 'T', 'F').astype(object),
+        'v_call':
+        v_call,
+        'd_call':
+        d_call,
+        'j_call':
+        j_call,
+        'c_call':
+        c_call,
+        'duplicate_count':
+        rng.integers(1, 50, size=n),
+        'junction_aa':
+        np.char.add('CAR', rng.integers(0, 10**6, size=n).astype(str)),
+        'clone_id':
+        np.char.add('clone', (rng.integers(0, max(1, n_cells // 4),
+                                           size=n)).astype(str)),
+    })
+    data.index = data['sequence_id']
+    return (data)
+
+
+def main(sizes):
+    for n_cells in sizes:
+        data = synthetic_data(n_cells)
+        vdj = Dandelion(initialize=False)
+        vdj.data = data
+        start = time.time()
+        vdj.querier = Query(vdj.data)
+        update_metadata(vdj)
+        elapsed = time.time() - start
+        print('{:>9,} cells {:>10,} contigs: {:8.2f} s  ({} columns)'.format(
+            n_cells, data.shape[0], elapsed, vdj.metadata.shape[1]))
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [10**5, 10**6])
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+Benchmark reading AIRR .tsv files with `load_data` and `iter_airr`.
+
+Usage:
+    python benchmarks/load_data.py [n_cells ...]
+
+Defaults to 2 x 10^4 and 10^5 cells. The table from `sanitize_data.airr_table` is padded to about 100 columns,
+as igblast writes, and saved uncompressed and gzipped. Timed, with the peak memory traced, are reading every
+column, reading the 20 columns most steps need and summing the umi counts of the productive contigs chunk by
+chunk with `iter_airr`.
+"""
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+# helpers shared by the benchmarks, importable from any working directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sanitize_data import airr_table
+from dandelion.utilities._utilities import load_data, iter_airr
+
+COLUMNS = [
+    'sequence_id', 'cell_id', 'locus', 'productive', 'v_call', 'd_call',
+    'j_call', 'c_call', 'junction', 'junction_aa', 'junction_length',
+    'umi_count', 'sequence', 'rev_comp', 'vj_in_frame', 'v_identity',
+    'mu_freq', 'sample_id', 'duplicate_count', 'clone_id'
+]
+
+
+def padded_table(n_cells):
+    """`airr_table` with extra alignment, score and position columns."""
+    data = airr_table(n_cells)
+    rng = np.random.default_rng(0)
+    n = data.shape[0]
+    for i in range(100 - data.shape[1]):
+        if i % 3 == 0:
+            data['extra_alignment_{}'.format(i)] = 'ACGT' * 20
+        elif i % 3 == 1:
+            data['extra_score_{}'.format(i)] = rng.random(n)
+        else:
+            data['extra_start_{}'.format(i)] = rng.integers(1, 300, n)
+    return (data)
+
+
+def traced(func):
+    """Run `func`, returning the elapsed time and the peak memory traced in MB."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return (elapsed, peak)
+
+
+def main(sizes):
+    for n_cells in sizes:
+        data = padded_table(n_cells)
+        with tempfile.TemporaryDirectory() as tmp:
+            for suffix in ['.tsv', '.tsv.gz']:
+                file = tmp + '/airr' + suffix
+                data.to_csv(file, sep='\t', index=False)
+                print('{:>9,} contigs, {} columns{}:'.format(
+                    data.shape[0], data.shape[1], suffix))
+                for label, func in [
+                    ('all columns', lambda: load_data(file)),
+                    ('20 columns', lambda: load_data(file, usecols=COLUMNS)),
+                    ('chunks of 10^4', lambda: sum(
+                        chunk.loc[chunk['productive'] == 'T', 'umi_count'].
+                        sum() for chunk in iter_airr(
+                            file, chunksize=10**4, usecols=COLUMNS))),
+                ]:
+                    print('{:>25} {:6.2f}s  peak {:7.1f} MB'.format(
+                        label, *traced(func)))
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [2 * 10**4, 10**5])
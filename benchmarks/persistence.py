@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Benchmark writing and reading `Dandelion` objects as h5 and as parquet.
+
+Usage:
+    python benchmarks/persistence.py [n_cells ...]
+
+Defaults to 5 x 10^3 and 2 x 10^4 cells. The table from `sanitize_data.airr_table` is given short amino acid
+sequence alignments and clones of about three cells, and a network is generated. Timed are `write_h5` and
+`read_h5`, of every slot and backed with the metadata, layouts and distances only, and `write_parquet` and
+`read_parquet`, of every slot and of the metadata with five data columns only.
+"""
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+
+# helpers shared by the benchmarks, importable from any working directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sanitize_data import airr_table
+from dandelion.utilities._core import Dandelion
+from dandelion.utilities._io import read_h5, read_parquet
+from dandelion.tools._network import generate_network
+
+AA = np.frombuffer(b'ACDEFGHIKLMNPQRSTVWY', dtype=np.uint8)
+COLUMNS = ['cell_id', 'locus', 'v_call', 'j_call', 'clone_id']
+
+
+def network(n_cells):
+    """`Dandelion` object of `airr_table(n_cells)` with a network."""
+    data = airr_table(n_cells)
+    rng = np.random.default_rng(0)
+    raw = AA[rng.integers(0, len(AA), data.shape[0] * 12)].tobytes()
+    data['sequence_alignment_aa'] = [
+        raw[i * 12:(i + 1) * 12].decode() for i in range(data.shape[0])
+    ]
+    cells = data['cell_id'].unique()
+    clones = dict(zip(cells, rng.integers(0, len(cells) // 3, len(cells))))
+    data['clone_id'] = data['cell_id'].map(clones).astype(str)
+    vdj = Dandelion(data)
+    generate_network(vdj, verbose=False)
+    return (vdj)
+
+
+def size(path):
+    """Size of a file or directory in MB."""
+    if os.path.isfile(path):
+        return (os.path.getsize(path) / 1e6)
+    return (sum(
+        os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path)
+        for f in files) / 1e6)
+
+
+def timed(f, *args, **kwargs):
+    start = time.perf_counter()
+    f(*args, **kwargs)
+    return (time.perf_counter() - start)
+
+
+def main(sizes):
+    for n_cells in sizes:
+        vdj = network(n_cells)
+        with tempfile.TemporaryDirectory() as tmp:
+            h5, parquet = tmp + '/vdj.h5ddl', tmp + '/vdj.parquet'
+            print('{:>9,} contigs:'.format(vdj.n_contigs))
+            write = timed(vdj.write_h5, h5, keep_distance=True)
+            print(
+                '{:>10} write {:6.2f}s, read {:6.2f}s, {:7.1f} MB, backed metadata and layouts {:6.2f}s'
+                .format(
+                    'h5', write, timed(read_h5, h5), size(h5),
+                    timed(read_h5,
+                          h5,
+                          slots=['metadata', 'layout', 'distance'],
+                          backed=True)))
+            write = timed(vdj.write_parquet, parquet)
+            print(
+                '{:>10} write {:6.2f}s, read {:6.2f}s, {:7.1f} MB, metadata and {} columns {:6.2f}s'
+                .format(
+                    'parquet', write, timed(read_parquet, parquet),
+                    size(parquet), len(COLUMNS),
+                    timed(read_parquet,
+                          parquet,
+                          slots=['data', 'metadata'],
+                          columns=COLUMNS)))
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [5 * 10**3, 2 * 10**4])
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+"""
+Benchmark `Dandelion.write_pkl` and `read_pkl` with each compression.
+
+Usage:
+    python benchmarks/pickle_codecs.py [n_cells ...]
+
+Defaults to 5 x 10^3 and 2 x 10^4 cells. The object is the network from `persistence.network`, kept with its
+distance matrices. Timed are writing and reading it uncompressed, with bz2 and gzip, and with zstd and lz4,
+which write the buffers of arrays out of band and, for zstd, compress on all cores.
+"""
+import os
+import sys
+import tempfile
+
+# helpers shared by the benchmarks, importable from any working directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from persistence import network, size, timed
+from dandelion.utilities._io import read_pkl
+
+CODECS = ['none', 'bz2', 'gzip', 'zstd', 'lz4']
+
+
+def main(sizes):
+    for n_cells in sizes:
+        vdj = network(n_cells)
+        print('{:>9,} contigs, {} cpus:'.format(vdj.n_contigs, os.cpu_count()))
+        with tempfile.TemporaryDirectory() as tmp:
+            for codec in CODECS:
+                pkl = os.path.join(tmp, 'vdj.' + codec)
+                write = timed(vdj.write_pkl, pkl, compression=codec)
+                print('{:>10} write {:6.2f}s, read {:6.2f}s, {:7.1f} MB'.format(
+                    codec, write, timed(read_pkl, pkl), size(pkl)))
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [5 * 10**3, 2 * 10**4])
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Benchmark `sanitize_data` on synthetic AIRR tables.
+
+Usage:
+    python benchmarks/sanitize_data.py [n_cells ...]
+
+Defaults to 10^5 and 4 x 10^5 cells (roughly 2.5 x 10^5 and 10^6 contigs). The table from
+`initialize_metadata.synthetic_data` is padded with long sequences, boolean flags, number and integer fields
+with missing values, and a few TRAV/DV calls. Timed are a first pass over the raw table, a second pass over a
+copy of the sanitized table and a pass after replacing one column, followed by `validate_airr` of the
+sanitized table with each validation policy.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+# helpers shared by the benchmarks, importable from any working directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from initialize_metadata import synthetic_data
+from dandelion.utilities._utilities import sanitize_data, validate_airr
+
+
+def airr_table(n_cells, seed=0):
+    """Synthetic AIRR table with the kinds of columns `sanitize_data` coerces."""
+    data = synthetic_data(n_cells, seed).reset_index(drop=True)
+    rng = np.random.default_rng(seed)
+    n = data.shape[0]
+    data['sequence'] = 'ACGT' * 100
+    data['rev_comp'] = 'F'
+    data['vj_in_frame'] = np.where(rng.random(n) < 0.5, 'T', 'F')
+    data['junction'] = 'TGT' * 20
+    data['v_identity'] = np.where(rng.random(n) < 0.1, np.nan,
+                                  rng.random(n) * 100)
+    data['umi_count'] = np.where(rng.random(n) < 0.1, np.nan,
+                                 rng.integers(1, 10, n))
+    data['mu_freq'] = rng.random(n)
+    data['junction_length'] = rng.integers(30, 60, n).astype(object)
+    data.loc[rng.random(n) < 0.1, 'junction_length'] = ''
+    data['v_call'] = np.where(rng.random(n) < 0.01, 'TRAV29/DV5*01',
+                              data['v_call'])
+    data['sample_id'] = 'S1'
+    return (data)
+
+
+def main(sizes):
+    for n_cells in sizes:
+        data = airr_table(n_cells)
+        start = time.perf_counter()
+        clean = sanitize_data(data)
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        sanitize_data(clean.copy())
+        again = time.perf_counter() - start
+        edited = clean.copy()
+        edited['c_call'] = edited['c_call'].replace('IGHM', 'IGHG1')
+        start = time.perf_counter()
+        sanitize_data(edited)
+        column = time.perf_counter() - start
+        print(
+            '{:>9,} contigs: first {:.2f}s, clean copy {:.2f}s, one column {:.2f}s'
+            .format(data.shape[0], first, again, column))
+        for policy in ['header', 'sample', 'full']:
+            start = time.perf_counter()
+            validate_airr(clean, policy=policy)
+            print('{:>19} validation {:.2f}s'.format(
+                policy, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main([int(x) for x in sys.argv[1:]] or [10**5, 4 * 10**5])
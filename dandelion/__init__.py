@@ -8,7 +8,7 @@ from . import preprocessing as pp
 from . import utilities as utl
 from . import tools as tl
 from . import plotting as pl
-from .utilities import read_pkl, read_h5, read_10x_airr, read_10x_vdj, from_scirpy, to_scirpy, Dandelion, update_metadata, concat, load_data
+from .utilities import read_pkl, read_h5, read_parquet, read_10x_airr, read_10x_vdj, from_scirpy, to_scirpy, Dandelion, update_metadata, concat, load_data, read_airr, iter_airr
 from .logging import __version__, __author__, __email__, __classifiers__
 from . import logging
 
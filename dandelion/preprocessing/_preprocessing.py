@@ -9,9 +9,12 @@ import pandas as pd
 from subprocess import run
 from tqdm import tqdm
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 from time import sleep
 from ..utilities._utilities import *
 from ..utilities._core import *
+from ..utilities._core import _map_unique
 from ..utilities._io import *
 from .external._preprocessing import (assigngenes_igblast, makedb_igblast,
                                       parsedb_heavy, parsedb_light,
@@ -1884,6 +1887,8 @@ def filter_contigs(data: Union[Dandelion, pd.DataFrame, str],
                    productive_only: bool = True,
                    simple: bool = False,
                    save: Optional[str] = None,
+                   n_jobs: Optional[int] = None,
+                   chunk_size: Optional[int] = None,
                    **kwargs) -> Tuple[Dandelion, AnnData]:
     """
     Filter doublets and poor quality cells and corresponding contigs based on provided V(D)J `DataFrame` and `AnnData`.
@@ -1931,6 +1936,11 @@ def filter_contigs(data: Union[Dandelion, pd.DataFrame, str],
         simple filtering mode where only checks for potential gene assignment mismatches.
     save : str, Optional
         Only used if a pandas dataframe or dandelion object is provided. Specifying will save the formatted vdj table.
+    n_jobs : int, Optional
+        number of processes used to check the contigs. None defaults to 1, no parallelization. -1 uses all available
+        cpus. The cells are split into chunks by a hash of their cell_id, so results are identical to the serial run.
+    chunk_size : int, Optional
+        approximate number of cells per chunk when `n_jobs` is used. None splits the cells into `n_jobs` chunks.
     **kwargs
         additional kwargs passed to `Dandelion.Dandelion`.
 
@@ -1948,29 +1958,25 @@ def filter_contigs(data: Union[Dandelion, pd.DataFrame, str],
         if productive_only:
             dat = dat_[dat_['productive'].isin(TRUES)].copy()
         else:
-            dat = dat_.copy()
+            dat = dat_
     else:
-        dat = dat_.copy()
+        dat = dat_
 
     if 'cell_id' not in dat.columns:
         raise AttributeError(
             "VDJ data does not contain 'cell_id' column. Please make sure this is populated before filtering."
         )
 
-    barcode = list(set(dat['cell_id']))
+    # barcodes are matched with hash-based isin lookups rather than scanning the table for each barcode
+    barcode = pd.Index(dat['cell_id'].unique())
 
     if adata is not None:
         adata_provided = True
         adata_ = adata.copy()
         if 'filter_rna' not in adata_.obs:
             adata_.obs['filter_rna'] = 'False'
-        contig_check = pd.DataFrame(index=adata_.obs_names)
-        bc_ = {}
-        for b in barcode:
-            bc_.update({b: 'True'})
-        contig_check['has_contig'] = pd.Series(bc_)
-        contig_check.replace(np.nan, 'No_contig', inplace=True)
-        adata_.obs['has_contig'] = pd.Series(contig_check['has_contig'])
+        adata_.obs['has_contig'] = np.where(adata_.obs_names.isin(barcode),
+                                            'True', 'No_contig')
     else:
         adata_provided = False
         obs = pd.DataFrame(index=barcode)
@@ -1986,61 +1992,18 @@ def filter_contigs(data: Union[Dandelion, pd.DataFrame, str],
     elif 'duplicate_count' in dat and 'umi_count' in dat:
         dat['umi_count'] = dat['duplicate_count']
 
-    if not simple:
-        tofilter = FilterContigs(dat, keep_highest_umi, umi_foldchange_cutoff,
-                                 filter_poorqualitycontig)
-    else:
-        tofilter = FilterContigsLite(dat)
-
-    poor_qual = tofilter.poor_qual.copy()
-    h_doublet = tofilter.h_doublet.copy()
-    l_doublet = tofilter.l_doublet.copy()
-    drop_contig = tofilter.drop_contig.copy()
-    umi_adjustment = tofilter.umi_adjustment.copy()
+    poor_qual, h_doublet, l_doublet, drop_contig, umi_adjustment = _check_contigs(
+        dat, simple, keep_highest_umi, umi_foldchange_cutoff,
+        filter_poorqualitycontig, n_jobs, chunk_size)
 
     if len(umi_adjustment) > 0:
         dat['duplicate_count'].update(umi_adjustment)
 
-    poorqual = {}
-    hdoublet = {}
-    ldoublet = {}
-    if adata_provided:
-        for c in tqdm(adata_.obs_names,
-                      desc='Annotating in anndata obs slot '):
-            if c in poor_qual:
-                poorqual.update({c: 'True'})
-            else:
-                poorqual.update({c: 'False'})
-
-            if c in h_doublet:
-                hdoublet.update({c: 'True'})
-            else:
-                hdoublet.update({c: 'False'})
-
-            if c in l_doublet:
-                ldoublet.update({c: 'True'})
-            else:
-                ldoublet.update({c: 'False'})
-    else:
-        for c in adata_.obs_names:
-            if c in poor_qual:
-                poorqual.update({c: 'True'})
-            else:
-                poorqual.update({c: 'False'})
-
-            if c in h_doublet:
-                hdoublet.update({c: 'True'})
-            else:
-                hdoublet.update({c: 'False'})
-
-            if c in l_doublet:
-                ldoublet.update({c: 'True'})
-            else:
-                ldoublet.update({c: 'False'})
-
-    adata_.obs['filter_contig_quality'] = pd.Series(poorqual)
-    adata_.obs['filter_contig_VDJ'] = pd.Series(hdoublet)
-    adata_.obs['filter_contig_VJ'] = pd.Series(ldoublet)
+    for key, cells in [('filter_contig_quality', poor_qual),
+                       ('filter_contig_VDJ', h_doublet),
+                       ('filter_contig_VJ', l_doublet)]:
+        adata_.obs[key] = np.where(adata_.obs_names.isin(cells), 'True',
+                                   'False')
 
     drop_contig = list(set(flatten(drop_contig)))
 
@@ -2063,22 +2026,15 @@ def filter_contigs(data: Union[Dandelion, pd.DataFrame, str],
         filter_ids = list(set(filter_ids))
 
         if filter_missing:
-            for c in dat['cell_id']:
-                if c not in adata_.obs_names:
-                    filter_ids.append(c)
+            filter_ids += list(dat.loc[~dat['cell_id'].isin(adata_.obs_names),
+                                       'cell_id'].unique())
 
         _dat = dat[~(dat['cell_id'].isin(filter_ids))].copy()
         _dat = _dat[~(_dat['sequence_id'].isin(drop_contig))].copy()
 
-        # final check
-        barcodes_final = list(set(_dat['cell_id']))
-        filter_ids2 = []
-        for b in barcodes_final:
-            check_dat = _dat[(_dat['locus'].isin(HEAVYLONG))
-                             & (_dat['cell_id'].isin([b]))].copy()
-            if check_dat.shape[0] < 1:
-                filter_ids2.append(b)
-        _dat = _dat[~(_dat['cell_id'].isin(filter_ids2))].copy()
+        # final check: remove cells left without a VDJ contig
+        has_vdj = _dat.loc[_dat['locus'].isin(HEAVYLONG), 'cell_id'].unique()
+        _dat = _dat[_dat['cell_id'].isin(has_vdj)].copy()
 
         if _dat.shape[0] == 0:
             raise IndexError(
@@ -2101,30 +2057,17 @@ def filter_contigs(data: Union[Dandelion, pd.DataFrame, str],
     else:
         _dat = dat.copy()
 
-    if filter_contig:
-        barcode1 = list(set(dat['cell_id']))
-
-    barcode2 = list(set(_dat['cell_id']))
-
-    if filter_contig:
-        failed = list(set(barcode1) ^ set(barcode2))
-
     print('Initializing Dandelion object')
     out_dat = Dandelion(data=_dat, **kwargs)
     if data.__class__ == Dandelion:
         out_dat.germline = data.germline
 
     if adata_provided:
-        bc_2 = {}
-        for b in barcode2:
-            bc_2.update({b: 'True'})
-        if filter_contig:
-            for b in failed:
-                bc_2.update({b: 'False'})
-        contig_check['contig_QC_pass'] = pd.Series(bc_2)
-        contig_check.replace(np.nan, 'No_contig', inplace=True)
-        adata_.obs['contig_QC_pass'] = pd.Series(
-            contig_check['contig_QC_pass'])
+        passed = adata_.obs_names.isin(_dat['cell_id'])
+        failed = adata_.obs_names.isin(barcode) & ~passed
+        adata_.obs['contig_QC_pass'] = np.select([passed, failed],
+                                                 ['True', 'False'],
+                                                 'No_contig')
         adata_.obs['filter_contig'] = adata_.obs_names.isin(filter_ids)
         if filter_rna:
             # not saving the scanpy object because there's no need to at the moment
@@ -2139,6 +2082,71 @@ def filter_contigs(data: Union[Dandelion, pd.DataFrame, str],
         return (out_dat)
 
 
+def _check_contigs(dat: pd.DataFrame,
+                   simple: bool,
+                   keep_highest_umi: bool,
+                   umi_foldchange_cutoff: float,
+                   filter_poorqualitycontig: bool,
+                   n_jobs: Optional[int] = None,
+                   chunk_size: Optional[int] = None) -> Tuple:
+    """
+    Run `FilterContigs`, or `FilterContigsLite` if `simple`, on chunks of cells in a process pool.
+
+    Cells are independent, so the cells are assigned to chunks by a hash of their cell_id and the results of the
+    chunks are concatenated.
+
+    Returns
+    -------
+    lists of poor quality cells, VDJ doublets, VJ doublets and contigs to drop, and dictionary of umi adjustments.
+    """
+    if n_jobs is not None and n_jobs < 0:
+        n_jobs = os.cpu_count()
+    args = (simple, keep_highest_umi, umi_foldchange_cutoff,
+            filter_poorqualitycontig)
+    if n_jobs is None or n_jobs <= 1:
+        return (_check_contigs_chunk(dat, *args))
+    # only send the columns that are checked
+    columns = [
+        'sequence_id', 'cell_id', 'locus', 'productive', 'v_call',
+        'v_call_genotyped', 'd_call', 'j_call', 'c_call', 'duplicate_count',
+        'sequence_alignment'
+    ]
+    dat = dat[[c for c in columns if c in dat]]
+    n_cells = dat['cell_id'].nunique()
+    n_chunks = n_jobs if chunk_size is None else -(-n_cells // chunk_size)
+    chunk = pd.util.hash_array(dat['cell_id'].values.astype(str)) % max(
+        1, n_chunks)
+    chunks = [dat[chunk == i] for i in np.unique(chunk)]
+    # spawn rather than fork, as forking after hdf5/numba threads have started can deadlock
+    with ProcessPoolExecutor(max_workers=n_jobs,
+                             mp_context=get_context('spawn')) as executor:
+        results = list(
+            executor.map(_check_contigs_chunk, chunks,
+                         *[[a] * len(chunks) for a in args]))
+    poor_qual, h_doublet, l_doublet, drop_contig = [], [], [], []
+    umi_adjustment = {}
+    for out in results:
+        poor_qual += out[0]
+        h_doublet += out[1]
+        l_doublet += out[2]
+        drop_contig += out[3]
+        umi_adjustment.update(out[4])
+    return (poor_qual, h_doublet, l_doublet, drop_contig, umi_adjustment)
+
+
+def _check_contigs_chunk(dat: pd.DataFrame, simple: bool,
+                         keep_highest_umi: bool, umi_foldchange_cutoff: float,
+                         filter_poorqualitycontig: bool) -> Tuple:
+    """Check the contigs of one chunk of cells."""
+    if not simple:
+        tofilter = FilterContigs(dat, keep_highest_umi, umi_foldchange_cutoff,
+                                 filter_poorqualitycontig)
+    else:
+        tofilter = FilterContigsLite(dat)
+    return (tofilter.poor_qual, tofilter.h_doublet, tofilter.l_doublet,
+            tofilter.drop_contig, tofilter.umi_adjustment)
+
+
 def quantify_mutations(self: Union[Dandelion, str, PathLike],
                        split_locus: bool = False,
                        sequence_column: Optional[str] = None,
@@ -2663,6 +2671,169 @@ def calculate_threshold(self: Union[Dandelion, pd.DataFrame, str],
         return (output)
 
 
+# contig groups of each cell: productive and non-productive VDJ, then productive and non-productive VJ
+VDJ_P, VDJ_NP, VJ_P, VJ_NP = range(4)
+
+
+def _present(values: np.ndarray) -> np.ndarray:
+    """`present` of every value, evaluated once per unique value."""
+    return (_map_unique(present, values).astype(bool))
+
+
+def _search(values: np.ndarray, pattern: str) -> np.ndarray:
+    """Whether `pattern` is found in every present value, evaluated once per unique value."""
+    return (_map_unique(lambda x: present(x) and re.search(pattern, x) is
+                        not None, values).astype(bool))
+
+
+def _mismatch(a: np.ndarray, b: np.ndarray, patterns: Sequence) -> np.ndarray:
+    """Whether `not_same_call` of `a` and `b` holds for any of `patterns`."""
+    out = np.zeros(len(a), dtype=bool)
+    for pattern in patterns:
+        out |= _search(a, pattern) != _search(b, pattern)
+    return (out)
+
+
+class _ContigGroups:
+    """
+    Contigs of each cell, split into productive and non-productive VDJ and VJ groups.
+
+    Contigs are held in arrays sorted by cell and group, keeping their order in the data within each group, so
+    that the umi counts of each group are compared with `numpy.ufunc.reduceat` rather than cell by cell.
+    """
+    def __init__(self, data: pd.DataFrame, umi_foldchange_cutoff: float):
+        """
+        Parameters
+        ----------
+        data : pd.DataFrame
+            AIRR data with 'cell_id' and 'duplicate_count' columns.
+        umi_foldchange_cutoff : float
+            fold change in umi counts to the contig of highest umi count to test for.
+        """
+        chain = np.select(
+            [data['locus'].isin(HEAVYLONG), data['locus'].isin(LIGHTSHORT)],
+            [VDJ_P, VJ_P], -1)
+        productive = np.select(
+            [data['productive'].isin(TRUES), data['productive'].isin(FALSES)],
+            [0, 1], -1)
+        included = (chain >= 0) & (productive >= 0)
+        data = data[included]
+        cell, self.cells = pd.factorize(data['cell_id'])
+        group = (chain + productive)[included]
+        order = np.lexsort((group, cell))
+        self.cell = cell[order]
+        self.group = group[order]
+        self.sequence_id = data['sequence_id'].values[order]
+        self.umi = np.array(
+            [int(x) for x in pd.to_numeric(data['duplicate_count'])],
+            dtype=np.int64)[order]
+        self.calls = {}
+        v_call = 'v_call_genotyped' if 'v_call_genotyped' in data else 'v_call'
+        for k, col in zip(['v', 'd', 'j', 'c'],
+                          [v_call, 'd_call', 'j_call', 'c_call']):
+            self.calls[k] = data[col].values[order] if col in data else np.full(
+                len(order), np.nan, dtype=object)
+
+        key = self.cell * 4 + self.group
+        self.starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+        self.starts = self.starts[self.starts < len(key)]
+        self.size = np.diff(np.r_[self.starts, len(key)])
+        self.index = np.repeat(np.arange(len(self.starts)), self.size)
+        self.pos = np.arange(len(key)) - self.starts[self.index]
+        self.kind = self.group[self.starts]
+        self.group_cell = self.cell[self.starts]
+
+        # the first contig of highest umi count is the one kept in each group
+        self.max_umi = self._reduce(np.maximum, self.umi)
+        self.sum_umi = self._reduce(np.add, self.umi)
+        is_max = self.umi == self.max_umi[self.index]
+        self.ties = self._reduce(np.add, is_max.astype(np.int64))
+        self.keep = self._reduce(np.minimum,
+                                 np.where(is_max, self.pos, len(key)))
+        with np.errstate(divide='ignore'):
+            self.ratio = self.max_umi[self.index] / self.umi
+        self.below_cutoff = self._reduce(
+            np.maximum, self.ratio < umi_foldchange_cutoff).astype(bool)
+        self.identical = np.zeros(len(self.starts), dtype=bool)
+        if 'sequence_alignment' in data:
+            self.identical = self._single(
+                data['sequence_alignment'].values[order])
+        self.same_c_call = self._single(self.calls['c'])
+        self.has_ighd = self._reduce(np.maximum,
+                                     self.calls['c'] == 'IGHD').astype(bool)
+
+    def _reduce(self, ufunc: np.ufunc, values: np.ndarray) -> np.ndarray:
+        """`ufunc` reduced over each group."""
+        if len(self.starts) == 0:
+            return (np.zeros(0, dtype=values.dtype))
+        return (ufunc.reduceat(values, self.starts))
+
+    def _single(self, values: np.ndarray) -> np.ndarray:
+        """Whether each group holds a single distinct value, missing values never being the same."""
+        codes = pd.factorize(values)[0]
+        lowest = self._reduce(np.minimum, codes)
+        return ((lowest >= 0) & (lowest == self._reduce(np.maximum, codes)))
+
+    def cells_with(self, rows: np.ndarray) -> np.ndarray:
+        """Whether each cell has any of the contigs in the `rows` mask."""
+        return (np.bincount(self.cell[rows], minlength=len(self.cells)) > 0)
+
+    def cells_of(self, groups: np.ndarray) -> np.ndarray:
+        """Whether each cell has any of the groups in the `groups` mask."""
+        return (np.bincount(self.group_cell[groups],
+                            minlength=len(self.cells)) > 0)
+
+    def merge_identical(self) -> np.ndarray:
+        """
+        Productive groups of several contigs with the same sequence alignment, and c_call for VDJ contigs. All
+        their contigs are dropped, and the contig of highest umi count gets the summed umi count.
+        """
+        merged = (self.size > 1) & self.identical & np.isin(
+            self.kind, [VDJ_P, VJ_P])
+        return (merged & ((self.kind == VJ_P) | self.same_c_call))
+
+    def umi_adjustment(self, merged: np.ndarray) -> dict:
+        """Summed umi counts of the contigs kept in `merged` groups."""
+        groups = np.flatnonzero(merged)
+        return (dict(
+            zip(self.sequence_id[self.starts[groups] + self.keep[groups]],
+                self.sum_umi[groups].tolist())))
+
+    def low_umi(self, tested: np.ndarray,
+                umi_foldchange_cutoff: float) -> np.ndarray:
+        """
+        Contigs of the `tested` groups dropped in favour of the contig of highest umi count. As before, the n-th
+        contig other than the highest is dropped if the n-th contig of the group falls below the cutoff.
+        """
+        rows = np.flatnonzero(tested[self.index]
+                              & (self.pos < self.size[self.index] - 1)
+                              & (self.ratio >= umi_foldchange_cutoff))
+        shift = self.pos[rows] >= self.keep[self.index[rows]]
+        return (rows + shift)
+
+    def bad_vdj(self) -> np.ndarray:
+        """VDJ contigs with calls of other loci or calls that disagree on the locus."""
+        v, d, j, c = [self.calls[k] for k in ['v', 'd', 'j', 'c']]
+        has_v, has_d, has_j, has_c = [_present(x) for x in [v, d, j, c]]
+        bad = has_v & ~_search(v, 'IGH|TR[BD]|TRAV.*/DV')
+        for x, has_x in [(d, has_d), (j, has_j), (c, has_c)]:
+            bad |= has_x & ~_search(x, 'IGH|TR[BD]')
+        bad |= has_j & has_v & (_mismatch(v, j, ['IGH', 'TRB']) |
+                                (_mismatch(v, j, ['TRD'])
+                                 & ~_search(v, 'TRAV.*/DV')))
+        bad |= has_j & has_d & _mismatch(d, j, ['IGH', 'TRB', 'TRD'])
+        return (bad | ~has_j)
+
+    def bad_vj(self) -> np.ndarray:
+        """VJ contigs with calls of other loci or calls that disagree on the locus."""
+        v, j, c = [self.calls[k] for k in ['v', 'j', 'c']]
+        has_v, has_j = _present(v), _present(j)
+        bad = _search(v, 'IGH|TR[BD]') | _search(j, 'IGH|TR[BD]') | _search(
+            c, 'IGH|TR[BD]')
+        bad |= has_j & has_v & _mismatch(v, j, ['IGK', 'IGL', 'TRA', 'TRG'])
+        return (bad | ~has_j)
+
+
 class FilterContigs:
     """
     `FilterContigs` class object.
@@ -2673,548 +2844,49 @@ class FilterContigs:
 
     def __init__(self, data, keep_highest_umi, umi_foldchange_cutoff,
                  filter_poorqualitycontig):
-        self.Cell = Tree()
-        self.poor_qual = []
-        self.h_doublet = []
-        self.l_doublet = []
-        self.drop_contig = []
-        self.umi_adjustment = {}
-        if 'v_call_genotyped' in data.columns:
-            v_dict = dict(zip(data['sequence_id'], data['v_call_genotyped']))
-        else:
-            v_dict = dict(zip(data['sequence_id'], data['v_call']))
-        d_dict = dict(zip(data['sequence_id'], data['d_call']))
-        j_dict = dict(zip(data['sequence_id'], data['j_call']))
-        c_dict = dict(zip(data['sequence_id'], data['c_call']))
-        for contig, row in tqdm(data.iterrows(), desc="Preparing data"):
-            cell = Contig(row).contig['cell_id']
-            if Contig(row).contig['locus'] in HEAVYLONG:
-                if Contig(row).contig['productive'] in TRUES:
-                    self.Cell[cell]['VDJ']['P'][Contig(row).contig].value = 1
-                elif Contig(row).contig['productive'] in FALSES:
-                    self.Cell[cell]['VDJ']['NP'][Contig(row).contig].value = 1
-            elif Contig(row).contig['locus'] in LIGHTSHORT:
-                if Contig(row).contig['productive'] in TRUES:
-                    self.Cell[cell]['VJ']['P'][Contig(row).contig].value = 1
-                elif Contig(row).contig['productive'] in FALSES:
-                    self.Cell[cell]['VJ']['NP'][Contig(row).contig].value = 1
-        for cell in tqdm(self.Cell,
-                         desc='Scanning for poor quality/ambiguous contigs'):
-            if len(self.Cell[cell]['VDJ']['P']) > 0:
-                data1 = pd.DataFrame([
-                    x for x in self.Cell[cell]['VDJ']['P']
-                    if isinstance(x, dict)
-                ],
-                    index=[
-                    x['sequence_id']
-                    for x in self.Cell[cell]['VDJ']['P']
-                    if isinstance(x, dict)
-                ])
-                h_p = list(data1['sequence_id'])
-                h_umi_p = [
-                    int(x) for x in pd.to_numeric(data1['duplicate_count'])
-                ]
-                h_ccall_p = list(data1['c_call'])
-                if len(h_p) > 1:
-                    if 'sequence_alignment' in data1:
-                        h_seq_p = list(data1['sequence_alignment'])
-                        if len(set(h_seq_p)) == 1:
-                            if len(set(h_ccall_p)) == 1:
-                                highest_umi_h = max(h_umi_p)
-                                highest_umi_h_idx = [
-                                    i for i, j in enumerate(h_umi_p)
-                                    if j == highest_umi_h
-                                ]
-                                keep_index_h = highest_umi_h_idx[0]
-                                self.drop_contig.append(h_p[:keep_index_h] +
-                                                        h_p[keep_index_h:])
-                                keep_hc_contig = h_p[keep_index_h]
-                                data1[keep_hc_contig, 'duplicate_count'] = int(
-                                    np.sum(h_umi_p[:keep_index_h] +
-                                           h_umi_p[keep_index_h:]))
-                                self.umi_adjustment.update({
-                                    keep_hc_contig:
-                                    int(
-                                        np.sum(h_umi_p[:keep_index_h] +
-                                               h_umi_p[keep_index_h:]))
-                                })
-                                # refresh
-                                data1 = pd.DataFrame(
-                                    [data1.loc[keep_hc_contig]])
-                                h_p = list(data1['sequence_id'])
-                                h_umi_p = [
-                                    int(x) for x in pd.to_numeric(
-                                        data1['duplicate_count'])
-                                ]
-                                h_ccall_p = list(data1['c_call'])
-                    if len(h_p) > 1:
-                        highest_umi_h = max(h_umi_p)
-                        highest_umi_idx = [
-                            i for i, j in enumerate(h_umi_p)
-                            if j == highest_umi_h
-                        ]
-                        keep_index_h = highest_umi_idx[0]
-                        keep_hc_contig = h_p[keep_index_h]
-                        umi_test = [
-                            int(highest_umi_h) / x < umi_foldchange_cutoff
-                            for x in h_umi_p[:keep_index_h] +
-                            h_umi_p[keep_index_h:]
-                        ]
-                        sum_umi = sum(h_umi_p)
-                        if 'IGHM' and 'IGHD' in h_ccall_p:
-                            if all(cc_ == 'IGHM' or cc_ == 'IGHD'
-                                   for cc_ in h_ccall_p):
-                                pass
-                        else:
-                            if len(highest_umi_idx) > 1:
-                                self.h_doublet.append(cell)
-                            if sum_umi < 4:
-                                self.h_doublet.append(cell)
-                            if any(umi_test):
-                                self.h_doublet.append(cell)
-                            if len(highest_umi_idx) == 1:
-                                other_umi_idx = [
-                                    i for i, j in enumerate(h_umi_p)
-                                    if j != highest_umi_h
-                                ]
-                                umi_test_ = [
-                                    highest_umi_h / x >= umi_foldchange_cutoff
-                                    for x in h_umi_p[:keep_index_h] +
-                                    h_umi_p[keep_index_h:]
-                                ]
-                                umi_test_dict = dict(
-                                    zip(other_umi_idx, umi_test_))
-                                for otherindex in umi_test_dict:
-                                    if umi_test_dict[otherindex]:
-                                        if keep_highest_umi:
-                                            self.drop_contig.append(
-                                                h_p[otherindex])
-                                            # refresh
-                                data1 = pd.DataFrame(
-                                    [data1.loc[keep_hc_contig]])
-                                h_p = list(data1['sequence_id'])
-            if len(self.Cell[cell]['VDJ']['NP']) > 0:
-                data2 = pd.DataFrame([
-                    x for x in self.Cell[cell]['VDJ']['NP']
-                    if isinstance(x, dict)
-                ],
-                    index=[
-                    x['sequence_id']
-                    for x in self.Cell[cell]['VDJ']['NP']
-                    if isinstance(x, dict)
-                ])
-                h_np = list(data2['sequence_id'])
-                h_umi_np = [
-                    int(x) for x in pd.to_numeric(data2['duplicate_count'])
-                ]
-                if len(h_np) > 1:
-                    highest_umi_h = max(h_umi_np)
-                    highest_umi_idx = [
-                        i for i, j in enumerate(h_umi_np) if j == highest_umi_h
-                    ]
-                    if len(highest_umi_idx) == 1:
-                        keep_index_h = highest_umi_idx[0]
-                        keep_hc_contig = h_np[keep_index_h]
-                        other_umi_idx = [
-                            i for i, j in enumerate(h_umi_np)
-                            if j != highest_umi_h
-                        ]
-                        umi_test_ = [
-                            highest_umi_h / x >= umi_foldchange_cutoff
-                            for x in h_umi_np[:keep_index_h] +
-                            h_umi_np[keep_index_h:]
-                        ]
-                        umi_test_dict = dict(zip(other_umi_idx, umi_test_))
-                        for otherindex in umi_test_dict:
-                            if umi_test_dict[otherindex]:
-                                self.drop_contig.append(h_np[otherindex])
-                        # refresh
-                        data2 = pd.DataFrame([data2.loc[keep_hc_contig]])
-                        h_np = list(data2['sequence_id'])
-                        h_umi_np = [
-                            int(x)
-                            for x in pd.to_numeric(data2['duplicate_count'])
-                        ]
-            if len(self.Cell[cell]['VJ']['P']) > 0:
-                data3 = pd.DataFrame([
-                    x
-                    for x in self.Cell[cell]['VJ']['P'] if isinstance(x, dict)
-                ],
-                    index=[
-                    x['sequence_id']
-                    for x in self.Cell[cell]['VJ']['P']
-                    if isinstance(x, dict)
-                ])
-                l_p = list(data3['sequence_id'])
-                l_umi_p = [
-                    int(x) for x in pd.to_numeric(data3['duplicate_count'])
-                ]
-                if len(l_p) > 1:
-                    if 'sequence_alignment' in data3:
-                        l_seq_p = list(data3['sequence_alignment'])
-                        if len(list(set(l_seq_p))) == 1:
-                            highest_umi_l = max(l_umi_p)
-                            highest_umi_l_idx = [
-                                i for i, j in enumerate(l_umi_p)
-                                if j == highest_umi_l
-                            ]
-                            keep_index_l = highest_umi_l_idx[0]
-                            self.drop_contig.append(l_p[:keep_index_l] +
-                                                    l_p[keep_index_l:])
-                            keep_lc_contig = l_p[keep_index_l]
-                            data3.at[keep_lc_contig, 'duplicate_count'] = int(
-                                np.sum(l_umi_p[:keep_index_l] +
-                                       l_umi_p[keep_index_l:]))
-                            self.umi_adjustment.update({
-                                keep_lc_contig:
-                                int(
-                                    np.sum(l_umi_p[:keep_index_l] +
-                                           l_umi_p[keep_index_l:]))
-                            })
-                            # refresh
-                            data3 = pd.DataFrame([data3.loc[keep_lc_contig]])
-                            l_p = list(data3['sequence_id'])
-                            l_umi_p = [
-                                int(x) for x in pd.to_numeric(
-                                    data3['duplicate_count'])
-                            ]
-                    if len(l_p) > 1:
-                        highest_umi_l = max(l_umi_p)
-                        highest_umi_l_idx = [
-                            i for i, j in enumerate(l_umi_p)
-                            if j == highest_umi_l
-                        ]
-                        keep_index_l = highest_umi_l_idx[0]
-                        keep_lc_contig = l_p[keep_index_l]
-                        umi_test = [
-                            highest_umi_l / x < umi_foldchange_cutoff
-                            for x in l_umi_p[:keep_index_l] +
-                            l_umi_p[keep_index_l:]
-                        ]
-                        sum_umi = sum(l_umi_p)
-                        if len(highest_umi_l_idx) > 1:
-                            self.l_doublet.append(cell)
-                        if sum_umi < 4:
-                            self.l_doublet.append(cell)
-                        if any(umi_test):
-                            self.l_doublet.append(cell)
-                        if len(highest_umi_l_idx) == 1:
-                            other_umi_idx_l = [
-                                i for i, j in enumerate(l_umi_p)
-                                if j != highest_umi_l
-                            ]
-                            umi_test_l = [
-                                highest_umi_l / x >= umi_foldchange_cutoff
-                                for x in l_umi_p[:keep_index_l] +
-                                l_umi_p[keep_index_l:]
-                            ]
-                            umi_test_dict_l = dict(
-                                zip(other_umi_idx_l, umi_test_l))
-                            for otherindex in umi_test_dict_l:
-                                if umi_test_dict_l[otherindex]:
-                                    if keep_highest_umi:
-                                        self.drop_contig.append(
-                                            l_p[otherindex])
-                                        # refresh
-                            data3 = pd.DataFrame([data3.loc[keep_lc_contig]])
-                            l_p = list(data3['sequence_id'])
-            if len(self.Cell[cell]['VJ']['NP']) > 0:
-                data4 = pd.DataFrame([
-                    x for x in self.Cell[cell]['VJ']['NP']
-                    if isinstance(x, dict)
-                ],
-                    index=[
-                    x['sequence_id']
-                    for x in self.Cell[cell]['VJ']['NP']
-                    if isinstance(x, dict)
-                ])
-                l_np = list(data4['sequence_id'])
-                l_umi_np = [
-                    int(x) for x in pd.to_numeric(data4['duplicate_count'])
-                ]
-                if len(l_np) > 1:
-                    highest_umi_l = max(l_umi_np)
-                    highest_umi_l_idx = [
-                        i for i, j in enumerate(l_umi_np) if j == highest_umi_l
-                    ]
-                    keep_index_l = highest_umi_l_idx[0]
-                    keep_lc_contig = l_np[keep_index_l]
-                    other_umi_idx_l = [
-                        i for i, j in enumerate(l_umi_np) if j != highest_umi_l
-                    ]
-                    umi_test_l = [
-                        highest_umi_l / x >= umi_foldchange_cutoff
-                        for x in l_umi_np[:keep_index_l] +
-                        l_umi_np[keep_index_l:]
-                    ]
-                    if len(highest_umi_l_idx) == 1:
-                        umi_test_dict_l = dict(zip(other_umi_idx_l,
-                                                   umi_test_l))
-                        for otherindex in umi_test_dict_l:
-                            if umi_test_dict_l[otherindex]:
-                                if keep_highest_umi:
-                                    self.drop_contig.append(l_np[otherindex])
-                        data4 = pd.DataFrame([data4.loc[keep_lc_contig]])
-                        l_np = list(data4['sequence_id'])
-
-            if 'h_p' not in locals():
-                h_p = []
-            if 'l_p' not in locals():
-                l_p = []
-            if 'h_np' not in locals():
-                h_np = []
-            if 'l_np' not in locals():
-                l_np = []
-
-            # marking doublets defined by VJ chains
-            if (len(h_p) == 1) & (len(l_p) > 1):
-                self.l_doublet.append(cell)
-
-            # marking poor bcr quality, defined as those with only VJ chains, those
-            # that were have conflicting assignment of locus and V(D)J v-, d-, j- and c- calls,
-            # and also those that are missing j calls (to catch non-productive).
-            if len(h_p) < 1:
-                if filter_poorqualitycontig:
-                    self.poor_qual.append(cell)
-                self.drop_contig.append(l_p)
-            if len(h_p) == 1:
-                v = v_dict[h_p[0]]
-                j = j_dict[h_p[0]]
-                d = d_dict[h_p[0]]
-                c = c_dict[h_p[0]]
-                if present(v):
-                    if not re.search('IGH|TR[BD]|TRAV.*/DV', v):
-                        if filter_poorqualitycontig:
-                            self.poor_qual.append(cell)
-                        self.drop_contig.append(l_p)
-                        self.drop_contig.append(h_p)
-                if present(d):
-                    if not re.search('IGH|TR[BD]', d):
-                        if filter_poorqualitycontig:
-                            self.poor_qual.append(cell)
-                        self.drop_contig.append(l_p)
-                        self.drop_contig.append(h_p)
-                if present(j):
-                    if not re.search('IGH|TR[BD]', j):
-                        if filter_poorqualitycontig:
-                            self.poor_qual.append(cell)
-                        self.drop_contig.append(l_p)
-                        self.drop_contig.append(h_p)
-                if present(c):
-                    if not re.search('IGH|TR[BD]', c):
-                        if filter_poorqualitycontig:
-                            self.poor_qual.append(cell)
-                        self.drop_contig.append(l_p)
-                        self.drop_contig.append(h_p)
-
-                if present(j):
-                    if present(v):
-                        if not_same_call(v, j, 'IGH'):
-                            if filter_poorqualitycontig:
-                                self.poor_qual.append(cell)
-                            self.drop_contig.append(l_p)
-                            self.drop_contig.append(h_p)
-                        elif not_same_call(v, j, 'TRB'):
-                            if filter_poorqualitycontig:
-                                self.poor_qual.append(cell)
-                            self.drop_contig.append(l_p)
-                            self.drop_contig.append(h_p)
-                        elif not_same_call(v, j, 'TRD'):
-                            if not re.search('TRAV.*/DV', v):
-                                if filter_poorqualitycontig:
-                                    self.poor_qual.append(cell)
-                                self.drop_contig.append(l_p)
-                                self.drop_contig.append(h_p)
-
-                    if present(d):
-                        if not_same_call(d, j, 'IGH'):
-                            if filter_poorqualitycontig:
-                                self.poor_qual.append(cell)
-                            self.drop_contig.append(l_p)
-                            self.drop_contig.append(h_p)
-                        elif not_same_call(d, j, 'TRB'):
-                            if filter_poorqualitycontig:
-                                self.poor_qual.append(cell)
-                            self.drop_contig.append(l_p)
-                            self.drop_contig.append(h_p)
-                        elif not_same_call(d, j, 'TRD'):
-                            if filter_poorqualitycontig:
-                                self.poor_qual.append(cell)
-                            self.drop_contig.append(l_p)
-                            self.drop_contig.append(h_p)
-                else:
-                    if filter_poorqualitycontig:
-                        self.poor_qual.append(cell)
-                    self.drop_contig.append(l_p)
-                    self.drop_contig.append(h_p)
-
-            if len(h_p) > 1:
-                for hx in h_p:
-                    v = v_dict[hx]
-                    d = d_dict[hx]
-                    j = j_dict[hx]
-                    c = c_dict[hx]
-                    if present(v):
-                        if not re.search('IGH|TR[BD]|TRAV.*/DV', v):
-                            if filter_poorqualitycontig:
-                                self.poor_qual.append(cell)
-                            self.drop_contig.append(hx)
-                    if present(d):
-                        if not re.search('IGH|TR[BD]', d):
-                            if filter_poorqualitycontig:
-                                self.poor_qual.append(cell)
-                            self.drop_contig.append(hx)
-                    if present(j):
-                        if not re.search('IGH|TR[BD]', j):
-                            if filter_poorqualitycontig:
-                                self.poor_qual.append(cell)
-                            self.drop_contig.append(hx)
-                    if present(c):
-                        if not re.search('IGH|TR[BD]', c):
-                            if filter_poorqualitycontig:
-                                self.poor_qual.append(cell)
-                            self.drop_contig.append(hx)
-                    if present(j):
-                        if present(v):
-                            if not_same_call(v, j, 'IGH'):
-                                if filter_poorqualitycontig:
-                                    self.poor_qual.append(cell)
-                                self.drop_contig.append(hx)
-                            elif not_same_call(v, j, 'TRB'):
-                                if filter_poorqualitycontig:
-                                    self.poor_qual.append(cell)
-                                self.drop_contig.append(hx)
-                            elif not_same_call(v, j, 'TRD'):
-                                if not re.search('TRAV.*/DV', v):
-                                    if filter_poorqualitycontig:
-                                        self.poor_qual.append(cell)
-                                    self.drop_contig.append(hx)
-                        if present(d):
-                            if not_same_call(d, j, 'IGH'):
-                                if filter_poorqualitycontig:
-                                    self.poor_qual.append(cell)
-                                self.drop_contig.append(hx)
-                            elif not_same_call(d, j, 'TRB'):
-                                if filter_poorqualitycontig:
-                                    self.poor_qual.append(cell)
-                                self.drop_contig.append(hx)
-                            elif not_same_call(d, j, 'TRD'):
-                                if filter_poorqualitycontig:
-                                    self.poor_qual.append(cell)
-                                self.drop_contig.append(hx)
-                    else:
-                        if filter_poorqualitycontig:
-                            self.poor_qual.append(cell)
-                        self.drop_contig.append(hx)
-
-            if len(h_np) > 0:
-                for hx in h_np:
-                    v = v_dict[hx]
-                    d = d_dict[hx]
-                    j = j_dict[hx]
-                    c = c_dict[hx]
-                    if present(v):
-                        if not re.search('IGH|TR[BD]|TRAV.*/DV', v):
-                            self.drop_contig.append(hx)
-                    if present(d):
-                        if not re.search('IGH|TR[BD]', d):
-                            self.drop_contig.append(hx)
-                    if present(j):
-                        if not re.search('IGH|TR[BD]', j):
-                            self.drop_contig.append(hx)
-                    if present(c):
-                        if not re.search('IGH|TR[BD]', c):
-                            self.drop_contig.append(hx)
-
-                    if present(j):
-                        if present(v):
-                            if not_same_call(v, j, 'IGH'):
-                                self.drop_contig.append(hx)
-                            elif not_same_call(v, j, 'TRB'):
-                                self.drop_contig.append(hx)
-                            elif not_same_call(v, j, 'TRD'):
-                                if not re.search('TRAV.*/DV', v):
-                                    self.drop_contig.append(hx)
-                        if present(d):
-                            if not_same_call(d, j, 'IGH'):
-                                self.drop_contig.append(hx)
-                            elif not_same_call(d, j, 'TRB'):
-                                self.drop_contig.append(hx)
-                            elif not_same_call(d, j, 'TRD'):
-                                self.drop_contig.append(hx)
-                    else:
-                        self.drop_contig.append(hx)
-            if len(l_p) > 0:
-                for lx in l_p:
-                    v = v_dict[lx]
-                    j = j_dict[lx]
-                    c = c_dict[lx]
-                    if present(v):
-                        if re.search('IGH|TR[BD]', v):
-                            if filter_poorqualitycontig:
-                                self.poor_qual.append(cell)
-                            self.drop_contig.append(lx)
-                    if present(j):
-                        if re.search('IGH|TR[BD]', j):
-                            if filter_poorqualitycontig:
-                                self.poor_qual.append(cell)
-                            self.drop_contig.append(lx)
-                    if present(c):
-                        if re.search('IGH|TR[BD]', c):
-                            if filter_poorqualitycontig:
-                                self.poor_qual.append(cell)
-                            self.drop_contig.append(lx)
-
-                    if present(j):
-                        if present(v):
-                            if not_same_call(v, j, 'IGK'):
-                                if filter_poorqualitycontig:
-                                    self.poor_qual.append(cell)
-                                self.drop_contig.append(lx)
-                            elif not_same_call(v, j, 'IGL'):
-                                if filter_poorqualitycontig:
-                                    self.poor_qual.append(cell)
-                                self.drop_contig.append(lx)
-                            elif not_same_call(v, j, 'TRA'):
-                                if filter_poorqualitycontig:
-                                    self.poor_qual.append(cell)
-                                self.drop_contig.append(lx)
-                            elif not_same_call(v, j, 'TRG'):
-                                if filter_poorqualitycontig:
-                                    self.poor_qual.append(cell)
-                                self.drop_contig.append(lx)
-                    else:
-                        if filter_poorqualitycontig:
-                            self.poor_qual.append(cell)
-                        self.drop_contig.append(lx)
-
-            if len(l_np) > 0:
-                for lx in l_np:
-                    v = v_dict[lx]
-                    j = j_dict[lx]
-                    c = c_dict[lx]
-                    if present(v):
-                        if re.search('IGH|TR[BD]', v):
-                            self.drop_contig.append(lx)
-                    if present(j):
-                        if re.search('IGH|TR[BD]', j):
-                            self.drop_contig.append(lx)
-                    if present(c):
-                        if re.search('IGH|TR[BD]', c):
-                            self.drop_contig.append(lx)
-
-                    if present(j):
-                        if present(v):
-                            if not_same_call(v, j, 'IGK'):
-                                self.drop_contig.append(lx)
-                            elif not_same_call(v, j, 'IGL'):
-                                self.drop_contig.append(lx)
-                            elif not_same_call(v, j, 'TRA'):
-                                self.drop_contig.append(lx)
-                            elif not_same_call(v, j, 'TRG'):
-                                self.drop_contig.append(lx)
-                    else:
-                        self.drop_contig.append(lx)
+        groups = _ContigGroups(data, umi_foldchange_cutoff)
+        merged = groups.merge_identical()
+        self.umi_adjustment = groups.umi_adjustment(merged)
+
+        # groups with several contigs are tested on their umi counts, unless IgM and IgD are co-expressed
+        tested = (groups.size > 1) & ~merged & ~(
+            (groups.kind == VDJ_P) & groups.has_ighd)
+        doublet = tested & ((groups.ties > 1) | (groups.sum_umi < 4)
+                            | groups.below_cutoff)
+        single_max = tested & (groups.ties == 1)
+        dropped = groups.low_umi(
+            single_max & ((groups.kind == VDJ_NP) | keep_highest_umi),
+            umi_foldchange_cutoff)
+        # contigs left in each group
+        reduced = merged | single_max
+        left = ~reduced[groups.index] | (groups.pos
+                                         == groups.keep[groups.index])
+        vdj = left & (groups.group == VDJ_P)
+        vj = left & (groups.group == VJ_P)
+        n_vdj = np.bincount(groups.cell[vdj], minlength=len(groups.cells))
+        n_vj = np.bincount(groups.cell[vj], minlength=len(groups.cells))
+
+        bad_vdj = left & np.isin(groups.group, [VDJ_P, VDJ_NP
+                                                ]) & groups.bad_vdj()
+        bad_vj = left & np.isin(groups.group, [VJ_P, VJ_NP]) & groups.bad_vj()
+        poor = (n_vdj == 0) | groups.cells_with(
+            bad_vdj & (groups.group == VDJ_P)) | groups.cells_with(
+                bad_vj & (groups.group == VJ_P))
+        # cells without a usable VDJ chain lose their productive VJ chains
+        unpaired = (n_vdj == 0) | ((n_vdj == 1) & groups.cells_with(
+            bad_vdj & (groups.group == VDJ_P)))
+        drop = merged[groups.index] | bad_vdj | bad_vj | (
+            vj & unpaired[groups.cell])
+        drop[dropped] = True
+
+        h_doublet = groups.cells_of(doublet & (groups.kind == VDJ_P))
+        l_doublet = groups.cells_of(doublet & (groups.kind == VJ_P)) | (
+            (n_vdj == 1) & (n_vj > 1))
+        self.h_doublet = list(groups.cells[h_doublet])
+        self.l_doublet = list(groups.cells[l_doublet])
+        self.poor_qual = list(
+            groups.cells[poor]) if filter_poorqualitycontig else []
+        self.drop_contig = list(groups.sequence_id[drop])
 
 
 class FilterContigsLite:
@@ -3226,289 +2898,18 @@ class FilterContigsLite:
     """
 
     def __init__(self, data):
-        self.Cell = Tree()
+        groups = _ContigGroups(data, 1)
+        merged = groups.merge_identical()
+        self.umi_adjustment = groups.umi_adjustment(merged)
+        left = ~merged[groups.index] | (groups.pos
+                                        == groups.keep[groups.index])
+        bad = np.where(np.isin(groups.group, [VDJ_P, VDJ_NP]),
+                       groups.bad_vdj(), groups.bad_vj())
         self.poor_qual = []
         self.h_doublet = []
         self.l_doublet = []
-        self.drop_contig = []
-        self.umi_adjustment = {}
-        if 'v_call_genotyped' in data.columns:
-            v_dict = dict(zip(data['sequence_id'], data['v_call_genotyped']))
-        else:
-            v_dict = dict(zip(data['sequence_id'], data['v_call']))
-        d_dict = dict(zip(data['sequence_id'], data['d_call']))
-        j_dict = dict(zip(data['sequence_id'], data['j_call']))
-        c_dict = dict(zip(data['sequence_id'], data['c_call']))
-        for contig, row in tqdm(data.iterrows(), desc="Preparing data"):
-            cell = Contig(row).contig['cell_id']
-            if Contig(row).contig['locus'] in HEAVYLONG:
-                if Contig(row).contig['productive'] in TRUES:
-                    self.Cell[cell]['VDJ']['P'][Contig(row).contig].value = 1
-                elif Contig(row).contig['productive'] in FALSES:
-                    self.Cell[cell]['VDJ']['NP'][Contig(row).contig].value = 1
-            elif Contig(row).contig['locus'] in LIGHTSHORT:
-                if Contig(row).contig['productive'] in TRUES:
-                    self.Cell[cell]['VJ']['P'][Contig(row).contig].value = 1
-                elif Contig(row).contig['productive'] in FALSES:
-                    self.Cell[cell]['VJ']['NP'][Contig(row).contig].value = 1
-        for cell in tqdm(self.Cell,
-                         desc='Scanning for poor quality/ambiguous contigs'):
-            if len(self.Cell[cell]['VDJ']['P']) > 0:
-                data1 = pd.DataFrame([
-                    x for x in self.Cell[cell]['VDJ']['P']
-                    if isinstance(x, dict)
-                ],
-                    index=[
-                    x['sequence_id']
-                    for x in self.Cell[cell]['VDJ']['P']
-                    if isinstance(x, dict)
-                ])
-                h_p = list(data1['sequence_id'])
-                h_umi_p = [
-                    int(x) for x in pd.to_numeric(data1['duplicate_count'])
-                ]
-                h_ccall_p = list(data1['c_call'])
-                if len(h_p) > 1:
-                    if 'sequence_alignment' in data1:
-                        h_seq_p = list(data1['sequence_alignment'])
-                        if len(set(h_seq_p)) == 1:
-                            if len(set(h_ccall_p)) == 1:
-                                highest_umi_h = max(h_umi_p)
-                                highest_umi_h_idx = [
-                                    i for i, j in enumerate(h_umi_p)
-                                    if j == highest_umi_h
-                                ]
-                                keep_index_h = highest_umi_h_idx[0]
-                                self.drop_contig.append(h_p[:keep_index_h] +
-                                                        h_p[keep_index_h:])
-                                keep_hc_contig = h_p[keep_index_h]
-                                data1[keep_hc_contig, 'duplicate_count'] = int(
-                                    np.sum(h_umi_p[:keep_index_h] +
-                                           h_umi_p[keep_index_h:]))
-                                self.umi_adjustment.update({
-                                    keep_hc_contig:
-                                    int(
-                                        np.sum(h_umi_p[:keep_index_h] +
-                                               h_umi_p[keep_index_h:]))
-                                })
-                                # refresh
-                                data1 = pd.DataFrame(
-                                    [data1.loc[keep_hc_contig]])
-                                h_p = list(data1['sequence_id'])
-                                h_umi_p = [
-                                    int(x) for x in pd.to_numeric(
-                                        data1['duplicate_count'])
-                                ]
-            if len(self.Cell[cell]['VDJ']['NP']) > 0:
-                data2 = pd.DataFrame([
-                    x for x in self.Cell[cell]['VDJ']['NP']
-                    if isinstance(x, dict)
-                ],
-                    index=[
-                    x['sequence_id']
-                    for x in self.Cell[cell]['VDJ']['NP']
-                    if isinstance(x, dict)
-                ])
-                h_np = list(data2['sequence_id'])
-                h_umi_np = [
-                    int(x) for x in pd.to_numeric(data2['duplicate_count'])
-                ]
-            if len(self.Cell[cell]['VJ']['P']) > 0:
-                data3 = pd.DataFrame([
-                    x
-                    for x in self.Cell[cell]['VJ']['P'] if isinstance(x, dict)
-                ],
-                    index=[
-                    x['sequence_id']
-                    for x in self.Cell[cell]['VJ']['P']
-                    if isinstance(x, dict)
-                ])
-                l_p = list(data3['sequence_id'])
-                l_umi_p = [
-                    int(x) for x in pd.to_numeric(data3['duplicate_count'])
-                ]
-                if len(l_p) > 1:
-                    if 'sequence_alignment' in data3:
-                        l_seq_p = list(data3['sequence_alignment'])
-                        if len(list(set(l_seq_p))) == 1:
-                            highest_umi_l = max(l_umi_p)
-                            highest_umi_l_idx = [
-                                i for i, j in enumerate(l_umi_p)
-                                if j == highest_umi_l
-                            ]
-                            keep_index_l = highest_umi_l_idx[0]
-                            self.drop_contig.append(l_p[:keep_index_l] +
-                                                    l_p[keep_index_l:])
-                            keep_lc_contig = l_p[keep_index_l]
-                            data3.at[keep_lc_contig, 'duplicate_count'] = int(
-                                np.sum(l_umi_p[:keep_index_l] +
-                                       l_umi_p[keep_index_l:]))
-                            self.umi_adjustment.update({
-                                keep_lc_contig:
-                                int(
-                                    np.sum(l_umi_p[:keep_index_l] +
-                                           l_umi_p[keep_index_l:]))
-                            })
-                            # refresh
-                            data3 = pd.DataFrame([data3.loc[keep_lc_contig]])
-                            l_p = list(data3['sequence_id'])
-                            l_umi_p = [
-                                int(x) for x in pd.to_numeric(
-                                    data3['duplicate_count'])
-                            ]
-            if len(self.Cell[cell]['VJ']['NP']) > 0:
-                data4 = pd.DataFrame([
-                    x for x in self.Cell[cell]['VJ']['NP']
-                    if isinstance(x, dict)
-                ],
-                    index=[
-                    x['sequence_id']
-                    for x in self.Cell[cell]['VJ']['NP']
-                    if isinstance(x, dict)
-                ])
-                l_np = list(data4['sequence_id'])
-                l_umi_np = [
-                    int(x) for x in pd.to_numeric(data4['duplicate_count'])
-                ]
-
-            if 'h_p' not in locals():
-                h_p = []
-            if 'l_p' not in locals():
-                l_p = []
-            if 'h_np' not in locals():
-                h_np = []
-            if 'l_np' not in locals():
-                l_np = []
-
-            if len(h_p) > 0:
-                for hx in h_p:
-                    v = v_dict[hx]
-                    d = d_dict[hx]
-                    j = j_dict[hx]
-                    c = c_dict[hx]
-                    if present(v):
-                        if not re.search('IGH|TR[BD]|TRAV.*/DV', v):
-                            self.drop_contig.append(hx)
-                    if present(d):
-                        if not re.search('IGH|TR[BD]', d):
-                            self.drop_contig.append(hx)
-                    if present(j):
-                        if not re.search('IGH|TR[BD]', j):
-                            self.drop_contig.append(hx)
-                    if present(c):
-                        if not re.search('IGH|TR[BD]', c):
-                            self.drop_contig.append(hx)
-                    if present(j):
-                        if present(v):
-                            if not_same_call(v, j, 'IGH'):
-                                self.drop_contig.append(hx)
-                            elif not_same_call(v, j, 'TRB'):
-                                self.drop_contig.append(hx)
-                            elif not_same_call(v, j, 'TRD'):
-                                if not re.search('TRAV.*/DV', v):
-                                    self.drop_contig.append(hx)
-                        if present(d):
-                            if not_same_call(d, j, 'IGH'):
-                                self.drop_contig.append(hx)
-                            elif not_same_call(d, j, 'TRB'):
-                                self.drop_contig.append(hx)
-                            elif not_same_call(d, j, 'TRD'):
-                                self.drop_contig.append(hx)
-                    else:
-                        self.drop_contig.append(hx)
-
-            if len(h_np) > 0:
-                for hx in h_np:
-                    v = v_dict[hx]
-                    d = d_dict[hx]
-                    j = j_dict[hx]
-                    c = c_dict[hx]
-                    if present(v):
-                        if not re.search('IGH|TR[BD]|TRAV.*/DV', v):
-                            self.drop_contig.append(hx)
-                    if present(d):
-                        if not re.search('IGH|TR[BD]', d):
-                            self.drop_contig.append(hx)
-                    if present(j):
-                        if not re.search('IGH|TR[BD]', j):
-                            self.drop_contig.append(hx)
-                    if present(c):
-                        if not re.search('IGH|TR[BD]', c):
-                            self.drop_contig.append(hx)
-
-                    if present(j):
-                        if present(v):
-                            if not_same_call(v, j, 'IGH'):
-                                self.drop_contig.append(hx)
-                            elif not_same_call(v, j, 'TRB'):
-                                self.drop_contig.append(hx)
-                            elif not_same_call(v, j, 'TRD'):
-                                if not re.search('TRAV.*/DV', v):
-                                    self.drop_contig.append(hx)
-                        if present(d):
-                            if not_same_call(d, j, 'IGH'):
-                                self.drop_contig.append(hx)
-                            elif not_same_call(d, j, 'TRB'):
-                                self.drop_contig.append(hx)
-                            elif not_same_call(d, j, 'TRD'):
-                                self.drop_contig.append(hx)
-                    else:
-                        self.drop_contig.append(hx)
-            if len(l_p) > 0:
-                for lx in l_p:
-                    v = v_dict[lx]
-                    j = j_dict[lx]
-                    c = c_dict[lx]
-                    if present(v):
-                        if re.search('IGH|TR[BD]', v):
-                            self.drop_contig.append(lx)
-                    if present(j):
-                        if re.search('IGH|TR[BD]', j):
-                            self.drop_contig.append(lx)
-                    if present(c):
-                        if re.search('IGH|TR[BD]', c):
-                            self.drop_contig.append(lx)
-
-                    if present(j):
-                        if present(v):
-                            if not_same_call(v, j, 'IGK'):
-                                self.drop_contig.append(lx)
-                            elif not_same_call(v, j, 'IGL'):
-                                self.drop_contig.append(lx)
-                            elif not_same_call(v, j, 'TRA'):
-                                self.drop_contig.append(lx)
-                            elif not_same_call(v, j, 'TRG'):
-                                self.drop_contig.append(lx)
-                    else:
-                        self.drop_contig.append(lx)
-
-            if len(l_np) > 0:
-                for lx in l_np:
-                    v = v_dict[lx]
-                    j = j_dict[lx]
-                    c = c_dict[lx]
-                    if present(v):
-                        if re.search('IGH|TR[BD]', v):
-                            self.drop_contig.append(lx)
-                    if present(j):
-                        if re.search('IGH|TR[BD]', j):
-                            self.drop_contig.append(lx)
-                    if present(c):
-                        if re.search('IGH|TR[BD]', c):
-                            self.drop_contig.append(lx)
-
-                    if present(j):
-                        if present(v):
-                            if not_same_call(v, j, 'IGK'):
-                                self.drop_contig.append(lx)
-                            elif not_same_call(v, j, 'IGL'):
-                                self.drop_contig.append(lx)
-                            elif not_same_call(v, j, 'TRA'):
-                                self.drop_contig.append(lx)
-                            elif not_same_call(v, j, 'TRG'):
-                                self.drop_contig.append(lx)
-                    else:
-                        self.drop_contig.append(lx)
+        self.drop_contig = list(
+            groups.sequence_id[merged[groups.index] | (left & bad)])
 
 
 def run_igblastn(fasta: Union[str, PathLike],
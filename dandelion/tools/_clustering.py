@@ -0,0 +1,565 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+from numba import njit
+
+from typing import Sequence, Tuple, List, Iterator, Optional
+try:
+    from typing import Literal
+except ImportError:
+    from typing_extensions import Literal
+
+# maximum number of elements held by a single block of the distance matrix.
+MAX_BLOCK_ELEMENTS = 2**24
+# groups sharing a segment that are larger than this are compared block-wise rather than pair by pair.
+MAX_INDEX_GROUP = 64
+# minimum number of sequences before method='auto' switches to the segment index.
+INDEX_MIN_SIZE = 2000
+# minimum segment width before method='auto' switches to the segment index.
+INDEX_MIN_SEGMENT = 3
+
+
+def encode_sequences(seqs: Sequence[str],
+                     width: Optional[int] = None) -> np.ndarray:
+    """
+    Encode sequences as a fixed-width uint8 array.
+
+    Parameters
+    ----------
+    seqs : Sequence[str]
+        sequences to encode.
+    width : int, Optional
+        width of the encoded array. None defaults to the length of the longest sequence.
+        Shorter sequences are padded with zeroes and longer sequences are truncated.
+
+    Returns
+    -------
+    `numpy.ndarray` of shape (len(seqs), width) and dtype uint8.
+    """
+    seqs_ = [str(s).encode('ascii', 'replace') for s in seqs]
+    if width is None:
+        width = max([len(s) for s in seqs_]) if len(seqs_) > 0 else 0
+    if width == 0:
+        return (np.zeros((len(seqs_), 0), dtype=np.uint8))
+    encoded = np.array(seqs_, dtype='S' + str(width))
+    return (encoded.view(np.uint8).reshape(len(seqs_), width))
+
+
+def hamming_neighbours(
+        encoded: np.ndarray,
+        threshold: int,
+        block_size: Optional[int] = None
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Find all pairs of encoded sequences within a hamming distance threshold.
+
+    The upper triangle of the distance matrix is computed in row blocks so that memory stays bounded.
+
+    Parameters
+    ----------
+    encoded : np.ndarray
+        encoded sequences from `encode_sequences`.
+    threshold : int
+        maximum hamming distance for a pair to be returned.
+    block_size : int, Optional
+        number of rows per block. None defaults to a block size that keeps each block below
+        `MAX_BLOCK_ELEMENTS` elements.
+
+    Yields
+    ------
+    tuple of `numpy.ndarray` with row indices (i, j) where i < j.
+    """
+    n, width = encoded.shape
+    if block_size is None:
+        block_size = max(1, MAX_BLOCK_ELEMENTS // max(n, 1))
+    dtype = np.uint8 if width < 255 else np.uint16
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        query = encoded[start:end]
+        target = encoded[start:]
+        dist = np.zeros((end - start, n - start), dtype=dtype)
+        for pos in range(width):
+            dist += query[:, pos, None] != target[None, :, pos]
+        i, j = np.nonzero(dist <= threshold)
+        keep = j > i
+        yield (i[keep] + start, j[keep] + start)
+
+
+def query_neighbours(
+        query: np.ndarray,
+        target: np.ndarray,
+        threshold: int,
+        block_size: Optional[int] = None
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Find all pairs of query and target sequences within a hamming distance threshold.
+
+    Parameters
+    ----------
+    query : np.ndarray
+        encoded query sequences from `encode_sequences`.
+    target : np.ndarray
+        encoded target sequences of the same width.
+    threshold : int
+        maximum hamming distance for a pair to be returned.
+    block_size : int, Optional
+        number of query rows per block. None defaults to a block size that keeps each block below
+        `MAX_BLOCK_ELEMENTS` elements.
+
+    Yields
+    ------
+    tuple of `numpy.ndarray` with query and target row indices (i, j).
+    """
+    n, width = query.shape
+    if block_size is None:
+        block_size = max(1, MAX_BLOCK_ELEMENTS // max(target.shape[0], 1))
+    dtype = np.uint8 if width < 255 else np.uint16
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        dist = np.zeros((end - start, target.shape[0]), dtype=dtype)
+        for pos in range(width):
+            dist += query[start:end, pos, None] != target[None, :, pos]
+        i, j = np.nonzero(dist <= threshold)
+        yield (i + start, j)
+
+
+def index_neighbours(
+        encoded: np.ndarray,
+        threshold: int,
+        block_size: Optional[int] = None
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Find all pairs of encoded sequences within a hamming distance threshold using a segment index.
+
+    Each sequence is cut into `threshold + 1` segments. By the pigeonhole principle, two equal length
+    sequences within the threshold share at least one segment exactly, so only pairs sharing a segment are
+    compared. A pair is only checked at the first segment it shares. Groups sharing a segment that are larger
+    than `MAX_INDEX_GROUP` are compared block-wise with `hamming_neighbours`. Sequences shorter than
+    `threshold + 1` can't be cut into non-empty segments and are compared with `hamming_neighbours`.
+
+    Parameters
+    ----------
+    encoded : np.ndarray
+        encoded sequences of equal length from `encode_sequences`.
+    threshold : int
+        maximum hamming distance for a pair to be returned.
+    block_size : int, Optional
+        number of rows per block when comparing large groups. See `hamming_neighbours`.
+
+    Yields
+    ------
+    tuple of `numpy.ndarray` with row indices (i, j) where i < j.
+    """
+    n, width = encoded.shape
+    if width < threshold + 1:
+        yield from hamming_neighbours(encoded, threshold, block_size)
+        return
+    bounds = np.linspace(0, width, threshold + 2).astype(int)
+    for k in range(threshold + 1):
+        segment = np.ascontiguousarray(encoded[:, bounds[k]:bounds[k + 1]])
+        segment = segment.view(np.dtype(
+            (np.void, segment.shape[1]))).ravel()
+        _, inverse, counts = np.unique(segment,
+                                       return_inverse=True,
+                                       return_counts=True)
+        order = np.argsort(inverse, kind='stable')
+        grp = inverse[order]
+        small = counts[grp] <= MAX_INDEX_GROUP
+        # pairs within small groups, walking the sorted order one offset at a time.
+        for d in range(1, MAX_INDEX_GROUP):
+            same = (grp[:-d] == grp[d:]) & small[d:]
+            if not same.any():
+                break
+            yield from _verify_pairs(encoded, order[:-d][same],
+                                     order[d:][same], threshold, bounds[:k + 1])
+        # large groups, compared block-wise.
+        for g in np.nonzero(counts > MAX_INDEX_GROUP)[0]:
+            members = np.sort(order[grp == g])
+            for i, j in hamming_neighbours(encoded[members], threshold,
+                                           block_size):
+                i, j = members[i], members[j]
+                first = ~_share_segment(encoded, i, j, bounds[:k + 1])
+                yield (i[first], j[first])
+
+
+def _share_segment(encoded: np.ndarray, i: np.ndarray, j: np.ndarray,
+                   bounds: np.ndarray) -> np.ndarray:
+    """Whether each pair (i[k], j[k]) shares any of the segments delimited by `bounds`."""
+    shared = np.zeros(len(i), dtype=bool)
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        shared |= (encoded[i, a:b] == encoded[j, a:b]).all(axis=1)
+    return (shared)
+
+
+def _verify_pairs(encoded: np.ndarray,
+                  i: np.ndarray,
+                  j: np.ndarray,
+                  threshold: int,
+                  bounds: np.ndarray,
+                  chunk_size: int = 2**20
+                  ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Yield the candidate pairs within the threshold that do not share an earlier segment."""
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    for start in range(0, len(i), chunk_size):
+        i_, j_ = i[start:start + chunk_size], j[start:start + chunk_size]
+        keep = ~_share_segment(encoded, i_, j_, bounds)
+        i_, j_ = i_[keep], j_[keep]
+        dist = (encoded[i_] != encoded[j_]).sum(axis=1)
+        keep = dist <= threshold
+        yield (i_[keep], j_[keep])
+
+
+def pattern_masks(encoded: np.ndarray,
+                  lengths: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pre-compute the match bit-vectors of each encoded sequence for `edit_distances`.
+
+    Parameters
+    ----------
+    encoded : np.ndarray
+        encoded sequences from `encode_sequences`.
+    lengths : Sequence[int]
+        length of each sequence.
+
+    Returns
+    -------
+    tuple of `numpy.ndarray` holding the match bit-vectors of shape (n, alphabet, words) and the
+    sequences recoded to the alphabet of shape (n, width).
+    """
+    n, width = encoded.shape
+    lengths = np.asarray(lengths, dtype=np.int64)
+    alphabet, codes = np.unique(encoded, return_inverse=True)
+    codes = codes.reshape(n, width)
+    words = max(1, -(-width // 64))
+    masks = np.zeros((n, len(alphabet), words), dtype=np.uint64)
+    seq, position = np.nonzero(np.arange(width)[None, :] < lengths[:, None])
+    # every (sequence, character, word) gets a distinct set of bits so a plain add is an or.
+    np.add.at(masks, (seq, codes[seq, position], position // 64),
+              np.left_shift(np.uint64(1), (position % 64).astype(np.uint64)))
+    return (masks, codes)
+
+
+def edit_distances(encoded: np.ndarray,
+                   lengths: Sequence[int],
+                   rows: np.ndarray,
+                   cols: np.ndarray,
+                   max_distance: Optional[int] = None,
+                   masks: Optional[Tuple[np.ndarray, np.ndarray]] = None
+                   ) -> np.ndarray:
+    """
+    Levenshtein distances between pairs of encoded sequences.
+
+    Uses Myers' bit-parallel algorithm in its block-based form, compiled with numba, so each
+    column of the dynamic programming matrix is computed 64 rows at a time. With `max_distance`,
+    a pair stops as soon as it can no longer end up within the cutoff.
+
+    Parameters
+    ----------
+    encoded : np.ndarray
+        encoded sequences from `encode_sequences`.
+    lengths : Sequence[int]
+        length of each sequence.
+    rows : np.ndarray
+        indices of the first sequence of each pair.
+    cols : np.ndarray
+        indices of the second sequence of each pair.
+    max_distance : int, Optional
+        if provided, distances above this are returned as `max_distance + 1`.
+    masks : Tuple[np.ndarray, np.ndarray], Optional
+        pre-computed output of `pattern_masks`.
+
+    Returns
+    -------
+    `numpy.ndarray` of distances, one per pair.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    rows = np.asarray(rows, dtype=np.intp)
+    cols = np.asarray(cols, dtype=np.intp)
+    if masks is None:
+        masks = pattern_masks(encoded, lengths)
+    return (_myers(masks[0], masks[1], lengths, rows, cols,
+                   -1 if max_distance is None else max_distance))
+
+
+def levenshtein_distances(query: str,
+                          targets: Sequence[str],
+                          max_distance: Optional[int] = None) -> np.ndarray:
+    """
+    Levenshtein distances between one query and many target sequences.
+
+    Parameters
+    ----------
+    query : str
+        query sequence.
+    targets : Sequence[str]
+        target sequences.
+    max_distance : int, Optional
+        if provided, distances above this are returned as `max_distance + 1`.
+
+    Returns
+    -------
+    `numpy.ndarray` of distances, one per target.
+    """
+    seqs = [query] + list(targets)
+    encoded = encode_sequences(seqs)
+    lengths = [len(s) for s in seqs]
+    return (edit_distances(encoded,
+                           lengths,
+                           np.zeros(len(seqs) - 1, dtype=np.intp),
+                           np.arange(1, len(seqs)),
+                           max_distance=max_distance))
+
+
+@njit(cache=True)
+def _myers(masks: np.ndarray, codes: np.ndarray, lengths: np.ndarray,
+           rows: np.ndarray, cols: np.ndarray, max_distance: int) -> np.ndarray:
+    """Bit-parallel edit distance of each pair, with the sequences in `rows` as the patterns."""
+    one, top, ones = np.uint64(1), np.uint64(63), ~np.uint64(0)
+    words = masks.shape[2]
+    pv = np.empty(words, dtype=np.uint64)
+    mv = np.empty(words, dtype=np.uint64)
+    out = np.empty(len(rows), dtype=np.int64)
+    for k in range(len(rows)):
+        r, c = rows[k], cols[k]
+        m, n = lengths[r], lengths[c]
+        if max_distance >= 0 and abs(m - n) > max_distance:
+            out[k] = max_distance + 1
+            continue
+        if m == 0:
+            out[k] = n
+            continue
+        # only the words covering the pattern are needed, and the score is tracked at its last row
+        last_word = (m - 1) // 64
+        last_bit = np.uint64((m - 1) % 64)
+        for w in range(last_word + 1):
+            pv[w] = ones
+            mv[w] = np.uint64(0)
+        dist = m
+        for j in range(n):
+            # the first row of the matrix increases by one with every column
+            hin_pos, hin_neg = one, np.uint64(0)
+            for w in range(last_word + 1):
+                eq = masks[r, codes[c, j], w]
+                p, q = pv[w], mv[w]
+                xv = eq | q
+                eq = eq | hin_neg
+                xh = (((eq & p) + p) ^ p) | eq
+                ph = q | ~(xh | p)
+                mh = p & xh
+                if w == last_word:
+                    dist += np.int64((ph >> last_bit) & one) - np.int64(
+                        (mh >> last_bit) & one)
+                hout_pos, hout_neg = (ph >> top) & one, (mh >> top) & one
+                ph = (ph << one) | hin_pos
+                mh = (mh << one) | hin_neg
+                pv[w] = mh | ~(xv | ph)
+                mv[w] = ph & xv
+                hin_pos, hin_neg = hout_pos, hout_neg
+            # each remaining column can lower the distance by at most one
+            if max_distance >= 0 and dist - (n - j - 1) > max_distance:
+                dist = max_distance + 1
+                break
+        if max_distance >= 0 and dist > max_distance:
+            dist = max_distance + 1
+        out[k] = dist
+    return (out)
+
+
+class UnionFind:
+    """Array based union-find (disjoint set) with vectorised unions."""
+    def __init__(self, n: int):
+        """Initialise with `n` singleton sets."""
+        self.parent = np.arange(n, dtype=np.intp)
+
+    def _compress(self):
+        """Point every element directly at its root."""
+        while True:
+            grandparent = self.parent[self.parent]
+            if np.array_equal(grandparent, self.parent):
+                break
+            self.parent = grandparent
+
+    def find(self) -> np.ndarray:
+        """Return the root of every element."""
+        self._compress()
+        return (self.parent)
+
+    def union(self, i: np.ndarray, j: np.ndarray):
+        """Merge the sets containing each pair of elements (i[k], j[k])."""
+        i = np.asarray(i, dtype=np.intp)
+        j = np.asarray(j, dtype=np.intp)
+        while len(i) > 0:
+            self._compress()
+            ri, rj = self.parent[i], self.parent[j]
+            keep = ri != rj
+            if not keep.any():
+                break
+            i, j, ri, rj = i[keep], j[keep], ri[keep], rj[keep]
+            # always hook the larger root onto the smaller one so no cycles are formed.
+            np.minimum.at(self.parent, np.maximum(ri, rj), np.minimum(ri, rj))
+        self._compress()
+
+
+def group_labels(seqs: Sequence[str],
+                 labels: np.ndarray) -> List[Tuple[str, ...]]:
+    """
+    Collect sequences sharing a label into clones, ordered from largest to smallest.
+
+    Parameters
+    ----------
+    seqs : Sequence[str]
+        sequences.
+    labels : np.ndarray
+        cluster label for each sequence.
+
+    Returns
+    -------
+    list of tuples, each holding the sorted sequences of one clone.
+    """
+    groups = {}
+    for s, lab in zip(seqs, labels.tolist()):
+        groups.setdefault(lab, []).append(s)
+    clones = [tuple(sorted(grp, key=str)) for grp in groups.values()]
+    return (sorted(clones, key=lambda x: (-len(x), [str(y) for y in x])))
+
+
+def cluster_sequences(
+        seqs: Sequence[str],
+        threshold: int,
+        block_size: Optional[int] = None,
+        method: Literal['auto', 'dense', 'index'] = 'auto'
+) -> List[Tuple[str, ...]]:
+    """
+    Cluster equal length sequences by single linkage on hamming distance.
+
+    Parameters
+    ----------
+    seqs : Sequence[str]
+        unique sequences of the same length.
+    threshold : int
+        maximum hamming distance for two sequences to be linked.
+    block_size : int, Optional
+        number of rows per block of the distance matrix. See `hamming_neighbours`.
+    method : str
+        'dense' compares all pairs block-wise with `hamming_neighbours`. 'index' only compares pairs that
+        share a segment, with `index_neighbours`, and never allocates the n x n matrix. 'auto' (default)
+        uses 'index' for groups of at least `INDEX_MIN_SIZE` sequences whose segments are at least
+        `INDEX_MIN_SEGMENT` characters wide, and 'dense' otherwise.
+
+    Returns
+    -------
+    list of tuples, each holding the sorted sequences of one clone, ordered from largest to smallest.
+    """
+    seqs = list(seqs)
+    if len(seqs) < 2:
+        return ([tuple(seqs)] if len(seqs) > 0 else [])
+    encoded = encode_sequences(seqs)
+    if method == 'auto':
+        if (len(seqs) >= INDEX_MIN_SIZE) and (encoded.shape[1] //
+                                              (threshold + 1) >=
+                                              INDEX_MIN_SEGMENT):
+            method = 'index'
+        else:
+            method = 'dense'
+    if method == 'dense':
+        neighbours = hamming_neighbours(encoded, threshold, block_size)
+    elif method == 'index':
+        neighbours = index_neighbours(encoded, threshold, block_size)
+    else:
+        raise ValueError(
+            "method must be one of 'auto', 'dense' or 'index', not {}.".format(
+                method))
+    uf = UnionFind(len(seqs))
+    for i, j in neighbours:
+        uf.union(i, j)
+    return (group_labels(seqs, uf.find()))
+
+
+def assign_sequences(ref_seqs: Sequence[str],
+                     ref_clones: Sequence[int],
+                     new_seqs: Sequence[str],
+                     threshold: int,
+                     block_size: Optional[int] = None) -> List[int]:
+    """
+    Assign new sequences to existing clones, or to new clones, without reclustering the existing ones.
+
+    A new sequence joins the existing clone it is linked to, either directly or through other new sequences.
+    If it links to several existing clones, it joins the one with the smallest number, and the existing clones
+    are left as they are. New sequences that link to no existing clone are clustered among themselves and
+    numbered after the largest existing clone, from largest to smallest.
+
+    Parameters
+    ----------
+    ref_seqs : Sequence[str]
+        sequences already assigned to clones.
+    ref_clones : Sequence[int]
+        clone number of each sequence in `ref_seqs`.
+    new_seqs : Sequence[str]
+        unique sequences to assign, of the same length as `ref_seqs`.
+    threshold : int
+        maximum hamming distance for two sequences to be linked.
+    block_size : int, Optional
+        number of rows per block of the distance matrix. See `hamming_neighbours`.
+
+    Returns
+    -------
+    list of clone numbers, one for each sequence in `new_seqs`.
+    """
+    ref_clones = np.asarray(ref_clones, dtype=np.intp)
+    known = dict(zip(ref_seqs, ref_clones.tolist()))
+    out = [known.get(s) for s in new_seqs]
+    pending = [k for k, c in enumerate(out) if c is None]
+    if len(pending) == 0:
+        return (out)
+    # nodes 0..K-1 are the existing clones, K.. are the new sequences.
+    uniq, ref_node = np.unique(ref_clones, return_inverse=True)
+    n_ref = len(uniq)
+    seqs = [new_seqs[k] for k in pending]
+    width = max([len(str(x)) for x in list(seqs) + list(ref_seqs)])
+    encoded = encode_sequences(seqs, width)
+    uf = UnionFind(n_ref + len(seqs))
+    if len(ref_seqs) > 0:
+        ref_encoded = encode_sequences(ref_seqs, width)
+        for i, j in query_neighbours(encoded, ref_encoded, threshold,
+                                     block_size):
+            uf.union(i + n_ref, ref_node[j])
+    for i, j in hamming_neighbours(encoded, threshold, block_size):
+        uf.union(i + n_ref, j + n_ref)
+    roots = uf.find()[n_ref:]
+    novel = roots >= n_ref
+    for k, r in zip(np.nonzero(~novel)[0], roots[~novel]):
+        out[pending[k]] = int(uniq[r])
+    start = int(uniq.max()) + 1 if n_ref > 0 else 1
+    novel_idx = np.nonzero(novel)[0]
+    clones = group_labels([seqs[k] for k in novel_idx], roots[novel_idx])
+    clone_number = {
+        s: start + x
+        for x, clone in enumerate(clones) for s in clone
+    }
+    for k in novel_idx:
+        out[pending[k]] = clone_number[seqs[k]]
+    return (out)
+
+
+def schedule_batches(tasks: Sequence, n_jobs: int) -> list:
+    """
+    Pack (key, group) tasks into batches for a process pool, largest first.
+
+    Each group costs roughly the square of its size. Groups are sorted from most to least expensive and
+    packed greedily until a batch reaches a fraction of the total cost, so that the large groups are
+    dispatched on their own and early while the many small groups share batches.
+    """
+    costs = [len(seq_)**2 for _, seq_ in tasks]
+    target = max(1, sum(costs) // (n_jobs * 8))
+    order = sorted(range(len(tasks)), key=lambda i: costs[i], reverse=True)
+    batches, batch, batch_cost = [], [], 0
+    for i in order:
+        batch.append(tasks[i])
+        batch_cost += costs[i]
+        if batch_cost >= target:
+            batches.append(batch)
+            batch, batch_cost = [], 0
+    if len(batch) > 0:
+        batches.append(batch)
+    return (batches)
@@ -10,7 +10,7 @@ import networkx as nx
 from ..utilities._utilities import *
 from ..utilities._core import *
 from ..utilities._io import *
-from ..tools._network import clone_centrality, clone_degree, generate_network
+from ..tools._network import clone_centrality, clone_degree, generate_network, _distance_graph
 from ._chao1 import chao1
 from ._gini import gini_index
 from ._shannon import shannon
@@ -275,16 +275,7 @@ def clone_networkstats(self: Dandelion,
             else:
                 G = self.graph[0]
         except:
-            dist = np.sum([
-                self.distance[x].toarray()
-                for x in self.distance if type(self.distance[x]) is csr_matrix
-            ],
-                          axis=0)
-            A = csr_matrix(dist)
-            G = nx.Graph()
-            G.add_weighted_edges_from(
-                zip(list(self.metadata.index), list(self.metadata.index),
-                    A.data))
+            G = _distance_graph(self)
 
         if len(G) == 0:
             raise AttributeError(
@@ -8,6 +8,9 @@ import pandas as pd
 import numpy as np
 import networkx as nx
 from polyleven import levenshtein
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from ._clustering import encode_sequences, edit_distances, schedule_batches
 from ..utilities._utilities import *
 from ..utilities._core import *
 from ..utilities._io import *
@@ -15,14 +18,15 @@ try:
     from networkx.utils import np_random_state as random_state
 except:
     from networkx.utils import random_state
-from scipy.sparse import csr_matrix
+from numba import njit
+from scipy.sparse import csr_matrix, issparse, triu
 from scipy.sparse.csgraph import minimum_spanning_tree
 from scipy.spatial.distance import pdist, squareform
 from itertools import combinations
 from tqdm import tqdm
 from time import sleep
 from scanpy import logging as logg
-from typing import Union, Sequence, Tuple, Optional
+from typing import Union, Sequence, Tuple, Optional, Dict
 
 
 def generate_network(self: Union[Dandelion, pd.DataFrame, str],
@@ -31,6 +35,11 @@ def generate_network(self: Union[Dandelion, pd.DataFrame, str],
                      min_size: int = 2,
                      downsample: Optional[int] = None,
                      verbose: bool = True,
+                     distance_backend: Literal['sparse', 'dense'] = 'sparse',
+                     distance_kernel: Literal['bitparallel',
+                                              'polyleven'] = 'bitparallel',
+                     max_distance: Optional[int] = None,
+                     n_jobs: Optional[int] = None,
                      **kwargs) -> Dandelion:
     """
     Generates a Levenshtein distance network based on full length VDJ sequence alignments for heavy and light chain(s).
@@ -50,8 +59,24 @@ def generate_network(self: Union[Dandelion, pd.DataFrame, str],
         whether or not to downsample the number of cells prior to construction of network. If provided, cells will be randomly sampled to the integer provided. A new Dandelion class will be returned.
     verbose : bool
         whether or not to print the progress bars.
+    distance_backend : str
+        'sparse' (default) only calculates distances between cells of the same clone (or of overlapping clones)
+        and stores them in `scipy.sparse` matrices, so memory scales with the sum of squared clone sizes.
+        'dense' calculates the full all-vs-all distance matrices.
+    distance_kernel : str
+        'bitparallel' (default) calculates the distances in batches with a compiled bit-parallel (Myers) kernel.
+        'polyleven' calls `polyleven.levenshtein` once per pair.
+    max_distance : int, Optional
+        if provided, distances above this are not resolved exactly and are stored as `max_distance + 1`.
+    n_jobs : int, Optional
+        number of processes used to build the minimum spanning trees of the clones. None defaults to 1,
+        -1 uses all available cpus.
     **kwargs
-        additional kwargs passed to options specified in `networkx.drawing.layout.spring_layout`.
+        additional kwargs passed to options specified in `networkx.drawing.layout.spring_layout`, as well as
+        `method` ('exact' (default), 'auto' or 'barnes_hut'), `theta` and `isolates` ('simulate' or 'analytic')
+        to speed up the layout of large networks. The convergence of each layout is reported in `.graph[i].graph['layout']`.
+        `trimmed_layout` ('independent' (default), 'refine' or 'subset') and `refine_iterations` control how the layout of the
+        trimmed graph is computed; see `generate_layout`.
 
     Returns
     -------
@@ -60,7 +85,8 @@ def generate_network(self: Union[Dandelion, pd.DataFrame, str],
     if verbose:
         start = logg.info('Generating network')
     if self.__class__ == Dandelion:
-        dat = load_data(self.data)
+        # not copied here as sanitize_data returns a copy
+        dat = self.data
     else:
         dat = load_data(self)
 
@@ -100,7 +126,7 @@ def generate_network(self: Union[Dandelion, pd.DataFrame, str],
             dat_ = dat_h.append(dat_l)
             dat_ = sanitize_data(dat_, ignore=clonekey)
     else:
-        dat_ = dat.copy()
+        dat_ = dat
 
     # So first, create a data frame to hold all possible (full) sequences split by
     # heavy (only 1 possible for now) and light (multiple possible)
@@ -108,211 +134,63 @@ def generate_network(self: Union[Dandelion, pd.DataFrame, str],
     dat_seq = querier.retrieve(query = key_, retrieve_mode = 'split')
     dat_seq.columns = [re.sub(key_ + '_', '', i) for i in dat_seq.columns]
 
-    # calculate a distance matrix for all vs all and this can be referenced later on to
-    # extract the distance between the right pairs
-    dmat = Tree()
-    sleep(0.5)
-    if verbose:
-        for x in tqdm(dat_seq.columns, desc='Calculating distances... '):
-            tdarray = np.array(np.array(dat_seq[x])).reshape(-1, 1)
-            # d_mat = squareform([levenshtein(x[0],y[0]) for x,y in combinations(tdarray, 2)
-            # if (x[0] == x[0]) and (y[0] == y[0]) else 0])
-            d_mat = squareform(
-                pdist(
-                    tdarray, lambda x, y: levenshtein(x[0], y[0])
-                    if (x[0] == x[0]) and (y[0] == y[0]) else 0))
-            dmat[x] = d_mat
-    else:
-        for x in dat_seq.columns:
-            tdarray = np.array(np.array(dat_seq[x])).reshape(-1, 1)
-            # d_mat = squareform([levenshtein(x[0],y[0]) for x,y in combinations(tdarray, 2)
-            #                      if (x[0] == x[0]) and (y[0] == y[0]) else 0])
-            d_mat = squareform(
-                pdist(
-                    tdarray, lambda x, y: levenshtein(x[0], y[0])
-                    if (x[0] == x[0]) and (y[0] == y[0]) else 0))
-            dmat[x] = d_mat
-
-    dist_mat_list = [dmat[x] for x in dmat if type(dmat[x]) is np.ndarray]
-
-    total_dist = np.sum(dist_mat_list, axis=0)
-
     # generate edge list
-    if self.__class__ == Dandelion:
-        out = self.copy()
-        if downsample is not None:
-            out = Dandelion(dat_)
+    if self.__class__ == Dandelion and downsample is None:
+        out = self
     else:  # re-initiate a Dandelion class object
-        out = Dandelion(dat_)
+        out = Dandelion(dat_, lazy=True)
 
-    tmp_totaldist = pd.DataFrame(total_dist,
-                                 index=dat_seq.index,
-                                 columns=dat_seq.index)
-    tmp_clusterdist = Tree()
-    overlap = []
-    for i in out.metadata.index:
-        if len(out.metadata.loc[i, str(clonekey)].split('|')) > 1:
-            overlap.append(
-                [c for c in out.metadata.loc[i, str(clonekey)].split('|')])
-            for c in out.metadata.loc[i, str(clonekey)].split('|'):
-                tmp_clusterdist[c][i].value = 1
-        else:
-            cx = out.metadata.loc[i, str(clonekey)]
-            tmp_clusterdist[cx][i].value = 1
-    tmp_clusterdist2 = {}
-    for x in tmp_clusterdist:
-        tmp_clusterdist2[x] = list(tmp_clusterdist[x])
-    cluster_dist = {}
-    for c_ in tmp_clusterdist2:
-        if c_ in list(flatten(overlap)):
-            for ol in overlap:
-                if c_ in ol:
-                    idx = list(
-                        set(flatten([tmp_clusterdist2[c_x] for c_x in ol])))
-                    if len(list(set(idx))) > 1:
-                        dist_mat_ = tmp_totaldist.loc[idx, idx]
-                        s1, s2 = dist_mat_.shape
-                        if s1 > 1 and s2 > 1:
-                            cluster_dist['|'.join(ol)] = dist_mat_
-        else:
-            dist_mat_ = tmp_totaldist.loc[tmp_clusterdist2[c_],
-                                          tmp_clusterdist2[c_]]
-            s1, s2 = dist_mat_.shape
-            if s1 > 1 and s2 > 1:
-                cluster_dist[c_] = dist_mat_
+    # cells of each clone, or of overlapping clones, are the only ones that get linked
+    clone_groups = _clone_groups(out.get_metadata([clonekey]), clonekey)
 
-    # to improve the visulisation and plotting efficiency, i will build a minimum spanning tree for each group/clone to connect the shortest path
-    mst_tree = mst(cluster_dist)
     sleep(0.5)
+    if distance_backend == 'dense':
+        # calculate a distance matrix for all vs all and this can be referenced later on to
+        # extract the distance between the right pairs
+        dmat = Tree()
+        rows, cols = np.triu_indices(dat_seq.shape[0], k=1)
+        for x in tqdm(dat_seq.columns,
+                      desc='Calculating distances... ',
+                      disable=not verbose):
+            dmat[x] = squareform(
+                _pair_distances(dat_seq[x],
+                                rows,
+                                cols,
+                                kernel=distance_kernel,
+                                max_distance=max_distance).astype(float))
+
+        dist_mat_list = [
+            dmat[x] for x in dmat if type(dmat[x]) is np.ndarray
+        ]
 
-    edge_list = Tree()
-    if verbose:
-        for c in tqdm(mst_tree, desc='Generating edge list '):
-            G = nx.from_pandas_adjacency(mst_tree[c])
-            edge_list[c] = nx.to_pandas_edgelist(G)
-    else:
-        for c in mst_tree:
-            G = nx.from_pandas_adjacency(mst_tree[c])
-            edge_list[c] = nx.to_pandas_edgelist(G)
+        total_dist = np.sum(dist_mat_list, axis=0)
 
-    sleep(0.5)
+        tmp_totaldist = pd.DataFrame(total_dist,
+                                     index=dat_seq.index,
+                                     columns=dat_seq.index)
+        cluster_dist = {}
+        for c_ in clone_groups:
+            dist_mat_ = tmp_totaldist.loc[clone_groups[c_], clone_groups[c_]]
+            s1, s2 = dist_mat_.shape
+            if s1 > 1 and s2 > 1:
+                cluster_dist[c_] = dist_mat_
 
-    clone_ref = dict(out.metadata[clonekey])
-    tmp_clone_tree = Tree()
-    for x in out.metadata.index:
-        if '|' in clone_ref[x]:
-            for x_ in clone_ref[x].split('|'):
-                tmp_clone_tree[x_][x].value = 1
-        else:
-            tmp_clone_tree[clone_ref[x]][x].value = 1
-    tmp_clone_tree2 = Tree()
-    for x in tmp_clone_tree:
-        tmp_clone_tree2[x] = list(tmp_clone_tree[x])
-
-    tmp_clone_tree3 = Tree()
-    tmp_clone_tree3_overlap = Tree()
-    for x in tmp_clone_tree2:
-        # this is to catch all possible cells that may potentially match up with this clone that's joined together
-        if x in list(flatten(overlap)):
-            for ol in overlap:
-                if x in ol:
-                    if len(tmp_clone_tree2[x]) > 1:
-                        for x_ in tmp_clone_tree2[x]:
-                            tmp_clone_tree3_overlap['|'.join(ol)][''.join(
-                                x_)].value = 1
-                    else:
-                        tmp_clone_tree3_overlap['|'.join(ol)][''.join(
-                            tmp_clone_tree2[x])].value = 1
-        else:
-            tmp_ = pd.DataFrame(index=tmp_clone_tree2[x],
-                                columns=tmp_clone_tree2[x])
-            tmp_ = pd.DataFrame(np.tril(tmp_) + 1,
-                                index=tmp_clone_tree2[x],
-                                columns=tmp_clone_tree2[x])
-            tmp_.fillna(0, inplace=True)
-            tmp_clone_tree3[x] = tmp_
-
-    for x in tmp_clone_tree3_overlap:  # repeat for the overlap clones
-        tmp_ = pd.DataFrame(index=tmp_clone_tree3_overlap[x],
-                            columns=tmp_clone_tree3_overlap[x])
-        tmp_ = pd.DataFrame(np.tril(tmp_) + 1,
-                            index=tmp_clone_tree3_overlap[x],
-                            columns=tmp_clone_tree3_overlap[x])
-        tmp_.fillna(0, inplace=True)
-        tmp_clone_tree3[x] = tmp_
-
-    # here I'm using a temporary edge list to catch all cells that were identified as clones to forcefully link them up if they were identical but clipped off during the mst step
-
-    # create a dataframe to recall the actual distance quickly
-    tmp_totaldiststack = pd.DataFrame(tmp_totaldist.unstack())
-    tmp_totaldiststack.index.names = [None, None]
-    tmp_totaldiststack = tmp_totaldiststack.reset_index(drop=False)
-    tmp_totaldiststack.columns = ['source', 'target', 'weight']
-    tmp_totaldiststack.index = [
-        str(s) + '|' + str(t) for s, t in zip(tmp_totaldiststack['source'],
-                                              tmp_totaldiststack['target'])
-    ]
-    tmp_totaldiststack['keep'] = [
-        False if len(list(set(i.split('|')))) == 1 else True
-        for i in tmp_totaldiststack.index
-    ]
-    tmp_totaldiststack = tmp_totaldiststack[tmp_totaldiststack.keep].drop(
-        'keep', axis=1)
-
-    tmp_edge_list = Tree()
-    if verbose:
-        for c in tqdm(tmp_clone_tree3, desc='Linking edges '):
-            if len(tmp_clone_tree3[c]) > 1:
-                G = nx.from_pandas_adjacency(tmp_clone_tree3[c])
-                tmp_edge_list[c] = nx.to_pandas_edgelist(G)
-                tmp_edge_list[c].index = [
-                    str(s) + '|' + str(t) for s, t in zip(
-                        tmp_edge_list[c]['source'], tmp_edge_list[c]['target'])
-                ]
-                tmp_edge_list[c]['weight'].update(tmp_totaldiststack['weight'])
-                # keep only edges when there is 100% identity, to minimise crowding
-                tmp_edge_list[c] = tmp_edge_list[c][tmp_edge_list[c]['weight']
-                                                    == 0]
-                tmp_edge_list[c].reset_index(inplace=True)
+    elif distance_backend == 'sparse':
+        dmat, cluster_dist = _clone_distances(dat_seq,
+                                              clone_groups,
+                                              kernel=distance_kernel,
+                                              max_distance=max_distance,
+                                              verbose=verbose)
     else:
-        for c in tmp_clone_tree3:
-            if len(tmp_clone_tree3[c]) > 1:
-                G = nx.from_pandas_adjacency(tmp_clone_tree3[c])
-                tmp_edge_list[c] = nx.to_pandas_edgelist(G)
-                tmp_edge_list[c].index = [
-                    str(s) + '|' + str(t) for s, t in zip(
-                        tmp_edge_list[c]['source'], tmp_edge_list[c]['target'])
-                ]
-                tmp_edge_list[c]['weight'].update(tmp_totaldiststack['weight'])
-                # keep only edges when there is 100% identity, to minimise crowding
-                tmp_edge_list[c] = tmp_edge_list[c][tmp_edge_list[c]['weight']
-                                                    == 0]
-                tmp_edge_list[c].reset_index(inplace=True)
-
-    # try to catch situations where there's no edge (only singletons)
-    try:
-        edge_listx = pd.concat([edge_list[x] for x in edge_list])
-        edge_listx.index = [
-            str(s) + '|' + str(t)
-            for s, t in zip(edge_listx['source'], edge_listx['target'])
-        ]
-
-        tmp_edge_listx = pd.concat([tmp_edge_list[x] for x in tmp_edge_list])
-        tmp_edge_listx.drop('index', axis=1, inplace=True)
-        tmp_edge_listx.index = [
-            str(s) + '|' + str(t)
-            for s, t in zip(tmp_edge_listx['source'], tmp_edge_listx['target'])
-        ]
+        raise ValueError(
+            "distance_backend must be one of 'sparse' or 'dense', not {}.".
+            format(distance_backend))
 
-        edge_list_final = edge_listx.combine_first(tmp_edge_listx)
-        edge_list_final['weight'].update(tmp_totaldiststack['weight'])
-        # return the edge list
-        edge_list_final.reset_index(drop=True, inplace=True)
-    except:
-        edge_list_final = None
+    # to improve the visulisation and plotting efficiency, i will build a minimum spanning tree for each group/clone to connect the shortest path
+    edge_list_final = _clone_edges(cluster_dist, n_jobs=n_jobs, verbose=verbose)
 
     # and finally the vertex list which is super easy
-    vertice_list = list(out.metadata.index)
+    vertice_list = list(out.get_metadata([clonekey]).index)
     sleep(0.5)
     # and now to actually generate the network
     g, g_, lyt, lyt_ = generate_layout(vertice_list,
@@ -354,7 +232,8 @@ def generate_network(self: Union[Dandelion, pd.DataFrame, str],
                             edges=edge_list_final,
                             layout=(lyt, lyt_),
                             graph=(g, g_),
-                            germline=germline_)
+                            germline=germline_,
+                            lazy=True)
             out.threshold = threshold_
             return (out)
         else:
@@ -365,6 +244,7 @@ def generate_network(self: Union[Dandelion, pd.DataFrame, str],
                           layout=(lyt, lyt_),
                           graph=(g, g_),
                           germline=germline_,
+                          clone_index=self.clone_index,
                           initialize=False)
             self.threshold = threshold_
     else:
@@ -374,30 +254,268 @@ def generate_network(self: Union[Dandelion, pd.DataFrame, str],
                         edges=edge_list_final,
                         layout=(lyt, lyt_),
                         graph=(g, g_),
-                        clone_key=clone_key)
+                        clone_key=clone_key,
+                        lazy=True)
         return (out)
 
 
-def mst(mat: dict) -> Tree:
+def _clone_edges(cluster_dist: Dict,
+                 n_jobs: Optional[int] = None,
+                 verbose: bool = True) -> Optional[pd.DataFrame]:
+    """
+    Construct the network edges from the distances within each group/clone.
+
+    Each group contributes the edges of its minimum spanning tree, plus edges between all of its cells
+    that are identical, as the minimum spanning tree clips those off.
+
+    Parameters
+    ----------
+    cluster_dist : Dict
+        group name to DataFrame of the summed distances between its cells.
+    n_jobs : int, Optional
+        number of processes. None defaults to 1, -1 uses all available cpus.
+    verbose : bool
+        whether or not to print the progress bars.
+
+    Returns
+    -------
+    DataFrame with 'source', 'target' and 'weight' columns, or None if there are no edges.
+    """
+    if len(cluster_dist) == 0:
+        return (None)
+    if n_jobs is not None and n_jobs < 0:
+        n_jobs = os.cpu_count()
+    tasks = [(c, cluster_dist[c].values) for c in cluster_dist]
+    if n_jobs is None or n_jobs <= 1:
+        results = dict(
+            _mst_batch([t])[0] for t in tqdm(
+                tasks, desc='Generating edge list ', disable=not verbose))
+    else:
+        results = {}
+        # spawn rather than fork, as forking after hdf5/numba threads have started can deadlock
+        with ProcessPoolExecutor(max_workers=n_jobs,
+                                 mp_context=get_context('spawn')) as executor:
+            futures = [
+                executor.submit(_mst_batch, batch)
+                for batch in schedule_batches(tasks, n_jobs)
+            ]
+            with tqdm(total=len(tasks),
+                      desc='Generating edge list ',
+                      disable=not verbose) as pbar:
+                for future in as_completed(futures):
+                    res = future.result()
+                    results.update(res)
+                    pbar.update(len(res))
+    source, target, weight = [], [], []
+    for c in cluster_dist:
+        i, j, w = results[c]
+        source.append(cluster_dist[c].index.values[i])
+        target.append(cluster_dist[c].index.values[j])
+        weight.append(w)
+    edges = pd.DataFrame({
+        'source': np.concatenate(source),
+        'target': np.concatenate(target),
+        'weight': np.concatenate(weight)
+    })
+    # overlapping groups can share cells
+    edges = edges.drop_duplicates(subset=['source', 'target']).sort_values(
+        ['source', 'target']).reset_index(drop=True)
+    return (edges)
+
+
+def _mst_batch(batch: Sequence) -> list:
+    """Minimum spanning tree and identical pairs of a batch of (group, distance matrix) tasks."""
+    out = []
+    for c, d in batch:
+        tree = minimum_spanning_tree(np.triu(d)).tocoo()
+        i, j = np.triu_indices(d.shape[0], k=1)
+        # keep only edges when there is 100% identity, to minimise crowding
+        zero = d[i, j] == 0
+        out.append((c, (np.concatenate([tree.row, i[zero]]),
+                        np.concatenate([tree.col, j[zero]]),
+                        np.concatenate([d[tree.row, tree.col], d[i[zero], j[zero]]]))))
+    return (out)
+
+
+def _clone_groups(metadata: pd.DataFrame, clonekey: str) -> Dict:
+    """
+    Group cells that can be linked in the network.
+
+    Cells of each clone form a group; clones that are overlapping (i.e. 'a|b') are merged into a single group.
+
+    Parameters
+    ----------
+    metadata : DataFrame
+        cell-indexed clone table.
+    clonekey : str
+        column name holding the clone calls.
+
+    Returns
+    -------
+    Dictionary of group name to list of cells.
+    """
+    clone_cells = {}
+    overlap = []
+    for i, cl in zip(metadata.index, metadata[str(clonekey)]):
+        cl = str(cl).split('|')
+        if len(cl) > 1:
+            overlap.append(cl)
+        for c in cl:
+            clone_cells.setdefault(c, []).append(i)
+    overlapping = set(flatten(overlap))
+    groups = {}
+    for c in clone_cells:
+        if c in overlapping:
+            for ol in overlap:
+                if c in ol:
+                    groups['|'.join(ol)] = list(
+                        dict.fromkeys(flatten([clone_cells[x] for x in ol])))
+        else:
+            groups[c] = clone_cells[c]
+    return (groups)
+
+
+def _clone_distances(dat_seq: pd.DataFrame,
+                     groups: Dict,
+                     kernel: Literal['bitparallel', 'polyleven'] = 'bitparallel',
+                     max_distance: Optional[int] = None,
+                     verbose: bool = True) -> Tuple[Tree, Dict]:
+    """
+    Calculate Levenshtein distances only between cells within the same group.
+
+    Parameters
+    ----------
+    dat_seq : DataFrame
+        cell-indexed sequences, one column per chain.
+    groups : Dict
+        group name to list of cells, as returned by `_clone_groups`.
+    kernel : str
+        'bitparallel' or 'polyleven'. See `_pair_distances`.
+    max_distance : int, Optional
+        if provided, distances above this are stored as `max_distance + 1`.
+    verbose : bool
+        whether or not to print the progress bars.
+
+    Returns
+    -------
+    Tuple of `Tree` holding a sparse distance matrix per chain and a dictionary of the summed distances per group.
+    """
+    n = dat_seq.shape[0]
+    pos = pd.Series(np.arange(n), index=dat_seq.index)
+    groups = {g: pos[groups[g]].values for g in groups if len(groups[g]) > 1}
+    pairs = [np.triu_indices(len(idx), k=1) for idx in groups.values()]
+    rows = np.concatenate([np.zeros(0, dtype=np.intp)] +
+                          [idx[i] for idx, (i, j) in zip(groups.values(), pairs)])
+    cols = np.concatenate([np.zeros(0, dtype=np.intp)] +
+                          [idx[j] for idx, (i, j) in zip(groups.values(), pairs)])
+    # overlapping groups can share cells, so only keep each pair once
+    rows, cols = np.minimum(rows, cols), np.maximum(rows, cols)
+    _, keep = np.unique(rows.astype(np.int64) * n + cols, return_index=True)
+    rows, cols = rows[keep], cols[keep]
+
+    dmat = Tree()
+    for x in tqdm(dat_seq.columns,
+                  desc='Calculating distances... ',
+                  disable=not verbose):
+        d = _pair_distances(dat_seq[x],
+                            rows,
+                            cols,
+                            kernel=kernel,
+                            max_distance=max_distance).astype(float)
+        nz = d != 0
+        dmat[x] = csr_matrix(
+            (np.concatenate([d[nz], d[nz]]),
+             (np.concatenate([rows[nz], cols[nz]]),
+              np.concatenate([cols[nz], rows[nz]]))),
+            shape=(n, n))
+    total = csr_matrix((n, n))
+    for x in dmat:
+        total = total + dmat[x]
+    cluster_dist = {}
+    for g, idx in groups.items():
+        cluster_dist[g] = pd.DataFrame(total[idx][:, idx].toarray(),
+                                       index=dat_seq.index[idx],
+                                       columns=dat_seq.index[idx])
+    return (dmat, cluster_dist)
+
+
+def _pair_distances(seqs: Sequence,
+                    rows: np.ndarray,
+                    cols: np.ndarray,
+                    kernel: Literal['bitparallel', 'polyleven'] = 'bitparallel',
+                    max_distance: Optional[int] = None) -> np.ndarray:
+    """
+    Levenshtein distances between pairs of sequences; pairs with a missing sequence get 0.
+
+    Parameters
+    ----------
+    seqs : Sequence
+        sequences, which can contain missing values.
+    rows : np.ndarray
+        indices of the first sequence of each pair.
+    cols : np.ndarray
+        indices of the second sequence of each pair.
+    kernel : str
+        'bitparallel' uses the batched kernel in `edit_distances`. 'polyleven' calls `polyleven.levenshtein` per pair.
+    max_distance : int, Optional
+        if provided, distances above this are returned as `max_distance + 1`.
+
+    Returns
+    -------
+    `numpy.ndarray` of distances, one per pair.
+    """
+    seqs = np.array(seqs, dtype=object)
+    missing = pd.isnull(seqs)
+    seqs[missing] = ''
+    if kernel == 'bitparallel':
+        lengths = [len(s) for s in seqs]
+        dist = edit_distances(encode_sequences(seqs), lengths, rows, cols,
+                              max_distance)
+    elif kernel == 'polyleven':
+        if max_distance is None:
+            dist = np.array(
+                [levenshtein(seqs[r], seqs[c]) for r, c in zip(rows, cols)],
+                dtype=np.int64)
+        else:
+            dist = np.array([
+                levenshtein(seqs[r], seqs[c], max_distance)
+                for r, c in zip(rows, cols)
+            ],
+                            dtype=np.int64)
+    else:
+        raise ValueError(
+            "distance_kernel must be one of 'bitparallel' or 'polyleven', not {}."
+            .format(kernel))
+    dist[missing[rows] | missing[cols]] = 0
+    return (dist)
+
+
+def _distance_graph(self: Dandelion) -> nx.Graph:
     """
-    Construct minimum spanning tree based on supplied matrix in dictionary.
+    Rebuild a graph from the `.distance` matrices when `.graph` is not available.
+
+    The matrices are summed as sparse matrices and every non-zero cell pair becomes an edge.
 
     Parameters
     ----------
-    mat : dict
-        Dictionary containing numpy ndarrays.
+    self : Dandelion
+        `Dandelion` object after `tl.generate_network` has been run.
 
     Returns
     -------
-    Dandelion `Tree` object holding DataFrames of constructed minimum spanning trees.
+    `networkx.Graph` with the summed distances as edge weights.
     """
-    mst_tree = Tree()
-    for c in mat:
-        mst_tree[c] = pd.DataFrame(minimum_spanning_tree(np.triu(
-            mat[c])).toarray().astype(int),
-            index=mat[c].index,
-            columns=mat[c].columns)
-    return (mst_tree)
+    G = nx.Graph()
+    A = None
+    for x in self.distance:
+        if issparse(self.distance[x]):
+            A = self.distance[x] if A is None else A + self.distance[x]
+    if A is not None:
+        A = triu(A, k=1).tocoo()
+        cells = np.array(self.metadata.index)
+        G.add_nodes_from(cells)
+        G.add_weighted_edges_from(zip(cells[A.row], cells[A.col], A.data))
+    return (G)
 
 
 def clone_degree(self: Dandelion,
@@ -425,16 +543,7 @@ def clone_degree(self: Dandelion,
         try:
             G = self.graph[0]
         except:
-            dist = np.sum([
-                self.distance[x].toarray()
-                for x in self.distance if type(self.distance[x]) is csr_matrix
-            ],
-                axis=0)
-            A = csr_matrix(dist)
-            G = nx.Graph()
-            G.add_weighted_edges_from(
-                zip(list(self.metadata.index), list(self.metadata.index),
-                    A.data))
+            G = _distance_graph(self)
 
         if len(G) == 0:
             raise AttributeError(
@@ -472,16 +581,7 @@ def clone_centrality(self: Dandelion, verbose: bool = True) -> Dandelion:
         try:
             G = self.graph[0]
         except:
-            dist = np.sum([
-                self.distance[x].toarray()
-                for x in self.distance if type(self.distance[x]) is csr_matrix
-            ],
-                axis=0)
-            A = csr_matrix(dist)
-            G = nx.Graph()
-            G.add_weighted_edges_from(
-                zip(list(self.metadata.index), list(self.metadata.index),
-                    A.data))
+            G = _distance_graph(self)
 
         if len(G) == 0:
             raise AttributeError(
@@ -506,7 +606,38 @@ def generate_layout(vertices: Sequence,
                     min_size: int = 2,
                     weight: Optional[str] = None,
                     verbose: bool = True,
+                    trimmed_layout: Literal['independent', 'refine',
+                                            'subset'] = 'independent',
+                    refine_iterations: int = 10,
                     **kwargs) -> Tuple[nx.Graph, nx.Graph, dict, dict]:
+    """
+    Generates the full and the trimmed graphs and their layouts.
+
+    Parameters
+    ----------
+    vertices : Sequence
+        nodes of the graph.
+    edges : DataFrame, Optional
+        edge list with 'source', 'target' and 'weight' columns.
+    min_size : int
+        minimum number of edges required otherwise node will be trimmed in the secondary graph.
+    weight : str, Optional
+        edge attribute used as weight in the layout. None treats all edges equally.
+    verbose : bool
+        whether or not to print progress.
+    trimmed_layout : str
+        how the layout of the trimmed graph is derived. 'independent' (default) runs a separate layout from
+        scratch. 'refine' starts from the positions in the full layout and runs a short refinement, and 'subset'
+        takes the positions in the full layout as they are; both are faster for large networks.
+    refine_iterations : int
+        number of iterations of the refinement for `trimmed_layout='refine'`.
+    **kwargs
+        passed to `_fruchterman_reingold_layout`.
+
+    Returns
+    -------
+    Tuple of full graph, trimmed graph, full layout and trimmed layout.
+    """
     G = nx.Graph()
     G.add_nodes_from(vertices)
     if edges is not None:
@@ -532,8 +663,38 @@ def generate_layout(vertices: Sequence,
     # edges_, weights_ = zip(*nx.get_edge_attributes(G_,'weight').items())
     if verbose:
         print('generating network layout')
-    pos = _fruchterman_reingold_layout(G, weight=weight, **kwargs)
-    pos_ = _fruchterman_reingold_layout(G_, weight=weight, **kwargs)
+    pos = _fruchterman_reingold_layout(G,
+                                       weight=weight,
+                                       verbose=verbose,
+                                       **kwargs)
+    if trimmed_layout == 'independent':
+        pos_ = _fruchterman_reingold_layout(G_,
+                                            weight=weight,
+                                            verbose=verbose,
+                                            **kwargs)
+    elif trimmed_layout == 'refine':
+        # warm start from the full layout, G_ being a subset of G
+        kwargs_ = dict(kwargs, iterations=refine_iterations)
+        if len(G_) > 0:
+            kwargs_['pos'] = {n: pos[n] for n in G_}
+        pos_ = _fruchterman_reingold_layout(G_,
+                                            weight=weight,
+                                            verbose=verbose,
+                                            **kwargs_)
+    elif trimmed_layout == 'subset':
+        pos_ = {}
+        if len(G_) > 0:
+            arr = np.array([pos[n] for n in G_], dtype=float)
+            if kwargs.get('scale', 1) is not None:
+                arr = _rescale_layout(arr, scale=kwargs.get('scale', 1))
+                if kwargs.get('center', None) is not None:
+                    arr = arr + np.asarray(kwargs['center'])
+            pos_ = dict(zip(G_, arr))
+        G_.graph['layout'] = {'method': 'subset', 'iterations': 0}
+    else:
+        raise ValueError(
+            "trimmed_layout must be one of 'refine', 'subset' or 'independent', not {}."
+            .format(trimmed_layout))
     return (G, G_, pos, pos_)
 
 
@@ -562,6 +723,7 @@ def _process_params(G, center, dim):
     return G, center
 
 
+@random_state(10)
 def _fruchterman_reingold_layout(
     G,
     k=None,
@@ -574,6 +736,10 @@ def _fruchterman_reingold_layout(
     center=None,
     dim=2,
     seed=None,
+    method="exact",
+    theta=0.5,
+    isolates="simulate",
+    verbose=False,
     **kwargs,
 ):
     """Position nodes using Fruchterman-Reingold force-directed algorithm.
@@ -606,7 +772,9 @@ def _fruchterman_reingold_layout(
         Nodes to keep fixed at initial position.
         ValueError raised if `fixed` specified and `pos` not.
     iterations : int  Optional (default=50)
-        Maximum number of iterations taken
+        Maximum number of iterations taken, i.e. the iteration budget.
+        Whether the layout converged within it is reported in
+        `G.graph['layout']`.
     threshold: float Optional (default = 1e-4)
         Threshold for relative error in node position changes.
         The iteration stops if the error is below this threshold.
@@ -628,6 +796,21 @@ def _fruchterman_reingold_layout(
         number generator,
         if None, the random number generator is the RandomState instance used
         by numpy.random.
+    method : string  Optional (default='exact')
+        'exact' computes the repulsion between every pair of nodes, which is
+        O(N^2) per iteration. 'barnes_hut' approximates the repulsion of
+        distant nodes with a quadtree, which is O(N log N) per iteration and
+        only supports `dim=2`. 'auto' uses 'barnes_hut' for graphs with 500
+        or more nodes. Layouts only change with the approximation when it is
+        asked for.
+    theta : float  Optional (default=0.5)
+        Barnes-Hut opening angle. Larger values are faster but less accurate.
+    isolates : string  Optional (default='simulate')
+        'simulate' includes isolated nodes in the simulation. 'analytic'
+        lays out the connected nodes only and places the isolated nodes
+        evenly around them on a spiral. Ignored when `fixed` is specified.
+    verbose : bool  Optional (default=False)
+        Whether to print the convergence report.
 
     Returns
     -------
@@ -672,25 +855,81 @@ def _fruchterman_reingold_layout(
     if len(G) == 1:
         return {nx.utils.arbitrary_element(G.nodes()): center}
 
-    try:
-        # Sparse matrix
-        if len(G) < 500:  # sparse solver for large graphs
-            raise ValueError
-        A = nx.to_scipy_sparse_matrix(G, weight=weight, dtype="f")
+    if isolates == "analytic" and fixed is None and dim == 2:
+        isolated = set(nx.isolates(G))
+        if len(isolated) > 0:
+            H = G.subgraph([n for n in G if n not in isolated])
+            pos_h = _fruchterman_reingold_layout(H,
+                                                 k=k,
+                                                 pos=pos,
+                                                 iterations=iterations,
+                                                 threshold=threshold,
+                                                 weight=weight,
+                                                 scale=None,
+                                                 dim=dim,
+                                                 seed=seed,
+                                                 method=method,
+                                                 theta=theta,
+                                                 verbose=verbose)
+            G.graph["layout"] = H.graph.get("layout", {})
+            pos_h = np.array([pos_h[n] for n in H], dtype=float).reshape(-1, dim)
+            k_ = k if k is not None else np.sqrt(1.0 / max(len(H), 1))
+            pos_i = iter(_place_isolates(pos_h, len(isolated), k_))
+            pos_h = iter(pos_h)
+            pos = np.array(
+                [next(pos_i) if n in isolated else next(pos_h) for n in G])
+            if scale is not None:
+                pos = _rescale_layout(pos, scale=scale) + center
+            return dict(zip(G, pos))
+
+    if method == "auto":
+        method = "barnes_hut" if len(G) >= 500 and dim == 2 else "exact"
+    if method == "barnes_hut":
+        if dim != 2:
+            raise ValueError("method='barnes_hut' only supports dim=2.")
+        A = _to_scipy_sparse(G, weight=weight)
         if k is None and fixed is not None:
             # We must adjust k by domain size for layouts not near 1x1
             nnodes, _ = A.shape
             k = dom_size / np.sqrt(nnodes)
-        pos = _sparse_fruchterman_reingold(A, k, pos_arr, fixed, iterations,
-                                           threshold, dim, seed)
-    except ValueError:
-        A = nx.to_numpy_array(G, weight=weight)
-        if k is None and fixed is not None:
-            # We must adjust k by domain size for layouts not near 1x1
-            nnodes, _ = A.shape
-            k = dom_size / np.sqrt(nnodes)
-        pos = _fruchterman_reingold(A, k, pos_arr, fixed, iterations,
-                                    threshold, dim, seed)
+        pos, report = _barnes_hut_fruchterman_reingold(A, k, pos_arr, fixed,
+                                                       iterations, threshold,
+                                                       dim, seed, theta)
+    elif method == "exact":
+        try:
+            # Sparse matrix
+            if len(G) < 500:  # sparse solver for large graphs
+                raise ValueError
+            A = _to_scipy_sparse(G, weight=weight)
+            if k is None and fixed is not None:
+                # We must adjust k by domain size for layouts not near 1x1
+                nnodes, _ = A.shape
+                k = dom_size / np.sqrt(nnodes)
+            pos, report = _sparse_fruchterman_reingold(A, k, pos_arr, fixed,
+                                                       iterations, threshold,
+                                                       dim, seed)
+        except ValueError:
+            A = nx.to_numpy_array(G, weight=weight)
+            if k is None and fixed is not None:
+                # We must adjust k by domain size for layouts not near 1x1
+                nnodes, _ = A.shape
+                k = dom_size / np.sqrt(nnodes)
+            pos, report = _fruchterman_reingold(A, k, pos_arr, fixed,
+                                                iterations, threshold, dim,
+                                                seed)
+    else:
+        raise ValueError(
+            "method must be one of 'auto', 'exact' or 'barnes_hut', not {}.".
+            format(method))
+    report["method"] = method
+    G.graph["layout"] = report
+    if verbose:
+        if report["converged"]:
+            print("layout converged after {} iterations".format(
+                report["iterations"]))
+        else:
+            print("layout stopped at the budget of {} iterations (error {:.2e})".
+                  format(report["iterations"], report["error"]))
     if fixed is None and scale is not None:
         pos = _rescale_layout(pos, scale=scale) + center
     pos = dict(zip(G, pos))
@@ -737,6 +976,7 @@ def _fruchterman_reingold(
     # simple cooling scheme.
     # linearly step down by dt on each iteration so last iteration is size dt.
     dt = t / float(iterations + 1)
+    iteration, err = -1, np.inf
     delta = np.zeros((pos.shape[0], pos.shape[0], pos.shape[1]), dtype=A.dtype)
     # the inscrutable (but fast) version
     # this is still O(V^2)
@@ -765,7 +1005,7 @@ def _fruchterman_reingold(
         err = np.linalg.norm(delta_pos) / nnodes
         if err < threshold:
             break
-    return pos
+    return pos, _layout_report(iteration, err, threshold)
 
 
 @random_state(7)
@@ -821,6 +1061,7 @@ def _sparse_fruchterman_reingold(
     # simple cooling scheme.
     # linearly step down by dt on each iteration so last iteration is size dt.
     dt = t / float(iterations + 1)
+    iteration, err = -1, np.inf
 
     displacement = np.zeros((dim, nnodes))
     for iteration in range(iterations):
@@ -853,7 +1094,230 @@ def _sparse_fruchterman_reingold(
         err = np.linalg.norm(delta_pos) / nnodes
         if err < threshold:
             break
-    return pos
+    return pos, _layout_report(iteration, err, threshold)
+
+
+@random_state(7)
+def _barnes_hut_fruchterman_reingold(
+    A,
+    k=None,
+    pos=None,
+    fixed=None,
+    iterations=50,
+    threshold=1e-4,
+    dim=2,
+    seed=None,
+    theta=0.5,
+    **kwargs,
+):
+    # Position nodes in adjacency matrix A using Fruchterman-Reingold
+    # Barnes-Hut version: the repulsion from far away groups of nodes is
+    # approximated by their centre of mass in a quadtree, O(N log N)
+    nnodes, _ = A.shape
+    A = A.tocoo()
+    if pos is None:
+        # random initial positions
+        pos = np.asarray(seed.rand(nnodes, dim), dtype=float)
+    else:
+        pos = pos.astype(float)
+
+    # optimal distance between nodes
+    if k is None:
+        k = np.sqrt(1.0 / nnodes)
+    # the initial "temperature"  is about .1 of domain area (=1x1)
+    # this is the largest step allowed in the dynamics.
+    t = max(max(pos.T[0]) - min(pos.T[0]), max(pos.T[1]) - min(pos.T[1])) * 0.1
+    # simple cooling scheme.
+    # linearly step down by dt on each iteration so last iteration is size dt.
+    dt = t / float(iterations + 1)
+    iteration, err = -1, np.inf
+    for iteration in range(iterations):
+        # repulsion between all nodes
+        displacement = _barnes_hut_repulsion(pos, k, theta)
+        # attraction along the edges
+        delta = pos[A.row] - pos[A.col]
+        distance = np.sqrt((delta**2).sum(axis=1))
+        distance = np.where(distance < 0.01, 0.01, distance)
+        for d in range(dim):
+            displacement[:, d] -= np.bincount(A.row,
+                                              weights=delta[:, d] * A.data *
+                                              distance / k,
+                                              minlength=nnodes)
+        displacement = displacement - pos / (k * np.sqrt(nnodes))
+        # update positions
+        length = np.sqrt((displacement**2).sum(axis=1))
+        length = np.where(length < 0.01, 0.1, length)
+        delta_pos = displacement * (t / length)[:, np.newaxis]
+        if fixed is not None:
+            # don't change positions of fixed nodes
+            delta_pos[fixed] = 0.0
+        pos += delta_pos
+        # cool temperature
+        t -= dt
+        err = np.linalg.norm(delta_pos) / nnodes
+        if err < threshold:
+            break
+    return pos, _layout_report(iteration, err, threshold)
+
+
+@njit(cache=True)
+def _barnes_hut_repulsion(pos, k, theta):
+    # Repulsive displacement of every node, k^2 / distance, from a quadtree
+    # whose cells are only opened when they are too close for their centre
+    # of mass to stand in for the nodes inside.
+    nnodes = pos.shape[0]
+    cap = 4 * nnodes + 16
+    child = np.full((cap, 4), -1, dtype=np.int64)
+    # body >= 0 for a leaf holding that node, -1 for an empty cell, -2 internal
+    body = np.full(cap, -1, dtype=np.int64)
+    mass = np.zeros(cap)
+    comx = np.zeros(cap)
+    comy = np.zeros(cap)
+    cx = np.zeros(cap)
+    cy = np.zeros(cap)
+    half = np.zeros(cap)
+    xmin, xmax = pos[:, 0].min(), pos[:, 0].max()
+    ymin, ymax = pos[:, 1].min(), pos[:, 1].max()
+    cx[0], cy[0] = (xmin + xmax) / 2, (ymin + ymax) / 2
+    half[0] = max(xmax - xmin, ymax - ymin) / 2 + 1e-9
+    # nodes closer than this share a leaf
+    min_half = half[0] * 2.0**-30
+    ncell = 1
+    for b in range(nnodes):
+        x, y = pos[b, 0], pos[b, 1]
+        node = 0
+        while True:
+            if body[node] == -2:
+                m = mass[node]
+                comx[node] = (comx[node] * m + x) / (m + 1)
+                comy[node] = (comy[node] * m + y) / (m + 1)
+                mass[node] = m + 1
+                q = int(x >= cx[node]) + 2 * int(y >= cy[node])
+                c = child[node, q]
+                if c == -1:
+                    if ncell == cap:
+                        child, body, mass, comx, comy, cx, cy, half = _grow_quadtree(
+                            child, body, mass, comx, comy, cx, cy, half)
+                        cap = body.shape[0]
+                    c = ncell
+                    ncell += 1
+                    h = half[node] / 2
+                    cx[c] = cx[node] + h if x >= cx[node] else cx[node] - h
+                    cy[c] = cy[node] + h if y >= cy[node] else cy[node] - h
+                    half[c] = h
+                    body[c] = b
+                    mass[c] = 1
+                    comx[c], comy[c] = x, y
+                    child[node, q] = c
+                    break
+                node = c
+            elif mass[node] == 0:
+                body[node] = b
+                mass[node] = 1
+                comx[node], comy[node] = x, y
+                break
+            elif half[node] < min_half:
+                m = mass[node]
+                comx[node] = (comx[node] * m + x) / (m + 1)
+                comy[node] = (comy[node] * m + y) / (m + 1)
+                mass[node] = m + 1
+                break
+            else:
+                # split the leaf and push its node one level down
+                e = body[node]
+                if ncell == cap:
+                    child, body, mass, comx, comy, cx, cy, half = _grow_quadtree(
+                        child, body, mass, comx, comy, cx, cy, half)
+                    cap = body.shape[0]
+                ex, ey = pos[e, 0], pos[e, 1]
+                q = int(ex >= cx[node]) + 2 * int(ey >= cy[node])
+                c = ncell
+                ncell += 1
+                h = half[node] / 2
+                cx[c] = cx[node] + h if ex >= cx[node] else cx[node] - h
+                cy[c] = cy[node] + h if ey >= cy[node] else cy[node] - h
+                half[c] = h
+                body[c] = e
+                mass[c] = 1
+                comx[c], comy[c] = ex, ey
+                child[node, q] = c
+                body[node] = -2
+
+    displacement = np.zeros((nnodes, 2))
+    stack = np.empty(4 * 64, dtype=np.int64)
+    theta2 = theta * theta
+    for i in range(nnodes):
+        x, y = pos[i, 0], pos[i, 1]
+        fx, fy = 0.0, 0.0
+        stack[0] = 0
+        sp = 1
+        while sp > 0:
+            sp -= 1
+            node = stack[sp]
+            if mass[node] == 0 or (body[node] == i and mass[node] == 1):
+                continue
+            dx, dy = x - comx[node], y - comy[node]
+            d2 = dx * dx + dy * dy
+            if body[node] != -2 or 4 * half[node] * half[node] < theta2 * d2:
+                # enforce minimum distance of 0.01
+                d2 = max(d2, 1e-4)
+                f = mass[node] * k * k / d2
+                fx += dx * f
+                fy += dy * f
+            else:
+                for q in range(4):
+                    if child[node, q] != -1:
+                        stack[sp] = child[node, q]
+                        sp += 1
+        displacement[i, 0] = fx
+        displacement[i, 1] = fy
+    return displacement
+
+
+@njit(cache=True)
+def _grow_quadtree(child, body, mass, comx, comy, cx, cy, half):
+    # Double the capacity of the quadtree arrays.
+    cap = body.shape[0]
+    child_ = np.full((cap * 2, 4), -1, dtype=np.int64)
+    child_[:cap] = child
+    body_ = np.full(cap * 2, -1, dtype=np.int64)
+    body_[:cap] = body
+    out = []
+    for a in (mass, comx, comy, cx, cy, half):
+        a_ = np.zeros(cap * 2)
+        a_[:cap] = a
+        out.append(a_)
+    return child_, body_, out[0], out[1], out[2], out[3], out[4], out[5]
+
+
+def _layout_report(iteration, err, threshold):
+    # Convergence report of a layout run.
+    return {
+        "iterations": iteration + 1,
+        "error": float(err),
+        "converged": bool(err < threshold),
+    }
+
+
+def _place_isolates(pos, n, k):
+    # Place n isolated nodes on a sunflower spiral around the positions in
+    # pos, at roughly the optimal distance k from each other.
+    if len(pos) > 0:
+        center = pos.mean(axis=0)
+        radius = np.sqrt(((pos - center)**2).sum(axis=1)).max() + k
+    else:
+        center, radius = np.zeros(2), 0
+    i = np.arange(n) + 0.5
+    r = np.sqrt(radius**2 + i * k * k)
+    angle = i * np.pi * (3 - np.sqrt(5))
+    return np.column_stack([r * np.cos(angle), r * np.sin(angle)]) + center
+
+
+def _to_scipy_sparse(G, weight="weight"):
+    # networkx >= 3 dropped to_scipy_sparse_matrix
+    if hasattr(nx, "to_scipy_sparse_array"):
+        return nx.to_scipy_sparse_array(G, weight=weight, dtype="f")
+    return nx.to_scipy_sparse_matrix(G, weight=weight, dtype="f")
 
 
 def _rescale_layout(pos, scale=1):
@@ -21,17 +21,22 @@ from ..utilities._utilities import *
 from ..utilities._core import *
 from ..utilities._io import *
 from ._network import *
+from ._clustering import cluster_sequences, assign_sequences, schedule_batches
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
 from itertools import groupby
-from scipy.spatial.distance import pdist, squareform
 from scipy.sparse import csr_matrix
-from distance import hamming
 from time import sleep
 from scanpy import logging as logg
 from subprocess import run
 from changeo.Gene import getGene
 from anndata import AnnData
-from typing import Union, Sequence, Tuple, Optional
+from typing import Union, Sequence, Tuple, Dict, Optional
+
+CLONE_INDEX_COLUMNS = [
+    'chain', 'v_call', 'j_call', 'length', 'sequence', 'label', 'collapsed'
+]
 
 
 def find_clones(self: Union[Dandelion, pd.DataFrame],
@@ -42,7 +47,9 @@ def find_clones(self: Union[Dandelion, pd.DataFrame],
                 key_added: Optional[str] = None,
                 recalculate_length: bool = True,
                 productive_only: bool = True,
-                collapse_label: bool = False) -> Dandelion:
+                collapse_label: bool = False,
+                n_jobs: Optional[int] = None,
+                incremental: bool = False) -> Dandelion:
     """
     Find clones based on heavy chain and light chain CDR3 junction hamming distance.
 
@@ -69,6 +76,14 @@ def find_clones(self: Union[Dandelion, pd.DataFrame],
     collapse_label: bool
         Whether or not to return the clone_ids with the full keys for VDJ and VJ groups.
         Default (False) will expand VDJ and VJ. If True, VJ will be collapsed to a singular number.
+    n_jobs : int, Optional
+        number of processes used to cluster the V/J/length groups. None defaults to 1, no parallelization.
+        -1 uses all available cpus. Clone ids are identical to the serial run.
+    incremental : bool
+        Whether or not to only assign clones to cells that do not have one yet, e.g. after adding a new sample
+        with `concat`. Requires the `.clone_index` recorded by a previous `find_clones` call with the same
+        `key_added`. New contigs join existing clones or form new ones, existing clones are not reclustered and
+        their clone ids stay the same. The other parameters should match the previous call.
 
     Returns
     -------
@@ -80,10 +95,15 @@ def find_clones(self: Union[Dandelion, pd.DataFrame],
     else:
         dat_ = load_data(self)
 
+    if key_added is None:
+        clone_key = 'clone_id'
+    else:
+        clone_key = key_added
+
     if productive_only:
         dat = dat_[dat_['productive'].isin(['T', 'True', 'TRUE', True])].copy()
     else:
-        dat = dat_.copy()
+        dat = dat_
 
     locus_dict1 = {'ig': ['IGH'], 'tr': ['TRB', 'TRD']}
     locus_dict2 = {'ig': ['IGK', 'IGL'], 'tr': ['TRA', 'TRG']}
@@ -102,6 +122,18 @@ def find_clones(self: Union[Dandelion, pd.DataFrame],
     locus_1 = locus_dict1[locus]
     locus_2 = locus_dict2[locus]
 
+    if incremental:
+        if self.__class__ != Dandelion or clone_key not in getattr(
+                self, 'clone_index', {}):
+            raise ValueError(
+                "incremental mode requires a Dandelion object with a clone index for {}. "
+                .format(clone_key) +
+                "Please run find_clones on the existing data first.")
+        clone_index = self.clone_index[clone_key]
+        # only cells with a contig that has not been assigned yet are processed
+        pending_cells = _pending_cells(dat, clone_key, key_, locus_1, locus_2)
+        dat = dat[dat['cell_id'].isin(pending_cells)].copy()
+
     locus_log1_dict = {'ig': 'IGH', 'tr': 'TRB/TRD'}
     locus_log2_dict = {'ig': 'IGL/IGL', 'tr': 'TRA/TRG'}
 
@@ -116,11 +148,6 @@ def find_clones(self: Union[Dandelion, pd.DataFrame],
     dat_heavy = dat[dat['locus'].isin(locus_1)].copy()
     pd.set_option('mode.chained_assignment', None)
 
-    if key_added is None:
-        clone_key = 'clone_id'
-    else:
-        clone_key = key_added
-
     # retrieve the J genes and J genes
     if not by_alleles:
         if 'v_call_genotyped' in dat_heavy.columns:
@@ -139,8 +166,8 @@ def find_clones(self: Union[Dandelion, pd.DataFrame],
         J = [j for j in dat_heavy['j_call']]
 
     # collapse the alleles to just genes
-    V = [','.join(list(set(v.split(',')))) for v in V]
-    J = [','.join(list(set(j.split(',')))) for j in J]
+    V = [','.join(sorted(set(v.split(',')))) for v in V]
+    J = [','.join(sorted(set(j.split(',')))) for j in J]
 
     seq = dict(zip(dat_heavy.index, dat_heavy[key_]))
     if recalculate_length:
@@ -177,97 +204,15 @@ def find_clones(self: Union[Dandelion, pd.DataFrame],
                     seq_grp[g][s][seq[contig_id]].value = 1
                     for c in [contig_id]:
                         vj_len_grp[g][s][c] = seq[c]
-    clones = Tree()
-    # for each seq group, calculate the hamming distance matrix
-    for g in tqdm(seq_grp, desc='Finding clones based on VDJ chains '):
-        for l in seq_grp[g]:
-            seq_ = list(seq_grp[g][l])
-            tdarray = np.array(seq_).reshape(-1, 1)
-            d_mat = squareform(pdist(tdarray,
-                                     lambda x, y: hamming(x[0], y[0])))
-            # then calculate what the acceptable threshold is for each length of sequence
-            tr = math.floor(int(l) * (1 - identity))
-            # convert diagonal and upper triangle to zeroes
-            d_mat = np.tril(d_mat)
-            np.fill_diagonal(d_mat, 0)
-            # get the coordinates/indices of seqs to match against the threshold later
-            indices_temp = []
-            indices = []
-            indices_temp = [list(x) for x in np.tril_indices_from(d_mat)]
-            indices = list(zip(indices_temp[0], indices_temp[1]))
-            # if there's more than 1 contig, remove the diagonal
-            if len(indices) > 1:
-                for pairs in indices:
-                    # remove diagonals
-                    if pairs[0] == pairs[1]:
-                        indices.remove(pairs)
-            indices_j = []
-            # use the coordinates/indices to retrieve the seq sequences
-            for p in range(0, len(indices)):
-                a1, b1 = indices[p]
-                indices_j.append(seq_[a1])
-                indices_j.append(seq_[b1])
-            # retain only the unique sequences
-            indices_j_f = list(set(indices_j))
-            # convert the distance matrix to coordinate (source) and distance (target) and create it as a dictionary
-            source, target = d_mat.nonzero()
-            source_target = list(zip(source.tolist(), target.tolist()))
-            if len(source) == 0 & len(target) == 0:
-                source_target = list([(0, 0)])
-            dist = {}
-            for st in source_target:
-                dist.update({st: d_mat[st]})
-
-            if d_mat.shape[0] > 1:
-                seq_tmp_dict = clustering(dist, tr, seq_)
-            else:
-                seq_tmp_dict = {seq_[0]: tuple([seq_[0]])}
-            # sort the list so that clones that are larger have a smaller number
-            clones_tmp = sorted(list(set(seq_tmp_dict.values())),
-                                key=len,
-                                reverse=True)
-            for x in range(0, len(clones_tmp)):
-                clones[g][l][x + 1] = clones_tmp[x]
-
-    clone_dict = {}
-    # now to retrieve the contig ids that are grouped together
-    cid = Tree()
-    for g in clones:
-        for l in clones[g]:
-            # retrieve the clone 'numbers'
-            for c in clones[g][l]:
-                grp_seq = clones[g][l][c]
-                for key, value in vj_len_grp[g][l].items():
-                    if value in grp_seq:
-                        cid[g][l][c][key].value = 1
-    # rename clone ids - get dictionaries step by step
-    first_key = []
-    for k1 in cid.keys():
-        first_key.append(k1)
-    first_key = list(set(first_key))
-    first_key_dict = dict(zip(first_key, range(1, len(first_key) + 1)))
-    # and now for the middle key
-    for g in cid:
-        second_key = []
-        for k2 in cid[g].keys():
-            second_key.append(k2)
-        second_key = list(set(second_key))
-        second_key_dict = dict(zip(second_key, range(1, len(second_key) + 1)))
-        for l in cid[g]:
-            # and now for the last key
-            third_key = []
-            for k3 in cid[g][l].keys():
-                third_key.append(k3)
-            third_key = list(set(third_key))
-            third_key_dict = dict(zip(third_key, range(1, len(third_key) + 1)))
-            for key, value in dict(cid[g][l]).items():
-                vL = []
-                for v in value:
-                    if type(v) is int:
-                        break
-                    # instead of converting to another tree, i will just make it a dictionary
-                    clone_dict[v] = str(first_key_dict[g]) + '_' + str(
-                        second_key_dict[l]) + '_' + str(third_key_dict[key])
+    if incremental:
+        clone_dict = _assign_groups(clone_index, 'VDJ', vj_len_grp, identity)
+    else:
+        # for each seq group, cluster the sequences on hamming distance
+        clones = _cluster_groups(seq_grp,
+                                 identity,
+                                 desc='Finding clones based on VDJ chains ',
+                                 n_jobs=n_jobs)
+        clone_dict = _label_groups(clones, vj_len_grp)
     # add it to the original dataframes
     dat_heavy[clone_key] = pd.Series(clone_dict)
     dat[clone_key] = pd.Series(dat_heavy[clone_key])
@@ -295,8 +240,8 @@ def find_clones(self: Union[Dandelion, pd.DataFrame],
                 Vlight = [v for v in dat_light_c['v_call']]
             Jlight = [j for j in dat_light_c['j_call']]
         # collapse the alleles to just genes
-        Vlight = [','.join(list(set(v.split(',')))) for v in Vlight]
-        Jlight = [','.join(list(set(j.split(',')))) for j in Jlight]
+        Vlight = [','.join(sorted(set(v.split(',')))) for v in Vlight]
+        Jlight = [','.join(sorted(set(j.split(',')))) for j in Jlight]
         seq = dict(zip(dat_light_c.index, dat_light_c[key_]))
         if recalculate_length:
             seq_length = [len(str(l)) for l in dat_light_c[key_]]
@@ -333,105 +278,29 @@ def find_clones(self: Union[Dandelion, pd.DataFrame],
                         seq_lightgrp[g][s][seq[contig_id]].value = 1
                         for c in [contig_id]:
                             vj_len_lightgrp[g][s][c] = seq[c]
-        clones_light = Tree()
-        for g in seq_lightgrp:
-            for l in seq_lightgrp[g]:
-                seq_ = list(seq_lightgrp[g][l])
-                tdarray = np.array(seq_).reshape(-1, 1)
-                d_mat = squareform(
-                    pdist(tdarray, lambda x, y: hamming(x[0], y[0])))
-                # then calculate what the acceptable threshold is for each length of sequence
-                tr = math.floor(int(l) * (1 - identity))
-                d_mat = np.tril(d_mat)
-                np.fill_diagonal(d_mat, 0)
-                # convert diagonal and upper triangle to zeroes
-                indices_temp = []
-                indices = []
-                indices_temp = [list(x) for x in np.tril_indices_from(d_mat)]
-                # get the coordinates/indices of seqs to match against the threshold later
-                indices = list(zip(indices_temp[0], indices_temp[1]))
-                # if there's more than 1 contig, remove the diagonal
-                if len(indices) > 1:
-                    for pairs in indices:
-                        if pairs[0] == pairs[1]:
-                            indices.remove(pairs)
-                indices_j = []
-                # use the coordinates/indices to retrieve the seq sequences
-                for p in range(0, len(indices)):
-                    a1, b1 = indices[p]
-                    indices_j.append(seq_[a1])
-                    indices_j.append(seq_[b1])
-                # retain only the unique sequences
-                indices_j_f = list(set(indices_j))
-                # convert the distance matrix to coordinate (source) and distance (target)
-                # and create it as a dictionary
-                source, target = d_mat.nonzero()
-                source_target = list(zip(source.tolist(), target.tolist()))
-                if len(source) == 0 & len(target) == 0:
-                    source_target = list([(0, 0)])
-                dist = {}
-                for st in source_target:
-                    dist.update({st: d_mat[st]})
-
-                if d_mat.shape[0] > 1:
-                    seq_tmp_dict_l = clustering(dist, tr, seq_)
-                else:
-                    seq_tmp_dict_l = {seq_[0]: tuple([seq_[0]])}
-                # sort the list so that clones that are larger have a smaller number
-                clones_tmp_l = sorted(list(set(seq_tmp_dict_l.values())),
-                                      key=len,
-                                      reverse=True)
-                for x in range(0, len(clones_tmp_l)):
-                    clones_light[g][l][x + 1] = clones_tmp_l[x]
-
-        clone_dict_light = {}
-        # now to retrieve the contig ids that are grouped together
-        cid_light = Tree()
-        for g in clones_light:
-            for l in clones_light[g]:
-                # retrieve the clone 'numbers'
-                for c in clones_light[g][l]:
-                    grp_seq = clones_light[g][l][c]
-                    for key, value in vj_len_lightgrp[g][l].items():
-                        if value in grp_seq:
-                            cid_light[g][l][c][key].value = 1
-        # rename clone ids - get dictionaries step by step
-        first_key = []
-        for k1 in cid_light.keys():
-            first_key.append(k1)
-        first_key = list(set(first_key))
-        first_key_dict = dict(zip(first_key, range(1, len(first_key) + 1)))
-        # and now for the middle key
-        for g in cid_light:
-            second_key = []
-            for k2 in cid_light[g].keys():
-                second_key.append(k2)
-            second_key = list(set(second_key))
-            second_key_dict = dict(
-                zip(second_key, range(1,
-                                      len(second_key) + 1)))
-            for l in cid_light[g]:
-                # and now for the last key
-                third_key = []
-                for k3 in cid_light[g][l].keys():
-                    third_key.append(k3)
-                third_key = list(set(third_key))
-                third_key_dict = dict(
-                    zip(third_key, range(1,
-                                         len(third_key) + 1)))
-                for key, value in dict(cid_light[g][l]).items():
-                    vL = []
-                    for v in value:
-                        if type(v) is int:
-                            break
-                        # instead of converting to another tree, i will just make it a dictionary
-                        clone_dict_light[v] = str(
-                            first_key_dict[g]) + '_' + str(
-                                second_key_dict[l]) + '_' + str(
-                                    third_key_dict[key])
+        if incremental:
+            clone_dict_light = _assign_groups(clone_index, 'VJ',
+                                              vj_len_lightgrp, identity)
+        else:
+            clones_light = _cluster_groups(seq_lightgrp,
+                                           identity,
+                                           n_jobs=n_jobs)
+            clone_dict_light = _label_groups(clones_light, vj_len_lightgrp)
         lclones = list(clone_dict_light.values())
         renamed_clone_dict_light = {}
-        if collapse_label:
+        if collapse_label and incremental:
+            # keep the collapsed labels already given out and number the new ones after them
+            index_light = clone_index[clone_index['chain'] == 'VJ']
+            lclones_dict = dict(
+                zip(index_light['label'], index_light['collapsed']))
+            next_label = max([int(x) for x in lclones_dict.values()],
+                             default=0) + 1
+            for lc in sorted(set(lclones) - set(lclones_dict)):
+                lclones_dict[lc] = str(next_label)
+                next_label += 1
+            for key, value in clone_dict_light.items():
+                renamed_clone_dict_light[key] = lclones_dict[value]
+        elif collapse_label:
             # will just update the main dat directly
             if len(list(set(lclones))) > 1:
                 lclones_dict = dict(
@@ -480,7 +349,23 @@ def find_clones(self: Union[Dandelion, pd.DataFrame],
             fintree[c] = '|'.join(fintree[c])
         dat[clone_key] = [fintree[x] for x in dat['cell_id']]
 
-    dat_[clone_key] = pd.Series(dat[clone_key])
+    # record the clone of every unique sequence so that new contigs can be added later
+    index = _index_groups('VDJ', vj_len_grp, clone_dict)
+    if dat_light_c.shape[0] != 0:
+        index = pd.concat([
+            index,
+            _index_groups('VJ', vj_len_lightgrp, clone_dict_light,
+                          renamed_clone_dict_light if collapse_label else None)
+        ],
+                          ignore_index=True)
+    if incremental:
+        index = pd.concat([clone_index, index], ignore_index=True)
+        index = index.drop_duplicates(
+            subset=['chain', 'v_call', 'j_call', 'length', 'sequence'])
+        dat_.loc[dat_['cell_id'].isin(pending_cells),
+                 clone_key] = pd.Series(dat[clone_key])
+    else:
+        dat_[clone_key] = pd.Series(dat[clone_key])
     dat_[clone_key].replace('', 'unassigned')
     if os.path.isfile(str(self)):
         write_airr(
@@ -519,6 +404,7 @@ def find_clones(self: Union[Dandelion, pd.DataFrame],
             threshold_ = self.threshold
         else:
             threshold_ = None
+        clone_index_ = getattr(self, 'clone_index', {})
         if ('clone_id' in self.data.columns) and (key_added is None):
             # TODO: need to check the following bits if it works properly if only heavy chain tables are provided
             self.__init__(data=dat_,
@@ -550,12 +436,15 @@ def find_clones(self: Union[Dandelion, pd.DataFrame],
                           clone_key=clone_key)
             update_metadata(self, reinitialize=True, clone_key=clone_key)
         self.threshold = threshold_
+        self.clone_index = clone_index_
+        self.clone_index[clone_key] = index
 
     else:
         out = Dandelion(data=dat_,
                         clone_key=clone_key,
                         retrieve=clone_key,
                         retrieve_mode='merge and unique only')
+        out.clone_index[clone_key] = index
         return (out)
 
 
@@ -1080,6 +969,8 @@ def define_clones(self: Union[Dandelion, pd.DataFrame, str],
         else:
             threshold_ = None
 
+        clone_index_ = getattr(self, 'clone_index', {})
+
         if ('clone_id' in self.data.columns) and (clone_key is not None):
             self.__init__(
                 data=dat,
@@ -1088,6 +979,7 @@ def define_clones(self: Union[Dandelion, pd.DataFrame, str],
                 edges=edge_,
                 layout=layout_,
                 graph=graph_,
+                clone_index=clone_index_,
                 initialize=True,
                 retrieve=clone_key,
                 retrieve_mode='merge and unique only',
@@ -1100,6 +992,7 @@ def define_clones(self: Union[Dandelion, pd.DataFrame, str],
                 edges=edge_,
                 layout=layout_,
                 graph=graph_,
+                clone_index=clone_index_,
                 initialize=True,
                 clone_key=clone_key,
                 retrieve=clone_key,
@@ -1112,6 +1005,7 @@ def define_clones(self: Union[Dandelion, pd.DataFrame, str],
                           edges=edge_,
                           layout=layout_,
                           graph=graph_,
+                          clone_index=clone_index_,
                           initialize=True,
                           clone_key=clone_key)
         self.threshold = threshold_
@@ -1362,45 +1256,234 @@ def clone_overlap(
         return (overlap)
 
 
-def clustering(distance_dict, threshold, sequences_dict):
-    """Clustering the sequences."""
-    out_dict = {}
-    # find out the unique indices in this subset
-    i_unique = list(set(flatten(distance_dict)))
-    # for every pair of i1,i2 is their dictance smaller than the thresholdeshold?
-    i_pair_d = {(i1, i2): distance_dict[(i1, i2)] <= threshold if
-                (i1, i2) in distance_dict else False
-                for i1, i2 in combinations(i_unique, 2)}
-    i_pair_d.update({(i2, i1): distance_dict[(i2, i1)] <= threshold if
-                     (i2, i1) in distance_dict else False
-                     for i1, i2 in combinations(i_unique, 2)})
-    # so which indices should not be part of a clone?
-    canbetogether = defaultdict(list)
-    for ii1, ii2 in combinations(i_unique, 2):
-        if i_pair_d[(ii1, ii2)] or i_pair_d[(ii2, ii1)]:
-            if (ii1, ii2) in distance_dict:
-                canbetogether[ii1].append((ii1, ii2))
-                canbetogether[ii2].append((ii1, ii2))
-            elif (ii2, ii1) in distance_dict:
-                canbetogether[ii2].append((ii2, ii1))
-                canbetogether[ii1].append((ii2, ii1))
-        else:
-            if (ii1, ii2) or (ii2, ii1) in distance_dict:
-                canbetogether[ii1].append(())
-                canbetogether[ii2].append(())
-    for x in canbetogether:
-        canbetogether[x] = list(
-            set([y for y in canbetogether[x] if len(y) > 0]))
-    # convert the indices to sequences
-    for x in canbetogether:
-        if len(canbetogether[x]) > 0:
-            out_dict[sequences_dict[x]] = tuple(
-                sorted(
-                    set(
-                        list([
-                            sequences_dict[y]
-                            for y in flatten(canbetogether[x])
-                        ]) + [sequences_dict[x]])))
-        else:
-            out_dict[sequences_dict[x]] = tuple([sequences_dict[x]])
-    return (out_dict)
+def _pending_cells(data: pd.DataFrame, clone_key: str, key: str,
+                   heavy: Sequence, light: Sequence) -> np.ndarray:
+    """
+    Cells with a contig that can be clustered but has no clone yet.
+
+    Parameters
+    ----------
+    data : DataFrame
+        contigs considered for clustering, e.g. the productive ones.
+    clone_key : str
+        column of the clone ids.
+    key : str
+        column of the sequences that are clustered.
+    heavy : Sequence
+        VDJ loci that are clustered.
+    light : Sequence
+        VJ loci that are clustered.
+
+    Returns
+    -------
+    array of cell ids. Contigs of other loci, without V, J or `key` calls, or VJ contigs of cells without a VDJ
+    contig never get a clone id, so they don't make a cell pending.
+    """
+    v_call = 'v_call_genotyped' if 'v_call_genotyped' in data else 'v_call'
+    paired = data['cell_id'].isin(data.loc[data['locus'].isin(heavy),
+                                           'cell_id'])
+    eligible = data['locus'].isin(heavy) | (data['locus'].isin(light)
+                                            & paired)
+    for col in [v_call, 'j_call', key]:
+        eligible &= data[col].notnull() & ~data[col].isin(['', 'None'])
+    if clone_key in data:
+        pending = data[clone_key].isin(['', 'unassigned'
+                                        ]) | data[clone_key].isnull()
+    else:
+        pending = pd.Series(True, index=data.index)
+    return (data.loc[eligible & pending, 'cell_id'].unique())
+
+
+def _label_groups(clones: Tree, vj_len_grp: Tree) -> Dict:
+    """
+    Name the clone of every contig as '{V/J group}_{length group}_{clone number}'.
+
+    Parameters
+    ----------
+    clones : Tree
+        Tree of V/J groups -> sequence length -> clone number -> tuple of sequences.
+    vj_len_grp : Tree
+        Tree of V/J groups -> sequence length -> contig id -> sequence.
+
+    Returns
+    -------
+    dictionary of contig id -> clone label.
+    """
+    clone_dict = {}
+    # now to retrieve the contig ids that are grouped together
+    cid = Tree()
+    for g in clones:
+        for l in clones[g]:
+            # retrieve the clone 'numbers'
+            seq_clone = {
+                s: c
+                for c in clones[g][l] for s in clones[g][l][c]
+            }
+            for key, value in vj_len_grp[g][l].items():
+                cid[g][l][seq_clone[value]][key].value = 1
+    # rename clone ids - get dictionaries step by step
+    first_key = []
+    for k1 in cid.keys():
+        first_key.append(k1)
+    first_key = list(set(first_key))
+    first_key_dict = dict(zip(first_key, range(1, len(first_key) + 1)))
+    # and now for the middle key
+    for g in cid:
+        second_key = []
+        for k2 in cid[g].keys():
+            second_key.append(k2)
+        second_key = list(set(second_key))
+        second_key_dict = dict(zip(second_key, range(1, len(second_key) + 1)))
+        for l in cid[g]:
+            # and now for the last key
+            third_key = []
+            for k3 in cid[g][l].keys():
+                third_key.append(k3)
+            third_key = list(set(third_key))
+            third_key_dict = dict(zip(third_key, range(1, len(third_key) + 1)))
+            for key, value in dict(cid[g][l]).items():
+                for v in value:
+                    if type(v) is int:
+                        break
+                    # instead of converting to another tree, i will just make it a dictionary
+                    clone_dict[v] = str(first_key_dict[g]) + '_' + str(
+                        second_key_dict[l]) + '_' + str(third_key_dict[key])
+    return (clone_dict)
+
+
+def _assign_groups(clone_index: pd.DataFrame, chain: Literal['VDJ', 'VJ'],
+                   vj_len_grp: Tree, identity: float) -> Dict:
+    """
+    Assign contigs to the clones recorded in a clone index without reclustering them.
+
+    V/J groups, length groups and clones that are not in the index are numbered after the existing ones, so
+    labels already given out do not change.
+
+    Parameters
+    ----------
+    clone_index : DataFrame
+        clone index from a previous `find_clones` call.
+    chain : str
+        'VDJ' or 'VJ'.
+    vj_len_grp : Tree
+        Tree of V/J groups -> sequence length -> contig id -> sequence.
+    identity : float
+        Junction similarity parameter.
+
+    Returns
+    -------
+    dictionary of contig id -> clone label.
+    """
+    ref = clone_index[clone_index['chain'] == chain]
+    first_key_dict, second_key_dict = {}, defaultdict(dict)
+    members = defaultdict(lambda: ([], []))
+    for v, j, l, s, label in zip(ref['v_call'], ref['j_call'], ref['length'],
+                                 ref['sequence'], ref['label']):
+        f, m, c = [int(x) for x in label.split('_')]
+        first_key_dict[(v, j)] = f
+        second_key_dict[(v, j)][l] = m
+        members[(v, j, l)][0].append(s)
+        members[(v, j, l)][1].append(c)
+    next_first = max(first_key_dict.values(), default=0) + 1
+    clone_dict = {}
+    for g in sorted(vj_len_grp):
+        if g not in first_key_dict:
+            first_key_dict[g] = next_first
+            next_first += 1
+        for l in sorted(vj_len_grp[g]):
+            if l not in second_key_dict[g]:
+                second_key_dict[g][l] = max(second_key_dict[g].values(),
+                                            default=0) + 1
+            seq_ = list(dict.fromkeys(vj_len_grp[g][l].values()))
+            ref_seqs, ref_clones = members[(g[0], g[1], l)]
+            tr = math.floor(int(l) * (1 - identity))
+            seq_clone = dict(
+                zip(seq_, assign_sequences(ref_seqs, ref_clones, seq_, tr)))
+            for key, value in vj_len_grp[g][l].items():
+                clone_dict[key] = str(first_key_dict[g]) + '_' + str(
+                    second_key_dict[g][l]) + '_' + str(seq_clone[value])
+    return (clone_dict)
+
+
+def _index_groups(chain: Literal['VDJ', 'VJ'],
+                  vj_len_grp: Tree,
+                  clone_dict: Dict,
+                  collapsed_dict: Optional[Dict] = None) -> pd.DataFrame:
+    """Tabulate the clone label of every unique sequence in each V/J/length group."""
+    rows = []
+    for g in vj_len_grp:
+        for l in vj_len_grp[g]:
+            for key, value in vj_len_grp[g][l].items():
+                rows.append([
+                    chain, g[0], g[1], l, value, clone_dict[key],
+                    collapsed_dict[key] if collapsed_dict is not None else ''
+                ])
+    index = pd.DataFrame(rows, columns=CLONE_INDEX_COLUMNS)
+    return (index.drop_duplicates(
+        subset=['chain', 'v_call', 'j_call', 'length', 'sequence']))
+
+
+def _cluster_groups(seq_grp: Tree,
+                    identity: float,
+                    desc: Optional[str] = None,
+                    n_jobs: Optional[int] = None) -> Tree:
+    """
+    Cluster the sequences in every V/J/length group on hamming distance.
+
+    Parameters
+    ----------
+    seq_grp : Tree
+        Tree of V/J groups -> sequence length -> unique sequences.
+    identity : float
+        Junction similarity parameter.
+    desc : str, Optional
+        description for the progress bar. None disables the progress bar.
+    n_jobs : int, Optional
+        number of processes. None defaults to 1, -1 uses all available cpus.
+
+    Returns
+    -------
+    Tree of V/J groups -> sequence length -> clone number -> tuple of sequences, where larger clones have
+    a smaller number.
+    """
+    if n_jobs is not None and n_jobs < 0:
+        n_jobs = os.cpu_count()
+    tasks = [((g, l), list(seq_grp[g][l])) for g in seq_grp
+             for l in seq_grp[g]]
+    if n_jobs is None or n_jobs <= 1:
+        results = dict(
+            _cluster_batch([t], identity)[0]
+            for t in tqdm(tasks, desc=desc, disable=desc is None))
+    else:
+        results = {}
+        batches = schedule_batches(tasks, n_jobs)
+        # spawn rather than fork, as forking after hdf5/numba threads have started can deadlock
+        with ProcessPoolExecutor(max_workers=n_jobs,
+                                 mp_context=get_context('spawn')) as executor:
+            futures = [
+                executor.submit(_cluster_batch, batch, identity)
+                for batch in batches
+            ]
+            with tqdm(total=len(tasks), desc=desc,
+                      disable=desc is None) as pbar:
+                for future in as_completed(futures):
+                    out = future.result()
+                    results.update(out)
+                    pbar.update(len(out))
+    # assemble in the original group order so that numbering does not depend on completion order
+    clones = Tree()
+    for (g, l), _ in tasks:
+        clones_tmp = results[(g, l)]
+        for x in range(0, len(clones_tmp)):
+            clones[g][l][x + 1] = clones_tmp[x]
+    return (clones)
+
+
+def _cluster_batch(batch: Sequence, identity: float) -> list:
+    """Cluster a batch of ((group, length), sequences) tasks."""
+    out = []
+    for (g, l), seq_ in batch:
+        # calculate what the acceptable threshold is for each length of sequence
+        tr = math.floor(int(l) * (1 - identity))
+        out.append(((g, l), cluster_sequences(seq_, tr)))
+    return (out)
@@ -5,5 +5,6 @@
 # @Last Modified time: 2021-02-11 12:23:07
 
 from ._utilities import *
+from ._compact import *
 from ._io import *
 from ._core import *
\ No newline at end of file
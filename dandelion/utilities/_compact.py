@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+import os
+import re
+import pandas as pd
+
+from typing import Optional, Sequence
+
+
+def _arrow_strings(values: pd.Series,
+                   store: Optional[str] = None) -> Optional[pd.Series]:
+    """
+    Cast a column of strings to `string[pyarrow]`, memory-mapped from `store` if given.
+
+    Returns None if pyarrow is not installed, in which case the column is left as object.
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return (None)
+    values = values.astype('string[pyarrow]')
+    if store is None:
+        return (values)
+    # one file per column, owned by the object compacted into `store`: it is
+    # replaced, not overwritten, so arrays still mapping the old file keep it
+    path = os.path.join(store, re.sub(r'\W', '_', str(values.name)) + '.arrow')
+    table = pa.table({'values': values.array._data})
+    with pa.OSFile(path + '.tmp', 'wb') as f:
+        with pa.ipc.new_file(f, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(path + '.tmp', path)
+    mapped = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return (pd.Series(pd.arrays.ArrowStringArray(mapped.column(0)),
+                      index=values.index,
+                      name=values.name))
+
+
+def compact_data(data: pd.DataFrame,
+                 max_categories: float = 0.1,
+                 min_length: int = 100,
+                 store: Optional[str] = None,
+                 exclude: Sequence = ('sequence_id',
+                                      'cell_id')) -> pd.DataFrame:
+    """
+    Store the columns of an AIRR table compactly.
+
+    Columns of strings with few unique values, e.g. gene calls, locus or sample_id, become categoricals. Columns
+    of long strings, e.g. sequences and alignments, become Arrow string arrays (`string[pyarrow]`), optionally
+    memory-mapped from disk; without pyarrow they stay as object. Other columns are left as they are.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        AIRR data frame.
+    max_categories : float
+        largest number of unique values, as a fraction of the rows, for a column to become categorical.
+    min_length : int
+        smallest mean length of the strings in a column to store them as Arrow strings.
+    store : str, Optional
+        folder to offload the long strings to, read back from disk when accessed. Each column is written to
+        `<column>.arrow` in it, replacing the file of an earlier compaction, so use one folder per object.
+    exclude : Sequence
+        columns to leave as they are.
+
+    Returns
+    -------
+    compacted `pandas.DataFrame`.
+    """
+    if store is not None:
+        os.makedirs(store, exist_ok=True)
+    columns = {}
+    for d in data:
+        values = data[d]
+        if d in exclude or values.dtype != object or values.shape[0] == 0:
+            continue
+        strings = values.map(type).eq(str).all()
+        if not strings:
+            continue
+        lengths = values.str.len()
+        if lengths.mean() >= min_length:
+            compact = _arrow_strings(values, store)
+            if compact is not None:
+                columns[d] = compact
+        elif values.nunique() <= max_categories * values.shape[0]:
+            columns[d] = values.astype('category')
+    if len(columns) == 0:
+        return (data)
+    data = data.copy()
+    for d in columns:
+        data[d] = columns[d]
+    return (data)
+
+
+def expand_data(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Turn the compact columns of a data frame back into object columns.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        data frame, compacted with `compact_data` or not.
+
+    Returns
+    -------
+    `pandas.DataFrame` without categorical or Arrow string columns.
+    """
+    compact = [
+        d for d in data
+        if isinstance(data[d].dtype, (pd.CategoricalDtype, pd.StringDtype))
+    ]
+    if len(compact) == 0:
+        return (data)
+    data = data.copy()
+    for d in compact:
+        # missing strings are pd.NA in string arrays, nan in object columns
+        values = data[d].astype(object)
+        data[d] = values.mask(values.isna())
+    return (data)
@@ -5,15 +5,21 @@
 # @Last Modified time: 2022-03-11 17:44:21
 
 import os
+import json
+import shutil
+import struct
 from collections import defaultdict
 import pandas as pd
 import numpy as np
 import re
 import copy
+import hashlib
+from types import SimpleNamespace
 from changeo.IO import readGermlines
 import warnings
 import h5py
 import networkx as nx
+import scipy.sparse
 import bz2
 import gzip
 from anndata import AnnData
@@ -21,7 +27,64 @@ import _pickle as cPickle
 from scanpy import logging as logg
 from ..utilities._utilities import *
 from ..utilities._io import *
-from typing import Union, Sequence, Tuple, Dict, Optional
+from ..utilities._compact import compact_data, expand_data
+from typing import Union, Sequence, Tuple, Dict, Optional, Callable
+
+
+# manifest of the directories written by `Dandelion.write_parquet`
+_PARQUET_MANIFEST = 'dandelion.json'
+
+# compression of pickles by extension, for `Dandelion.write_pkl`
+_PICKLE_EXTENSIONS = {'pbz2': 'bz2', 'gz': 'gzip', 'zst': 'zstd', 'lz4': 'lz4'}
+# start of pickles written with their buffers out of band; pickles start with b'\x80'
+_PICKLE_BUFFERS = b'DDLPKL5\n'
+
+# slots of `Dandelion` shared between copies until they are accessed
+_SHARED_SLOTS = [
+    'data', 'metadata', 'distance', 'edges', 'layout', 'graph', 'germline',
+    'clone_index'
+]
+
+
+class _Shared:
+    """Slot value shared by copies of a `Dandelion` object."""
+    def __init__(self, value):
+        self.value = value
+        self.owners = 1
+
+    def take(self):
+        """Value for one of the owners; the last owner gets the value itself rather than a copy."""
+        self.owners -= 1
+        if self.owners > 0:
+            return (_copy_slot(self.value))
+        return (self.value)
+
+    def release(self):
+        self.owners -= 1
+
+
+def _copy_slot(value):
+    """
+    Copy of a slot that does not duplicate immutable elements, e.g. the strings in a data frame.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series, nx.Graph)):
+        return (value.copy())
+    if type(value) is dict:
+        return ({k: _copy_slot(v) for k, v in value.items()})
+    if type(value) in [list, tuple]:
+        return (type(value)(_copy_slot(v) for v in value))
+    return (copy.deepcopy(value))
+
+
+def _slot(name: str) -> property:
+    """Property of a slot that may be shared with copies."""
+    def getter(self):
+        return (self._get_slot(name))
+
+    def setter(self, value):
+        self._set_slot(name, value)
+
+    return (property(getter, setter))
 
 
 class Dandelion:
@@ -41,7 +104,13 @@ class Dandelion:
                  layout=None,
                  graph=None,
                  initialize=True,
+                 clone_index=None,
+                 lazy=False,
                  **kwargs):
+        self._metadata_builder = None
+        self._lazy = False
+        # kept when functions re-initialise the object in place
+        self._compact = getattr(self, '_compact', None)
         self.data = data
         self.metadata = metadata
         self.distance = distance
@@ -50,49 +119,171 @@ class Dandelion:
         self.graph = graph
         self.threshold = None
         self.germline = {}
+        self.clone_index = {}
         self.querier = None
 
         if germline is not None:
             self.germline.update(germline)
+        if clone_index is not None:
+            self.clone_index.update(clone_index)
 
-        if os.path.isfile(str(self.data)):
-            self.data = load_data(self.data)
+        if os.path.isfile(str(self._peek('data'))):
+            self.data = load_data(self._peek('data'))
 
-        if self.data is not None:
-            self.data = sanitize_data(self.data)
-            self.n_contigs = self.data.shape[0]
+        if self._peek('data') is not None:
+            self.data = sanitize_data(self._peek('data'))
+            self.n_contigs = self._peek('data').shape[0]
             if metadata is None:
                 if initialize is True:
-                    update_metadata(self, **kwargs)
-                try:
-                    self.n_obs = self.metadata.shape[0]
-                except:
-                    self.n_obs = 0
+                    update_metadata(self, lazy=lazy, **kwargs)
+                if self._lazy:
+                    self.n_obs = len(self._metadata_builder.index)
+                else:
+                    try:
+                        self.n_obs = self._peek('metadata').shape[0]
+                    except:
+                        self.n_obs = 0
             else:
                 self.metadata = metadata
-                self.n_obs = self.metadata.shape[0]
+                self.n_obs = self._peek('metadata').shape[0]
         else:
             self.n_contigs = 0
             self.n_obs = 0
 
+    distance = _slot('distance')
+    edges = _slot('edges')
+    layout = _slot('layout')
+    graph = _slot('graph')
+    germline = _slot('germline')
+    clone_index = _slot('clone_index')
+
+    def _get_slot(self, name: str, expose: bool = True):
+        value = self.__dict__.get('_' + name)
+        if isinstance(value, _Shared):
+            # copied on first access while other copies still share it
+            value = value.take()
+            self.__dict__['_' + name] = value
+        if expose:
+            # the caller may keep and modify it, so `copy` can no longer share it
+            self.__dict__.setdefault('_exposed', set()).add(name)
+        return (value)
+
+    def _set_slot(self, name: str, value):
+        previous = self.__dict__.get('_' + name)
+        if isinstance(previous, _Shared):
+            previous.release()
+        self.__dict__['_' + name] = value
+        self.__dict__.setdefault('_exposed', set()).discard(name)
+
+    def _peek(self, name: str):
+        """
+        Value of a slot for reading within the package, without copying or exposing it, so that it stays shared
+        with copies. The value must not be modified or handed out.
+        """
+        if name == 'metadata':
+            self._refresh_metadata()
+        value = self.__dict__.get('_' + name)
+        if isinstance(value, _Shared):
+            return (value.value)
+        return (value)
+
+    @property
+    def data(self) -> pd.DataFrame:
+        """Contig-indexed AIRR table."""
+        return (self._get_slot('data'))
+
+    @data.setter
+    def data(self, value: pd.DataFrame):
+        if self._compact is not None and isinstance(value, pd.DataFrame):
+            value = compact_data(value, **self._compact)
+        self._set_slot('data', value)
+        # cells and chains of the contigs are recomputed on the next query
+        self.querier = None
+
+    @property
+    def metadata(self) -> pd.DataFrame:
+        """
+        Cell-indexed table. For lazy `Dandelion` objects, it is built on first access and rebuilt once `.data`
+        changes.
+        """
+        self._refresh_metadata()
+        return (self._get_slot('metadata'))
+
+    @metadata.setter
+    def metadata(self, value: pd.DataFrame):
+        self._set_slot('metadata', value)
+        self._lazy = False
+
+    def _refresh_metadata(self):
+        """Build the metadata of a lazy `Dandelion` object if it is missing or out of date."""
+        if self._lazy and (self.__dict__.get('_metadata') is None
+                           or self._metadata_builder.stale()):
+            self._set_slot('metadata', self._metadata_builder.columns())
+
+    def __getstate__(self) -> Dict:
+        return ({
+            k: v.value if isinstance(v, _Shared) else v
+            for k, v in self.__dict__.items()
+        })
+
+    def __setstate__(self, state: Dict):
+        # objects pickled before the slots became properties
+        for k in _SHARED_SLOTS:
+            if k in state:
+                state['_' + k] = state.pop(k)
+        state.setdefault('_metadata_builder', None)
+        state.setdefault('_lazy', False)
+        state.setdefault('_compact', None)
+        self.__dict__.update(state)
+
+    def get_metadata(self,
+                     keys: Optional[Union[Sequence, str]] = None
+                     ) -> Union[pd.DataFrame, pd.Series]:
+        """
+        Retrieve columns of the `.metadata` slot.
+
+        For lazy `Dandelion` objects, only the requested columns are computed if the metadata has not been
+        materialised yet.
+
+        Parameters
+        ----------
+        self : Dandelion
+            `Dandelion` object.
+        keys : str, sequence, Optional
+            column name(s) in `.metadata`. None returns the whole `.metadata`.
+
+        Returns
+        -------
+        `pandas.Series` for a single column name, otherwise `pandas.DataFrame`.
+        """
+        if keys is None:
+            return (self.metadata)
+        builder = self._metadata_builder
+        if self._lazy and (self._metadata is None or builder.stale()):
+            out = builder.columns([keys] if type(keys) is str else keys)
+        else:
+            out = self._peek('metadata')[[keys] if type(keys) is str else keys]
+        return (out[keys] if type(keys) is str else out)
+
     def _gen_repr(self, n_obs, n_contigs) -> str:
         # inspire by AnnData's function
         descr = f"Dandelion class object with n_obs = {n_obs} and n_contigs = {n_contigs}"
         for attr in ["data", "metadata", "distance", "edges"]:
             try:
-                keys = getattr(self, attr).keys()
+                keys = self._peek(attr).keys()
             except:
                 keys = []
             if len(keys) > 0:
                 descr += f"\n    {attr}: {str(list(keys))[1:-1]}"
             else:
                 descr += f"\n    {attr}: {str(None)}"
-        if self.layout is not None:
-            descr += f"\n    layout: {', '.join(['layout for '+ str(len(x)) + ' vertices' for x in (self.layout[0], self.layout[1])])}"
+        layout, graph = self._peek('layout'), self._peek('graph')
+        if layout is not None:
+            descr += f"\n    layout: {', '.join(['layout for '+ str(len(x)) + ' vertices' for x in (layout[0], layout[1])])}"
         else:
             descr += f"\n    layout: {str(None)}"
-        if self.graph is not None:
-            descr += f"\n    graph: {', '.join(['networkx graph of '+ str(len(x)) + ' vertices' for x in (self.graph[0], self.graph[1])])} "
+        if graph is not None:
+            descr += f"\n    graph: {', '.join(['networkx graph of '+ str(len(x)) + ' vertices' for x in (graph[0], graph[1])])} "
         else:
             descr += f"\n    graph: {str(None)}"
         return descr
@@ -101,9 +292,48 @@ class Dandelion:
         # inspire by AnnData's function
         return self._gen_repr(self.n_obs, self.n_contigs)
 
+    def compact(self,
+                max_categories: float = 0.1,
+                min_length: int = 100,
+                store: Optional[str] = None):
+        """
+        Store `.data` compactly, to hold large cohorts in memory.
+
+        Gene calls and other columns with few unique values are stored as categoricals and long sequences as
+        Arrow string arrays, optionally offloaded to disk and read back on access. `.data` assigned later,
+        e.g. by `tl` and `pp` functions, is compacted in the same way.
+
+        Parameters
+        ----------
+        self : Dandelion
+            `Dandelion` object.
+        max_categories : float
+            largest number of unique values, as a fraction of the contigs, for a column to become categorical.
+        min_length : int
+            smallest mean length of the strings in a column to store them as string arrays.
+        store : str, Optional
+            folder to offload the long strings to, one `<column>.arrow` file per column, replaced whenever `.data`
+            is compacted again. The folder belongs to this object and its copies.
+
+        Returns
+        -------
+        `Dandelion` object with compact `.data`.
+        """
+        self._compact = {
+            'max_categories': max_categories,
+            'min_length': min_length,
+            'store': store
+        }
+        self.data = self.data
+
     def copy(self):
         """
-        Performs a deep copy of all slots in `Dandelion` class.
+        Copy of all slots in `Dandelion` class.
+
+        Slots that have not been accessed since they were set are shared with the copy and only copied when
+        either object first accesses them, so slots that are replaced, e.g. by `tl.generate_network`, are never
+        copied. Slots that have been accessed are copied right away, as they may be modified through the
+        references handed out. Data frames are copied without duplicating the strings in them.
 
         Parameters
         ----------
@@ -112,9 +342,27 @@ class Dandelion:
 
         Returns
         -------
-        a deep copy of `Dandelion` class.
+        a copy of `Dandelion` class.
         """
-        return copy.deepcopy(self)
+        out = Dandelion.__new__(Dandelion)
+        out.__dict__.update(self.__dict__)
+        out._exposed = set()
+        for k in _SHARED_SLOTS:
+            value = self.__dict__.get('_' + k)
+            if value is None:
+                continue
+            if k in self.__dict__.get('_exposed', ()):
+                # may be modified through references handed out before the copy
+                out.__dict__['_' + k] = _copy_slot(value)
+                continue
+            if not isinstance(value, _Shared):
+                value = _Shared(value)
+                self.__dict__['_' + k] = value
+            value.owners += 1
+            out.__dict__['_' + k] = value
+        if self._metadata_builder is not None:
+            out._metadata_builder = self._metadata_builder.copy(out)
+        return (out)
 
     def update_plus(
         self,
@@ -185,9 +433,9 @@ class Dandelion:
             'v_sequence_alignment_aa', 'd_sequence_alignment_aa',
             'j_sequence_alignment_aa'
         ]
-        mutations = [x for x in mutations if x in self.data]
-        vdjlengths = [x for x in vdjlengths if x in self.data]
-        seqinfo = [x for x in seqinfo if x in self.data]
+        mutations = [x for x in mutations if x in self._peek('data')]
+        vdjlengths = [x for x in vdjlengths if x in self._peek('data')]
+        seqinfo = [x for x in seqinfo if x in self._peek('data')]
 
         if option == 'all':
             if len(mutations) > 0:
@@ -334,35 +582,80 @@ class Dandelion:
                   deep=('Updated Dandelion object: \n'
                         '   \'germline\', updated germline reference\n'))
 
-    def write_pkl(self, filename: str = 'dandelion_data.pkl.pbz2', **kwargs):
+    def write_pkl(self,
+                  filename: str = 'dandelion_data.pkl.pbz2',
+                  compression: Optional[Literal['bz2', 'gzip', 'zstd', 'lz4',
+                                                'none']] = None,
+                  compression_level: Optional[int] = None,
+                  **kwargs):
         """
         Writes a `Dandelion` class to .pkl format.
 
+        zstd and lz4 pickles use pickle protocol 5 and write the buffers of arrays, e.g. numeric columns and
+        distance matrices, after the pickle rather than copying them into it. zstd compresses on all cores.
+        `read_pkl` detects the compression from the file.
+
         Parameters
         ----------
         filename
             path to `.pkl` file.
+        compression : str, Optional
+            'bz2', 'gzip', 'zstd', 'lz4' or 'none'. None picks it from the extension of `filename`: .pbz2, .gz,
+            .zst or .lz4, and no compression otherwise.
+        compression_level : int, Optional
+            level of compression. None uses 9 for bz2 and gzip, 3 for zstd and 0 for lz4.
         **kwargs
             passed to `_pickle`.
         """
-        if isBZIP(filename):
+        if compression is None:
+            compression = _PICKLE_EXTENSIONS.get(
+                str(filename).split('.')[-1], 'none')
+        if compression == 'bz2':
+            level = 9 if compression_level is None else compression_level
             try:
-                with bz2.BZ2File(filename, 'wb') as f:
+                with bz2.BZ2File(filename, 'wb', compresslevel=level) as f:
                     cPickle.dump(self, f, **kwargs)
             except:
-                with bz2.BZ2File(filename, 'wb') as f:
+                with bz2.BZ2File(filename, 'wb', compresslevel=level) as f:
                     cPickle.dump(self, f, protocol=4, **kwargs)
-        elif isGZIP(filename):
+        elif compression == 'gzip':
+            level = 9 if compression_level is None else compression_level
             try:
-                with gzip.open(filename, 'wb') as f:
+                with gzip.open(filename, 'wb', compresslevel=level) as f:
                     cPickle.dump(self, f, **kwargs)
             except:
-                with gzip.open(filename, 'wb') as f:
+                with gzip.open(filename, 'wb', compresslevel=level) as f:
                     cPickle.dump(self, f, protocol=4, **kwargs)
-        else:
+        elif compression == 'zstd':
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError(
+                    'Please install zstandard. pip install zstandard')
+            compressor = zstandard.ZstdCompressor(
+                level=3 if compression_level is None else compression_level,
+                threads=-1)
+            with open(filename, 'wb') as fh, compressor.stream_writer(
+                    fh, closefd=False) as f:
+                _dump_buffers(self, f, **kwargs)
+        elif compression == 'lz4':
+            try:
+                import lz4.frame
+            except ImportError:
+                raise ImportError('Please install lz4. pip install lz4')
+            with lz4.frame.open(filename,
+                                'wb',
+                                compression_level=0 if compression_level
+                                is None else compression_level) as f:
+                _dump_buffers(self, f, **kwargs)
+        elif compression == 'none':
             f = open(filename, 'wb')
             cPickle.dump(self, f, **kwargs)
             f.close()
+        else:
+            raise ValueError(
+                'compression should be one of bz2, gzip, zstd, lz4 or none, not {}.'
+                .format(compression))
 
     def write_airr(self, filename: str = 'dandelion_airr.tsv', **kwargs):
         """
@@ -375,7 +668,7 @@ class Dandelion:
         **kwargs
             passed to `_pickle`.
         """
-        data = sanitize_data(self.data)
+        data = sanitize_data(self._peek('data'))
         data.to_csv(filename, sep='\t', index=False, **kwargs)
 
     def write_h5(self,
@@ -403,8 +696,9 @@ class Dandelion:
             https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.to_hdf.html
         compression : str, Optional
             same call as complib. Just a convenience option.
-        compression_opts : {0-9}, Optional
-            Specifies a compression level for data. A value of 0 disables compression.
+        compression_level : {0-9}, Optional
+            Specifies a compression level for data. A value of 0 disables compression. Distances and graphs are
+            written as gzip-compressed HDF5 datasets at this level; layouts are not compressed.
         **kwargs
             passed to `pd.DataFrame.to_hdf`.
         """
@@ -413,6 +707,14 @@ class Dandelion:
         else:
             compression_level = compression_level
 
+        # backed slots of objects from `read_h5` may be read from the file that is about to be overwritten
+        distance = {
+            d: self.distance[d]
+            for d in self.distance
+        } if keep_distance and self.distance is not None else None
+        layout = [_layout_arrays(l) for l in self.layout
+                  ] if self.layout is not None else []
+
         # a little hack to overwrite the existing file?
         with h5py.File(filename, "w") as hf:
             for datasetname in hf.keys():
@@ -430,7 +732,7 @@ class Dandelion:
             )
 
         # now to actually saving
-        data = self.data.copy()
+        data = expand_data(self._peek('data').copy())
         data = sanitize_data(data)
         data = sanitize_data_for_saving(data)
         data.to_hdf(filename,
@@ -439,8 +741,8 @@ class Dandelion:
                     complevel=compression_level,
                     **kwargs)
 
-        if self.metadata is not None:
-            metadata = self.metadata.copy()
+        if self._peek('metadata') is not None:
+            metadata = self._peek('metadata').copy()
             for col in metadata.columns:
                 weird = (metadata[[col]].applymap(type) !=
                          metadata[[col]].iloc[0].apply(type)).any(axis=1)
@@ -465,46 +767,30 @@ class Dandelion:
         except:
             pass
 
-        graph_counter = 0
-        try:
-            for g in self.graph:
-                G = nx.to_pandas_adjacency(g, nonedge=np.nan)
-                G.to_hdf(filename,
-                         "graph/graph_" + str(graph_counter),
-                         complib=comp,
-                         complevel=compression_level,
-                         **kwargs)
-                graph_counter += 1
-        except:
-            pass
-
-        if keep_distance:
-            try:
-                for d in self.distance:
-                    # how to make this faster?
-                    dat = pd.DataFrame(self.distance[d].toarray())
-                    dat.to_hdf(filename,
-                               "distance/" + d,
-                               complib=comp,
-                               complevel=compression_level,
-                               **kwargs)
-            except:
-                pass
+        for k in getattr(self, 'clone_index', {}):
+            self.clone_index[k].to_hdf(filename,
+                                       "clone_index/" + k,
+                                       complib=comp,
+                                       complevel=compression_level,
+                                       **kwargs)
 
         with h5py.File(filename, "a") as hf:
-            try:
-                layout_counter = 0
-                for l in self.layout:
-                    try:
-                        hf.create_group('layout/layout_' + str(layout_counter))
-                    except:
-                        pass
-                    for k in l.keys():
-                        hf['layout/layout_' +
-                           str(layout_counter)].attrs[k] = l[k]
-                    layout_counter += 1
-            except:
-                pass
+            # graphs as edge lists and distances as csr arrays, never densified
+            if self.graph is not None:
+                for i, g in enumerate(self.graph):
+                    _write_graph_h5(hf, 'graph/graph_' + str(i), g,
+                                    compression_level)
+            if distance is not None:
+                for d in distance:
+                    _write_sparse_h5(hf, 'distance/' + d, distance[d],
+                                     compression_level)
+
+            # layouts uncompressed and contiguous, so that `read_h5` can memory-map them
+            for i, (nodes, coordinates) in enumerate(layout):
+                group = hf.create_group('layout/layout_' + str(i))
+                group.attrs['format'] = 'coordinates'
+                group.create_dataset('nodes', data=nodes)
+                group.create_dataset('coordinates', data=coordinates)
 
             if len(self.germline) > 0:
                 try:
@@ -519,14 +805,248 @@ class Dandelion:
 
     write = write_h5ddl = write_h5  # shortcut
 
+    def write_parquet(self,
+                      path: str = 'dandelion_data.parquet',
+                      compression: str = 'zstd',
+                      row_group_size: int = 100000):
+        """
+        Writes a `Dandelion` class to a directory of parquet files, one per slot.
+
+        data, metadata, edges, germline and clone_index are written as tables, layouts as tables of coordinates,
+        graphs as node and edge lists and distances as sparse (row, column, value) tables. The threshold and the
+        names of the slots are kept in a `dandelion.json` manifest. Read it back with `read_parquet`, which can
+        read only some of the slots, data columns and row groups.
+
+        Parameters
+        ----------
+        path : str
+            path to the directory. It is replaced if it holds a previously written `Dandelion`.
+        compression : str
+            parquet compression codec, e.g. 'zstd', 'snappy', 'gzip' or 'none'.
+        row_group_size : int
+            number of contigs per row group of the data, the unit of row-selective reads. The contigs of a cell
+            are never split across row groups: the data are written with the contigs of each cell together, in
+            order of first appearance, and a row group holds the cells whose first contig falls in it.
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('Please install pyarrow. pip install pyarrow')
+
+        if os.path.isfile(os.path.join(path, _PARQUET_MANIFEST)):
+            shutil.rmtree(path)
+        elif os.path.isdir(path) and len(os.listdir(path)) > 0:
+            raise FileExistsError(
+                '{} is a directory that is not empty.'.format(path))
+        manifest = {'slots': {}}
+
+        def write_table(df: pd.DataFrame,
+                        name: str,
+                        index: bool = True,
+                        groups: Optional[np.ndarray] = None):
+            os.makedirs(os.path.dirname(os.path.join(path, name)),
+                        exist_ok=True)
+            table = pa.Table.from_pandas(_arrow_safe(df),
+                                         preserve_index=index)
+            if groups is None:
+                pq.write_table(table,
+                               os.path.join(path, name),
+                               compression=compression,
+                               row_group_size=row_group_size)
+                return (name)
+            # one row group per run of rows in `groups`
+            bounds = np.flatnonzero(np.diff(groups)) + 1
+            with pq.ParquetWriter(os.path.join(path, name),
+                                  table.schema,
+                                  compression=compression) as writer:
+                for start, end in zip(np.r_[0, bounds],
+                                      np.r_[bounds, len(groups)]):
+                    writer.write_table(table.slice(start, end - start),
+                                       row_group_size=end - start)
+            return (name)
+
+        # sequence_id is kept as a column, so the index is not written twice
+        data = sanitize_data_for_saving(
+            sanitize_data(expand_data(self._peek('data'))))
+        # contigs of a cell together, so that row groups don't split cells
+        # missing cell ids as one group rather than the -1 sentinel, which would sort first
+        cells = pd.factorize(data['cell_id'].fillna(''))[0]
+        data = data.iloc[np.argsort(cells, kind='stable')]
+        cells = np.sort(cells)
+        first = np.searchsorted(cells, cells)
+        manifest['slots']['data'] = write_table(
+            data, 'data.parquet', False, first // max(row_group_size, 1))
+        if self._peek('metadata') is not None:
+            manifest['slots']['metadata'] = write_table(
+                self._peek('metadata'), 'metadata.parquet')
+        if self.edges is not None:
+            manifest['slots']['edges'] = write_table(
+                self.edges.drop('index', axis=1, errors='ignore'),
+                'edges.parquet', False)
+        if len(self.germline) > 0:
+            manifest['slots']['germline'] = write_table(
+                pd.DataFrame({
+                    'gene': list(self.germline.keys()),
+                    'sequence': list(self.germline.values())
+                }), 'germline.parquet', False)
+        if self.layout is not None:
+            manifest['slots']['layout'] = [
+                write_table(
+                    pd.DataFrame.from_dict(l,
+                                           orient='index').rename(columns=str),
+                    'layout/layout_{}.parquet'.format(i))
+                for i, l in enumerate(self.layout)
+            ]
+        if self.graph is not None:
+            manifest['slots']['graph'] = [{
+                'nodes':
+                write_table(pd.DataFrame({'node': list(g.nodes)}),
+                            'graph/graph_{}_nodes.parquet'.format(i), False),
+                'edges':
+                write_table(nx.to_pandas_edgelist(g),
+                            'graph/graph_{}_edges.parquet'.format(i), False)
+            } for i, g in enumerate(self.graph)]
+        if self.distance is not None and len(self.distance) > 0:
+            manifest['slots']['distance'] = {}
+            for i, d in enumerate(self.distance):
+                # explicit zeros are kept, they are distances between identical sequences
+                coo = scipy.sparse.coo_matrix(self.distance[d])
+                manifest['slots']['distance'][d] = {
+                    'file':
+                    write_table(
+                        pd.DataFrame({
+                            'row': coo.row,
+                            'col': coo.col,
+                            'value': coo.data
+                        }), 'distance/distance_{}.parquet'.format(i), False),
+                    'shape':
+                    list(coo.shape)
+                }
+        if len(getattr(self, 'clone_index', {})) > 0:
+            manifest['slots']['clone_index'] = {
+                k: write_table(self.clone_index[k],
+                               'clone_index/clone_index_{}.parquet'.format(i))
+                for i, k in enumerate(self.clone_index)
+            }
+        if self.threshold is not None:
+            manifest['threshold'] = float(self.threshold)
+        with open(os.path.join(path, _PARQUET_MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=1)
+
+
+def _dump_buffers(obj, f, **kwargs):
+    """
+    Pickle with protocol 5, writing the buffers of arrays after the pickle instead of copying them into it.
+
+    Written are `_PICKLE_BUFFERS`, the sizes of the pickle and of each buffer, the pickle and then the buffers.
+    """
+    buffers = []
+    payload = cPickle.dumps(obj,
+                            protocol=5,
+                            buffer_callback=buffers.append,
+                            **kwargs)
+    raw = [b.raw() for b in buffers]
+    f.write(_PICKLE_BUFFERS)
+    f.write(struct.pack('<QQ', len(payload), len(raw)))
+    f.write(struct.pack('<{}Q'.format(len(raw)), *[r.nbytes for r in raw]))
+    f.write(payload)
+    for r in raw:
+        f.write(r)
+
+
+def _write_array_h5(group: h5py.Group, name: str, values: np.ndarray,
+                    compression_level: int):
+    """Write an array as a chunked, gzip-compressed dataset; empty arrays can't be chunked."""
+    if len(values) > 0 and compression_level > 0:
+        group.create_dataset(name,
+                             data=values,
+                             chunks=True,
+                             compression='gzip',
+                             compression_opts=compression_level,
+                             shuffle=True)
+    else:
+        group.create_dataset(name, data=values)
+
+
+def _write_sparse_h5(hf: h5py.File, name: str, matrix, compression_level: int):
+    """Write a sparse matrix as the indptr, indices and data arrays of its csr form, and its shape."""
+    matrix = scipy.sparse.csr_matrix(matrix)
+    group = hf.create_group(name)
+    group.attrs['format'] = 'csr'
+    group.attrs['shape'] = matrix.shape
+    for key in ['indptr', 'indices', 'data']:
+        _write_array_h5(group, key, getattr(matrix, key), compression_level)
+
+
+def _write_graph_h5(hf: h5py.File, name: str, graph: nx.Graph,
+                    compression_level: int):
+    """Write a graph as its nodes and an edge list, with edges as positions in the nodes."""
+    group = hf.create_group(name)
+    group.attrs['format'] = 'edgelist'
+    nodes = list(graph.nodes)
+    position = {n: i for i, n in enumerate(nodes)}
+    edges = nx.to_pandas_edgelist(graph)
+    _write_array_h5(group, 'nodes',
+                    np.array([str(n) for n in nodes], dtype=object).astype(
+                        h5py.string_dtype()), compression_level)
+    for key in ['source', 'target']:
+        _write_array_h5(
+            group, key,
+            np.array([position[n] for n in edges[key]], dtype=np.int64),
+            compression_level)
+    attrs = [c for c in edges if c not in ['source', 'target']]
+    group.attrs['edge_attrs'] = attrs
+    for key in attrs:
+        _write_array_h5(group, 'edge_' + key, edges[key].values,
+                        compression_level)
+
+
+def _layout_arrays(layout: Dict) -> Tuple[np.ndarray, np.ndarray]:
+    """Node names and coordinates of a layout, copied from memory-mapped layouts."""
+    nodes = np.array([str(n) for n in layout],
+                     dtype=object).astype(h5py.string_dtype())
+    coordinates = np.array([layout[n] for n in layout], dtype=np.float64)
+    if coordinates.ndim < 2:
+        # empty layouts
+        coordinates = coordinates.reshape(len(nodes), 2)
+    return (nodes, coordinates)
+
+
+def _arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """Turn the values of object columns mixing types into str, as arrow columns hold one type."""
+    mixed = [
+        c for c in df if df[c].dtype == object
+        and pd.api.types.infer_dtype(df[c], skipna=True).startswith('mixed')
+    ]
+    if len(mixed) == 0:
+        return (df)
+    df = df.copy()
+    for c in mixed:
+        df[c] = df[c].where(df[c].isna(), df[c].astype(str))
+    return (df)
+
 
 class Query:
+    """
+    Aggregate contig-level values into cell-level values.
+
+    Contigs are grouped by cell and chain once on initialisation, so that each `retrieve` call only takes a
+    few vectorised groupby passes over a single column.
+    """
     def __init__(self, data):
         self.data = data
-        self.Cell = Tree()
-        for contig, row in data.iterrows():
-            self.Cell[Contig(row).contig['cell_id']][Contig(
-                row).contig].value = 1
+        locus = data['locus']
+        chain = np.full(data.shape[0], -1, dtype=np.int8)
+        chain[locus.isin(['IGH', 'TRB', 'TRD']).values] = 0
+        chain[locus.isin(['IGK', 'IGL', 'TRA', 'TRG']).values] = 1
+        # cells in order of first appearance
+        cell, self.cells = pd.factorize(data['cell_id'])
+        self.cells = pd.Index(self.cells)
+        self.contigs = pd.DataFrame({'cell': cell, 'chain': chain})
+        self.contigs['rank'] = self.contigs.groupby(['cell',
+                                                     'chain']).cumcount() + 1
+        self.keep = ((cell >= 0) & (chain >= 0))
 
     @property
     def querydtype(self):
@@ -534,91 +1054,67 @@ class Query:
 
     def retrieve(self, query, retrieve_mode):
         self.query = query
-        ret = {}
-        for cell in self.Cell:
-            cols, vdj, vj = {}, [], []
-            for contig in self.Cell[cell]:
-                if isinstance(contig, dict):
-                    if contig['locus'] in ['IGH', 'TRB', 'TRD']:
-                        vdj.append(contig[query])
-                    elif contig['locus'] in ['IGK', 'IGL', 'TRA', 'TRG']:
-                        vj.append(contig[query])
+        ncells = len(self.cells)
+        contigs = self.contigs.assign(value=self.data[query].values)[self.keep]
+        present_ = contigs['value'].notnull() & (contigs['value'] != '')
+        suffix = {0: '_VDJ', 1: '_VJ'}
+        cols = {}
+        if retrieve_mode in [
+                'split and unique only', 'merge and unique only', 'merge'
+        ]:
             if retrieve_mode == 'split and unique only':
-                if len(vdj) > 0:
-                    cols.update({
-                        query + '_VDJ':
-                        '|'.join(
-                            str(x) for x in list(dict.fromkeys(vdj))
-                            if present(x))
-                    })
-                if len(vj) > 0:
-                    cols.update({
-                        query + '_VJ':
-                        '|'.join(
-                            str(x) for x in list(dict.fromkeys(vj))
-                            if present(x))
-                    })
-            elif retrieve_mode == 'merge and unique only':
-                cols.update({
-                    query:
-                    '|'.join(str(x) for x in set(vdj + vj) if present(x))
-                })
-            elif retrieve_mode == 'split and sum':
-                if len(vdj) > 0:
-                    cols.update({
-                        query + '_VDJ':
-                        np.sum([float(x) for x in vdj if present(x)])
-                    })
-                else:
-                    cols.update({query + 'VDJ': np.nan})
-                if len(vj) > 0:
-                    cols.update({
-                        query + '_VJ':
-                        np.sum([float(x) for x in vj if present(x)])
-                    })
-                else:
-                    cols.update({query + 'VJ': np.nan})
-            elif retrieve_mode == 'split and average':
-                if len(vdj) > 0:
-                    cols.update({
-                        query + '_VDJ':
-                        np.mean([float(x) for x in vdj if present(x)])
-                    })
-                else:
-                    cols.update({query + '_VDJ': np.nan})
-                if len(vj) > 0:
-                    cols.update({
-                        query + '_VJ':
-                        np.mean([float(x) for x in vj if present(x)])
-                    })
-                else:
-                    cols.update({query + '_VJ': np.nan})
-            elif retrieve_mode == 'merge':
-                cols.update(
-                    {query: '|'.join(x for x in set(vdj + vj) if present(x))})
-            elif retrieve_mode == 'split':
-                if len(vdj) > 0:
-                    for i in range(1, len(vdj) + 1):
-                        cols.update({query + '_VDJ_' + str(i): vdj[i - 1]})
-                if len(vj) > 0:
-                    for i in range(1, len(vj) + 1):
-                        cols.update({query + '_VJ_' + str(i): vj[i - 1]})
-            elif retrieve_mode == 'sum':
-                cols.update({
-                    query:
-                    np.sum([float(x) for x in vdj + vj if present(x)])
-                })
-                if not present(cols[query]):
-                    cols.update({query: np.nan})
-            elif retrieve_mode == 'average':
-                cols.update({
-                    query:
-                    np.mean([float(x) for x in vdj + vj if present(x)])
-                })
-                if not present(cols[query]):
-                    cols.update({query: np.nan})
-            ret.update({cell: cols})
-        out = pd.DataFrame.from_dict(ret, orient='index')
+                # a column per chain, if any cell has that chain
+                first = contigs.groupby('chain')['cell'].min().sort_values(
+                    kind='stable')
+                groups = [(query + suffix[c], contigs['chain'] == c)
+                          for c in first.index]
+            else:
+                groups = [(query, pd.Series(True, index=contigs.index))]
+            for name, mask in groups:
+                tmp = contigs[mask & present_].drop_duplicates(
+                    ['cell', 'value'])
+                cols[name] = _join_by_cell(tmp['cell'].values,
+                                           tmp['value'].astype(str).values)
+        elif retrieve_mode in [
+                'split and sum', 'split and average', 'sum', 'average'
+        ]:
+            func = 'sum' if retrieve_mode.endswith('sum') else 'mean'
+            if retrieve_mode.startswith('split'):
+                groups = [(query + suffix[c], contigs['chain'] == c)
+                          for c in [0, 1]]
+            else:
+                groups = [(query, pd.Series(True, index=contigs.index))]
+            for name, mask in groups:
+                tmp = contigs[mask & present_]
+                agg = tmp['value'].astype(float).groupby(tmp['cell']).agg(func)
+                if func == 'sum':
+                    # the sum of no values is 0 for cells that have the chain
+                    has = np.arange(ncells) if name == query else np.unique(
+                        contigs.loc[mask, 'cell'])
+                    agg = agg.reindex(has).fillna(0.)
+                cols[name] = agg
+        elif retrieve_mode == 'split':
+            # as objects, so that to_numeric below gives ints for columns without missing values
+            tmp = contigs.set_index(['cell', 'chain', 'rank'])['value'].astype(
+                object).unstack(['chain', 'rank'])
+            # columns ordered as they are first encountered going through the cells
+            first = contigs.groupby(['chain', 'rank'])['cell'].min()
+            order = sorted(tmp.columns,
+                           key=lambda x: (first[x], x[0], x[1]))
+            for c, r in order:
+                cols[query + suffix[c] + '_' + str(r)] = tmp[(c, r)]
+        if retrieve_mode in ['split and unique only', 'split']:
+            # only cells with contigs of either chain
+            rows = np.unique(contigs['cell'])
+        else:
+            rows = np.arange(ncells)
+        out = pd.DataFrame(
+            {
+                k: np.asarray(v.reindex(rows), dtype=object)
+                if v.dtype == object else v.reindex(rows).values
+                for k, v in cols.items()
+            },
+            index=self.cells[rows])
         if retrieve_mode not in [
                 'split and sum', 'split and average', 'sum', 'average'
         ]:
@@ -633,205 +1129,104 @@ class Query:
         return (out)
 
 
-def initialize_metadata(self, cols: Sequence, clonekey: str,
-                        collapse_alleles: bool) -> Dandelion:
-    init_dict = {}
-    for col in cols:
-        init_dict.update(
-            {col: {
-                'query': col,
-                'retrieve_mode': 'split and unique only',
-            }})
-    if clonekey in init_dict:
-        init_dict.update({
-            clonekey: {
-                'query': clonekey,
-                'retrieve_mode': 'merge and unique only',
-            }
-        })
-    if 'sample_id' in init_dict:
-        init_dict.update({
-            'sample_id': {
-                'query': 'sample_id',
-                'retrieve_mode': 'merge and unique only',
-            }
-        })
-    if self.querier is None:
-        querier = Query(self.data)
-        self.querier = querier
-    else:
-        querier = self.querier
-
-    meta_ = defaultdict(dict)
-    for k, v in init_dict.copy().items():
-        if all_missing(self.data[k]):
-            init_dict.pop(k)
-            continue
-        meta_[k] = querier.retrieve(**v)
-        if k in ['duplicate_count', 'umi_count', 'mu_count', 'mu_freq']:
-            v.update({'retrieve_mode': 'split'})
-            meta_[k + '_split'] = querier.retrieve(**v)
-    tmp_metadata = pd.concat(meta_.values(), axis=1, join="inner")
-
-    if 'locus_VDJ' in tmp_metadata:
-        suffix_h = '_VDJ'
-        suffix_l = '_VJ'
-    else:
-        suffix_h = ''
-        suffix_l = ''
-
-    if clonekey in init_dict:
-        tmp_metadata[str(clonekey)] = tmp_metadata[str(clonekey)].replace(
-            '', 'unassigned')
-
-        clones = tmp_metadata[str(clonekey)].str.split('|', expand=False)
-        tmpclones = []
-        for i in clones:
-            while 'unassigned' in i:
-                i.remove('unassigned')
-                if len(i) == 1:
-                    break
-            tmpclones.append(i)
-        tmpclones = [
-            '|'.join(sorted(list(set(x)), key=cmp_to_key(cmp_str_emptylast)))
-            for x in tmpclones
-        ]
-        tmpclonesdict = dict(zip(tmp_metadata.index, tmpclones))
-        tmp_metadata[str(clonekey)] = pd.Series(tmpclonesdict)
-        tmp = tmp_metadata[str(clonekey)].str.split('|', expand=True).stack()
-        tmp = tmp.reset_index(drop=False)
-        tmp.columns = ['cell_id', 'tmp', str(clonekey)]
-        clone_size = tmp[str(clonekey)].value_counts()
-        if "" in clone_size.index:
-            clone_size = clone_size.drop("", axis=0)
-        clonesize_dict = dict(clone_size)
-        size_of_clone = pd.DataFrame.from_dict(clonesize_dict, orient='index')
-        size_of_clone.reset_index(drop=False, inplace=True)
-        size_of_clone.columns = [str(clonekey), 'clone_size']
-        size_of_clone[str(clonekey) + '_by_size'] = size_of_clone.index + 1
-        size_dict = dict(
-            zip(size_of_clone[clonekey],
-                size_of_clone[str(clonekey) + '_by_size']))
-        size_dict.update({'': 'unassigned'})
-        tmp_metadata[str(clonekey) + '_by_size'] = [
-            '|'.join(
-                sorted(list(set([str(size_dict[c_]) for c_ in c.split('|')]))))
-            if len(c.split('|')) > 1 else str(size_dict[c])
-            for c in tmp_metadata[str(clonekey)]
-        ]
-        tmp_metadata[str(clonekey) +
-                     '_by_size'] = tmp_metadata[str(clonekey) +
-                                                '_by_size'].astype('category')
-        tmp_metadata = tmp_metadata[
-            [str(clonekey), str(clonekey) + '_by_size'] + [
-                cl for cl in tmp_metadata if cl not in
-                [str(clonekey), str(clonekey) + '_by_size']
-            ]]
-
-    for i in tmp_metadata.index:
-        if 'locus' + suffix_h in tmp_metadata:
-            if not check_missing(tmp_metadata.loc[i, 'locus' + suffix_h]):
-                if 'locus' + suffix_l in tmp_metadata:
-                    if not check_missing(tmp_metadata.loc[i,
-                                                          'locus' + suffix_l]):
-                        tmp_metadata.at[i, 'locus_status'] = tmp_metadata.loc[
-                            i, 'locus' +
-                            suffix_h] + ' + ' + tmp_metadata.loc[i, 'locus' +
-                                                                 suffix_l]
-                    else:
-                        if '|' in tmp_metadata.at[i, 'locus' + suffix_h]:
-                            tmp_metadata.at[i, 'locus_status'] = 'Multi'
-                        else:
-                            tmp_metadata.at[i,
-                                            'locus_status'] = tmp_metadata.loc[
-                                                i,
-                                                'locus' + suffix_h] + '_only'
-                else:
-                    tmp_metadata.at[i, 'locus_status'] = tmp_metadata.loc[
-                        i, 'locus' + suffix_h] + '_only'
-            else:
-                if 'locus' + suffix_l in tmp_metadata:
-                    if not check_missing(tmp_metadata.loc[i,
-                                                          'locus' + suffix_l]):
-                        if '|' in tmp_metadata.at[i, 'locus' + suffix_l]:
-                            tmp_metadata.at[i, 'locus_status'] = 'Multi'
-                        else:
-                            tmp_metadata.at[i,
-                                            'locus_status'] = tmp_metadata.loc[
-                                                i,
-                                                'locus' + suffix_l] + '_only'
-                    else:
-                        tmp_metadata.at[i, 'locus_status'] = 'unassigned'
-                else:
-                    tmp_metadata.at[i, 'locus_status'] = 'unassigned'
-        else:
-            if 'locus' + suffix_l in tmp_metadata:
-                if not check_missing(tmp_metadata.loc[i, 'locus' + suffix_l]):
-                    tmp_metadata.at[i, 'locus_status'] = tmp_metadata.loc[
-                        i, 'locus' + suffix_l] + '_only'
-                else:
-                    tmp_metadata.at[i, 'locus_status'] = 'unassigned'
-            else:
-                tmp_metadata.at[i, 'locus_status'] = 'unassigned'
-
-    tmp_metadata['locus_status_summary'] = [
-        'Multi' if '|' in i else i for i in tmp_metadata['locus_status']
-    ]
-    acceptable = [
-        'TRB + TRA', 'TRD + TRG', 'IGH + IGK', 'IGH + IGL', 'IGH_only',
-        'TRB_only', 'TRD_only', 'TRA_only', 'TRG_only', 'IGK_only', 'IGL_only',
-        'Multi', 'unassigned'
-    ]
-    tmp_metadata['locus_status'] = [
-        'Multi' if i not in acceptable else i
-        for i in tmp_metadata['locus_status']
-    ]
-    tmp_metadata['locus_status_summary'] = [
-        'Multi' if i == 'Multi' else i for i in tmp_metadata['locus_status']
+def _join_by_cell(cell: np.ndarray, values: np.ndarray) -> pd.Series:
+    """Join the values of each cell with '|', keeping their order within the cell."""
+    if len(cell) == 0:
+        return (pd.Series([], dtype=object))
+    order = np.argsort(cell, kind='stable')
+    cell, values = cell[order], values[order]
+    start = np.flatnonzero(np.r_[True, cell[1:] != cell[:-1]])
+    end = np.r_[start[1:], len(cell)]
+    values = list(values)
+    joined = [
+        values[a] if b - a == 1 else '|'.join(values[a:b])
+        for a, b in zip(start, end)
     ]
+    return (pd.Series(joined, index=cell[start], dtype=object))
 
-    for i in tmp_metadata.index:
-        if 'productive' + suffix_h in tmp_metadata:
-            if not check_missing(tmp_metadata.loc[i, 'productive' + suffix_h]):
-                if 'productive' + suffix_l in tmp_metadata:
-                    if not check_missing(
-                            tmp_metadata.loc[i, 'productive' + suffix_l]):
-                        tmp_metadata.at[i, 'productive'] = tmp_metadata.loc[
-                            i, 'productive' +
-                            suffix_h] + ' + ' + tmp_metadata.loc[i,
-                                                                 'productive' +
-                                                                 suffix_l]
-                    else:
-                        tmp_metadata.at[i, 'productive'] = tmp_metadata.loc[
-                            i, 'productive' + suffix_h]
-                else:
-                    tmp_metadata.at[i, 'productive'] = tmp_metadata.loc[
-                        i, 'productive' + suffix_h]
-            else:
-                if 'productive' + suffix_l in tmp_metadata:
-                    if not check_missing(
-                            tmp_metadata.loc[i, 'productive' + suffix_l]):
-                        tmp_metadata.at[i, 'productive'] = tmp_metadata.loc[
-                            i, 'productive' + suffix_l]
-                    else:
-                        tmp_metadata.at[i, 'productive'] = 'unassigned'
-                else:
-                    tmp_metadata.at[i, 'productive'] = 'unassigned'
-        else:
-            if 'productive' + suffix_l in tmp_metadata:
-                if not check_missing(
-                        tmp_metadata.loc[i, 'productive' + suffix_l]):
-                    tmp_metadata.at[i, 'productive'] = tmp_metadata.loc[
-                        i, 'productive' + suffix_l]
-                else:
-                    tmp_metadata.at[i, 'productive'] = 'unassigned'
-            else:
-                tmp_metadata.at[i, 'productive'] = 'unassigned'
 
-    tmp_metadata['productive_summary'] = [
-        'Multi' if '|' in i else i for i in tmp_metadata['productive']
-    ]
+def _map_unique(func: Callable, *columns) -> np.ndarray:
+    """
+    Evaluate `func` once per unique combination of values across `columns`.
 
+    Parameters
+    ----------
+    func : Callable
+        scalar function taking one value from each column.
+    *columns
+        equal length array-likes.
+
+    Returns
+    -------
+    object array with `func` broadcasted back to every row.
+    """
+    columns = [np.asarray(c, dtype=object) for c in columns]
+    key = np.zeros(len(columns[0]), dtype=np.int64)
+    for c in columns:
+        codes, uniques = pd.factorize(c)
+        key = pd.factorize(key * (len(uniques) + 1) + codes + 1)[0]
+    _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    values = np.empty(len(first), dtype=object)
+    for i, r in enumerate(first):
+        values[i] = func(*[c[r] for c in columns])
+    return (values[inverse])
+
+
+def _column(metadata: pd.DataFrame, col: str) -> np.ndarray:
+    """Values of `col`, or all missing if the column is absent."""
+    if col in metadata:
+        return (metadata[col].values)
+    return (np.full(metadata.shape[0], np.nan, dtype=object))
+
+
+def _call_status(metadata: pd.DataFrame, col: str) -> np.ndarray:
+    """
+    Encode gene calls as -1 if `col` is absent, otherwise bit 1 for multiple
+    calls and bit 2 for a blank call.
+    """
+    if col not in metadata:
+        return (np.full(metadata.shape[0], -1))
+    calls = metadata[col].fillna('').astype(str)
+    multi = calls.str.contains('|', regex=False).values
+    return (multi + 2 * (calls == '').values)
+
+
+def _tidy_clones(clones: str) -> str:
+    """Drop 'unassigned' from multiple clone calls and sort the rest."""
+    if '|' not in clones:
+        return ('' if clones == 'unassigned' else clones)
+    i = clones.split('|')
+    while 'unassigned' in i:
+        i.remove('unassigned')
+        if len(i) == 1:
+            break
+    return ('|'.join(sorted(list(set(i)), key=cmp_to_key(cmp_str_emptylast))))
+
+
+def _locus_status(vdj, vj, has_vdj: bool, has_vj: bool) -> str:
+    """Locus pairing of a cell."""
+    if has_vdj and not check_missing(vdj):
+        if has_vj and not check_missing(vj):
+            return (vdj + ' + ' + vj)
+        if has_vj and '|' in vdj:
+            return ('Multi')
+        return (vdj + '_only')
+    if has_vj and not check_missing(vj):
+        if has_vdj and '|' in vj:
+            return ('Multi')
+        return (vj + '_only')
+    return ('unassigned')
+
+
+def _productive_status(vdj, vj) -> str:
+    """Productive status of a cell."""
+    if not check_missing(vdj):
+        return (vdj + ' + ' + vj if not check_missing(vj) else vdj)
+    return (vj if not check_missing(vj) else 'unassigned')
+
+
+def _isotype(c_call) -> str:
+    """Convert constant gene calls to isotype."""
     conversion_dict = {
         'igha': 'IgA',
         'igha1': 'IgA',
@@ -877,188 +1272,669 @@ def initialize_metadata(self, cols: Sequence, clonekey: str,
         None: 'unassigned',
         np.nan: 'unassigned',
     }
-
-    isotype = []
-    if 'c_call' + suffix_h in tmp_metadata:
-        for k in tmp_metadata['c_call' + suffix_h]:
-            if isinstance(k, str):
-                if ',' in k:
-                    k = '|'.join(k.split(','))
-                if '|' in k:
-                    isotype.append('|'.join([
-                        str(z) for z in [
-                            conversion_dict[y.lower()] for y in set(
-                                [re.sub('[0-9]', '', x) for x in k.split('|')])
-                        ]
-                    ]))
-                else:
-                    isotype.append(conversion_dict[k.lower()])
+    if not isinstance(c_call, str):
+        return ('unassigned')
+    if ',' in c_call:
+        c_call = '|'.join(c_call.split(','))
+    if '|' in c_call:
+        return ('|'.join([
+            str(z) for z in [
+                conversion_dict[y.lower()] for y in set(
+                    [re.sub('[0-9]', '', x) for x in c_call.split('|')])
+            ]
+        ]))
+    return (conversion_dict[c_call.lower()])
+
+
+def _collapse_alleles(calls: str) -> str:
+    """Remove allele numbers from gene calls."""
+    return ('|'.join([
+        '|'.join(list(set(yy.split(','))))
+        for yy in list(
+            set([re.sub('[*][0-9][0-9]', '', tx) for tx in calls.split('|')]))
+    ]))
+
+
+def _vdj_status(hv: int, hd: int, hj: int, lv: int, lj: int, suffix_h: str,
+                suffix_l: str) -> str:
+    """V(D)J status of a cell from `_call_status` codes."""
+    multi_h, multi_l = [], []
+    for call, gene in zip([hv, hd, hj], ['_v', '_d', '_j']):
+        if call >= 0 and call & 1:
+            multi_h.append(['Multi' + suffix_h + gene])
+    for call, gene in zip([lv, lj], ['_v', '_j']):
+        if call >= 0 and call & 1:
+            multi_l.append(['Multi' + suffix_l + gene])
+    if len(multi_h) < 1:
+        multi_h.append(['Single'])
+    if lv == 0 and lj == 0:
+        if len(multi_l) < 1:
+            multi_l.append(['Single'])
+    multih = '|'.join(list(set(flatten(multi_h))))
+    multil = '|'.join(list(set(flatten(multi_l))))
+    if len(multil) > 0:
+        return (multih + ' + ' + multil)
+    return (multih)
+
+
+def _constant_status(hc: int, lc: int, isotype_summary, has_isotype: bool,
+                     suffix_h: str, suffix_l: str) -> str:
+    """Constant gene status of a cell from `_call_status` codes."""
+    multi_hc, multi_lc = [], []
+    if hc >= 0 and hc & 1:
+        if has_isotype:
+            if isotype_summary in ['IgM|IgD', 'IgD|IgM']:
+                multi_hc.append([isotype_summary])
             else:
-                isotype.append('unassigned')
-        tmp_metadata['isotype'] = isotype
-        tmp_metadata['isotype_summary'] = [
-            i
-            if i == 'IgM|IgD' or i == 'IgD|IgM' else 'Multi' if '|' in i else i
-            for i in tmp_metadata['isotype']
-        ]
-
+                multi_hc.append(['Multi' + suffix_h + '_c'])
+    if lc >= 0 and lc & 1:
+        multi_lc.append(['Multi' + suffix_l + '_c'])
+    if len(multi_hc) < 1:
+        multi_hc.append(['Single'])
+    if lc == 0:
+        if len(multi_lc) < 1:
+            multi_lc.append(['Single'])
+    multihc = '|'.join(list(set(flatten(multi_hc))))
+    multilc = '|'.join(list(set(flatten(multi_lc))))
+    if len(multilc) > 0:
+        return (multihc + ' + ' + multilc)
+    return (multihc)
+
+
+def _row_hashes(values: pd.Series) -> pd.Series:
+    """Hash of every value of a column, indexed like the column."""
+    try:
+        h = pd.util.hash_pandas_object(values, index=False)
+    except TypeError:
+        h = pd.util.hash_pandas_object(values.astype(str), index=False)
+    return (h)
+
+
+def _column_address(values) -> int:
+    """Memory address of the values of a column."""
+    try:
+        return (values.__array_interface__['data'][0])
+    except AttributeError:
+        return (id(values))
+
+
+class LazyMetadata:
+    """
+    Build the `.metadata` slot of a `Dandelion` object on demand and keep it up to date incrementally.
+
+    Metadata columns are grouped into fields, e.g. the `_VDJ`/`_VJ` columns retrieved from one `.data` column or
+    the `locus_status` and `locus_status_summary` pair. Fields are computed only when one of their columns is
+    requested and are cached together with a hash of every contig in the `.data` columns they are derived from.
+    When those columns are replaced, or contigs are added or removed, only the cells whose contigs changed are
+    recomputed and merged into the cached field. Between calls to `update_metadata`, changes are noticed when a
+    column is replaced, as columns are only rehashed when their values move in memory; edits to individual values
+    in place in `.data` are noticed by the next `update_metadata` call, which rehashes every column.
+    """
+    count_cols = ['duplicate_count', 'umi_count', 'mu_count', 'mu_freq']
     vdj_gene_calls = ['v_call', 'd_call', 'j_call']
-    if collapse_alleles:
-        for x in vdj_gene_calls:
-            if x in self.data:
-                for c in tmp_metadata:
-                    if x in c:
-                        tmp_metadata[c] = [
-                            '|'.join([
-                                '|'.join(list(set(yy.split(','))))
-                                for yy in list(
-                                    set([
-                                        re.sub('[*][0-9][0-9]', '', tx)
-                                        for tx in t.split('|')
-                                    ]))
-                            ]) for t in tmp_metadata[c]
-                        ]
-    multi = {}
-    multic = {}
-    for i in tmp_metadata.index:
-        try:
-            if 'v_call_genotyped' in cols:
-                if 'v_call_genotyped' + suffix_h in tmp_metadata:
-                    hv_ = tmp_metadata.at[i, 'v_call_genotyped' +
-                                          suffix_h].split('|')
-            else:
-                if 'v_call' + suffix_h in tmp_metadata:
-                    hv_ = tmp_metadata.at[i, 'v_call' + suffix_h].split('|')
-        except:
-            if 'v_call_genotyped' in cols:
-                if 'v_call_genotyped' + suffix_h in tmp_metadata:
-                    hv_ = tmp_metadata.at[i, 'v_call_genotyped' + suffix_h]
-            else:
-                if 'v_call' + suffix_h in tmp_metadata:
-                    hv_ = tmp_metadata.at[i, 'v_call' + suffix_h]
-        if 'd_call' + suffix_h in tmp_metadata:
-            try:
-                hd_ = tmp_metadata.at[i, 'd_call' + suffix_h].split('|')
-            except:
-                hd_ = tmp_metadata.at[i, 'd_call' + suffix_h]
-        if 'd_call' + suffix_l in tmp_metadata:
-            tmp_metadata.drop('d_call' + suffix_l, axis=1, inplace=True)
+    derived = {
+        'locus_status': ['locus_status', 'locus_status_summary'],
+        'productive_status': ['productive', 'productive_summary'],
+        'isotype': ['isotype', 'isotype_summary'],
+        'vdj_status': ['vdj_status', 'vdj_status_summary'],
+        'constant_status': ['constant_status_summary'],
+    }
 
-        if 'j_call' + suffix_h in tmp_metadata:
-            try:
-                hj_ = tmp_metadata.at[i, 'j_call' + suffix_h].split('|')
-            except:
-                hj_ = tmp_metadata.at[i, 'j_call' + suffix_h]
-        try:
-            if 'v_call_genotyped' in cols:
-                if 'v_call_genotyped' + suffix_l in tmp_metadata:
-                    lv_ = tmp_metadata.at[i, 'v_call_genotyped' +
-                                          suffix_l].split('|')
-            else:
-                if 'v_call' + suffix_l in tmp_metadata:
-                    lv_ = tmp_metadata.at[i, 'v_call' + suffix_l].split('|')
-        except:
-            if 'v_call_genotyped' in cols:
-                if 'v_call_genotyped' + suffix_l in tmp_metadata:
-                    lv_ = tmp_metadata.at[i, 'v_call_genotyped' + suffix_l]
-            else:
-                if 'v_call' + suffix_l in tmp_metadata:
-                    lv_ = tmp_metadata.at[i, 'v_call' + suffix_l]
-        if 'j_call' + suffix_l in tmp_metadata:
-            try:
-                lj_ = tmp_metadata.at[i, 'j_call' + suffix_l].split('|')
-            except:
-                lj_ = tmp_metadata.at[i, 'j_call' + suffix_l]
-        if 'c_call' + suffix_h in tmp_metadata:
-            try:
-                hc_ = tmp_metadata.at[i, 'c_call' + suffix_h].split('|')
-            except:
-                hc_ = tmp_metadata.at[i, 'c_call' + suffix_h]
-        if 'c_call' + suffix_l in tmp_metadata:
-            try:
-                lc_ = tmp_metadata.at[i, 'c_call' + suffix_l].split('|')
-            except:
-                lc_ = tmp_metadata.at[i, 'c_call' + suffix_l]
-        multi_h = []
-        multi_l = []
-        multi_hc = []
-        multi_lc = []
-        if 'hv_' in locals():
-            if len(hv_) > 1:
-                multi_h.append(['Multi' + suffix_h + '_v'])
-        if 'hd_' in locals():
-            if len(hd_) > 1:
-                multi_h.append(['Multi' + suffix_h + '_d'])
-        if 'hj_' in locals():
-            if len(hj_) > 1:
-                multi_h.append(['Multi' + suffix_h + '_j'])
-        if 'lv_' in locals():
-            if len(lv_) > 1:
-                multi_l.append(['Multi' + suffix_l + '_v'])
-        if 'lj_' in locals():
-            if len(lj_) > 1:
-                multi_l.append(['Multi' + suffix_l + '_j'])
-        if 'hc_' in locals():
-            if len(hc_) > 1:
-                if 'isotype_summary' in tmp_metadata:
-                    if (tmp_metadata.at[i, 'isotype_summary'] == 'IgM|IgD'
-                        ) or (tmp_metadata.at[i, 'isotype_summary']
-                              == 'IgD|IgM'):
-                        multi_hc.append(
-                            [tmp_metadata.at[i, 'isotype_summary']])
-                    else:
-                        multi_hc.append(['Multi' + suffix_h + '_c'])
-        if 'lc_' in locals():
-            if len(lc_) > 1:
-                multi_lc.append(['Multi' + suffix_l + '_c'])
-        if len(multi_hc) < 1:
-            multi_hc.append(['Single'])
-        if len(multi_h) < 1:
-            multi_h.append(['Single'])
-        if 'lv_' in locals() and 'lj_' in locals():
-            if (len(lv_) == 1) & (len(lj_) == 1):
-                if ('' not in lv_) and ('' not in lj_):
-                    if len(multi_l) < 1:
-                        multi_l.append(['Single'])
-        if 'lc_' in locals():
-            if len(lc_) == 1:
-                if ('' not in lc_):
-                    if len(multi_lc) < 1:
-                        multi_lc.append(['Single'])
-        multih = '|'.join(list(set(flatten(multi_h))))
-        multil = '|'.join(list(set(flatten(multi_l))))
-        multihc = '|'.join(list(set(flatten(multi_hc))))
-        multilc = '|'.join(list(set(flatten(multi_lc))))
-        if len(multih) > 0:
-            if len(multil) > 0:
-                multi[i] = multih + ' + ' + multil
+    def __init__(self,
+                 vdj: Dandelion,
+                 cols: Sequence,
+                 clonekey: str,
+                 collapse_alleles: bool = True,
+                 retrieve: Optional[Dict] = None):
+        """
+        Parameters
+        ----------
+        vdj : Dandelion
+            `Dandelion` object whose `.data` the metadata is derived from.
+        cols : Sequence
+            columns in `.data` to initialise the metadata with.
+        clonekey : str
+            column name of clone id.
+        collapse_alleles : bool
+            whether or not to strip the allelic calls from V(D)J genes.
+        retrieve : Dict, Optional
+            additional columns to retrieve, as {column: (retrieve_mode, collapse_alleles)}.
+        """
+        self.vdj = vdj
+        self.cols = list(cols)
+        self.clonekey = clonekey
+        self.collapse_alleles = collapse_alleles
+        self.retrieve = {} if retrieve is None else dict(retrieve)
+        self.cache = {}
+        self.signatures = {}
+        self.versions = {}
+        self.hashes = {}
+        self.suffixes = {}
+        self.fields = None
+        self.fields_signature = None
+        self.frozen = False
+        self.materialised = None
+        self._index = (None, None)
+        self._alignment = (None, None, None)
+        self._suffix = None
+        self.refresh()
+
+    @property
+    def config(self) -> tuple:
+        return ((tuple(self.cols), self.clonekey, self.collapse_alleles))
+
+    def _version(self, col: str) -> Optional[str]:
+        """
+        Content hash of a `.data` column. It is only rehashed when the column's values move in memory, i.e. the
+        column or the whole `.data` was replaced, or after `rehash`.
+        """
+        data = self.vdj._peek('data')
+        if col not in data:
+            return (None)
+        values = data[col]
+        address = (len(values), _column_address(values.values))
+        if self.versions.get(col, (None, None))[0] != address:
+            rows = _row_hashes(values)
+            digest = hashlib.blake2b(rows.values.tobytes(),
+                                     digest_size=16).hexdigest()
+            self.versions[col] = (address, digest)
+            self.hashes[(col, digest)] = (rows, values
+                                          if col == 'cell_id' else None)
+        return (self.versions[col][1])
+
+    def rehash(self):
+        """
+        Hash the `.data` columns again on their next use, whether or not they moved in memory. Fields are cached
+        by the hashes of the contigs, so the ones whose sources are unchanged are still reused.
+        """
+        self.versions = {}
+
+    def _sources(self, sources: Sequence) -> list:
+        return (['cell_id', 'locus'] + list(sources))
+
+    def _signature(self, sources: Sequence) -> tuple:
+        return (tuple(self._version(c) for c in self._sources(sources)))
+
+    def copy(self, vdj: Dandelion) -> 'LazyMetadata':
+        """Copy for a copy of the `Dandelion` object, sharing the cached fields."""
+        out = copy.copy(self)
+        out.vdj = vdj
+        for k in ['cols', 'retrieve', 'cache', 'signatures', 'versions',
+                  'hashes', 'suffixes']:
+            setattr(out, k, copy.copy(getattr(self, k)))
+        return (out)
+
+    def refresh(self):
+        """Work out the fields, dropping the cached ones whose sources changed."""
+        if self.frozen:
+            return
+        signature = self._signature(self.cols + list(self.retrieve))
+        if signature == self.fields_signature:
+            return
+        data = self.vdj._peek('data')
+        fields = {}
+        for k in self.cols:
+            if all_missing(data[k]):
+                continue
+            fields[k] = [k] + [x for x in self.vdj_gene_calls if x in k]
+            if k in self.count_cols:
+                fields[k + '_split'] = [k]
+        v_call = 'v_call_genotyped' if 'v_call_genotyped' in self.cols else 'v_call'
+        fields.update({
+            'locus_status': ['locus'],
+            'productive_status': ['productive'],
+            'isotype': ['c_call'],
+            'vdj_status': [v_call, 'd_call', 'j_call'] + self.vdj_gene_calls,
+            'constant_status': ['c_call'],
+        })
+        for k in self.retrieve:
+            fields['retrieve:' + k] = [k]
+        if self.fields is not None and any(
+                self.fields.get(k) != v
+                for k, v in fields.items() if k in self.derived):
+            # derived fields depend on which columns are present
+            for k in self.derived:
+                self.cache.pop(k, None)
+        self.fields = fields
+        for name in list(self.cache):
+            if name not in fields:
+                del self.cache[name]
+        self._suffix = None
+        self.fields_signature = signature
+
+    def stale(self) -> bool:
+        """Whether the `.data` columns have changed since the metadata was last materialised."""
+        return (self.materialised != self._signature(self.cols +
+                                                     list(self.retrieve)))
+
+    @property
+    def querier(self) -> Query:
+        signature = self._signature([])
+        querier = self.vdj.querier
+        if (querier is None or querier.data is not self.vdj._peek('data')
+                or self.signatures.get('querier') != signature):
+            self.vdj.querier = Query(self.vdj._peek('data'))
+            self.signatures['querier'] = signature
+        return (self.vdj.querier)
+
+    @property
+    def index(self) -> pd.Index:
+        """Cells in the metadata."""
+        querier = self.querier
+        split = any(k not in [self.clonekey, 'sample_id'] for k in self.fields
+                    if k not in self.derived and not k.startswith('retrieve:'))
+        signature = (self.signatures['querier'], split)
+        if self._index[0] != signature:
+            if split:
+                # cells with contigs of either chain
+                index = querier.cells[np.unique(
+                    querier.contigs['cell'].values[querier.keep])]
             else:
-                multi[i] = multih
+                index = querier.cells
+            # sorted as the original metadata, which sets the order of ties in clone sizes
+            self._index = (signature, index.sort_values())
+        return (self._index[1])
+
+    def field(self, name: str) -> pd.DataFrame:
+        """Columns of a field, computing them if needed."""
+        sources = self.fields[name]
+        signature = self._signature(sources)
+        if name in self.derived or name == 'd_call':
+            # computed differently depending on whether there are VDJ contigs
+            suffix = self.suffix()
+            if self.suffixes.get(name, suffix) != suffix:
+                self.cache.pop(name, None)
+            self.suffixes[name] = suffix
+        if name in self.cache and self.signatures.get(name) == signature:
+            return (self.cache[name])
+        cells = self._changed_cells(name) if name in self.cache else None
+        if cells is not None:
+            out = self._update(name, cells)
+        elif name in self.derived:
+            out = getattr(self, '_' + name)()
+        elif name.startswith('retrieve:'):
+            out = self._retrieve(name[9:])
+        else:
+            out = self._query(name)
+        self.cache[name] = out
+        self.signatures[name] = signature
+        self._prune()
+        return (out)
+
+    def _prune(self):
+        """Forget contig hashes that no cached field refers to anymore."""
+        used = {(c, v[1]) for c, v in self.versions.items()}
+        for name in self.cache:
+            used.update(zip(self._sources(self.fields[name]),
+                            self.signatures[name]))
+        for k in list(self.hashes):
+            if k not in used:
+                del self.hashes[k]
+
+    def _changed_cells(self, name: str) -> Optional[pd.Index]:
+        """
+        Cells whose contigs changed in the sources of a cached field, or None if the field has to be computed
+        from scratch.
+        """
+        if name.startswith('retrieve:') or name.endswith('_split'):
+            # columns depend on the whole table
+            return (None)
+        sources = self._sources(self.fields[name])
+        old = self.signatures[name]
+        new = self._signature(self.fields[name])
+        if any((a is None) != (b is None) for a, b in zip(old, new)):
+            return (None)
+        combined = []
+        for signature in (old, new):
+            rows = [(i, self.hashes[(c, v)][0])
+                    for i, (c, v) in enumerate(zip(sources, signature))
+                    if v is not None]
+            if not rows[0][1].index.is_unique:
+                return (None)
+            # contig hash mixed over the columns
+            h = np.zeros(len(rows[0][1]), dtype=np.uint64)
+            for i, r in rows:
+                h += r.values * np.uint64(2 * i + 1)
+            combined.append(pd.Series(h, index=rows[0][1].index))
+        old_h, new_h = combined
+        old_cells = self.hashes[('cell_id', old[0])][1]
+        new_cells = self.hashes[('cell_id', new[0])][1]
+        position = self._align(old_h.index, new_h.index)
+        found = position >= 0
+        same = np.zeros(len(new_h), dtype=bool)
+        same[found] = old_h.values[position[found]] == new_h.values[found]
+        # old contigs that were removed or changed
+        stale = np.ones(len(old_h), dtype=bool)
+        stale[position[same]] = False
+        cells = pd.Index(new_cells.values[~same]).append(
+            pd.Index(old_cells.values[stale])).unique()
+        if len(cells) > 0.5 * len(self.index):
+            return (None)
+        return (cells)
+
+    def _align(self, old: pd.Index, new: pd.Index) -> np.ndarray:
+        """Position of every new contig among the old ones, -1 if new; shared by the fields."""
+        if self._alignment[0] is not old or self._alignment[1] is not new:
+            self._alignment = (old, new, old.get_indexer(new))
+        return (self._alignment[2])
+
+    def _subset(self, cells: pd.Index, name: str) -> 'LazyMetadata':
+        """A builder for the contigs of `cells`, with the fields of this one, to compute the field `name`."""
+        data = self.vdj._peek('data')
+        sub = LazyMetadata.__new__(LazyMetadata)
+        sub.__dict__.update(self.__dict__)
+        subset = data[data['cell_id'].isin(cells)]
+        # stands in for the `Dandelion` object, read through `_peek`
+        sub.vdj = SimpleNamespace(data=subset,
+                                  querier=None,
+                                  _peek={'data': subset}.get)
+        sub.cache, sub.signatures, sub.versions, sub.hashes, sub.suffixes = (
+            {}, {}, {}, {}, {})
+        sub.frozen = True
+        sub._index = (None, None)
+        sub._alignment = (None, None, None)
+        # the VDJ/VJ suffix depends on all the cells, except for the locus field itself
+        sub._suffix = None if name == 'locus' else self.suffix()
+        return (sub)
+
+    def _update(self, name: str, cells: pd.Index) -> pd.DataFrame:
+        """Recompute a field for `cells` only and merge it into the cached one."""
+        old = self.cache[name]
+        part = self._subset(cells, name).field(
+            name) if len(cells) > 0 else old.iloc[:0]
+        if name == self.clonekey:
+            old = old.drop(str(self.clonekey) + '_by_size', axis=1)
+        out = pd.concat([old[~old.index.isin(cells)], part])
+        if name in self.derived:
+            if list(part.columns) != list(old.columns):
+                return (getattr(self, '_' + name)())
+            return (out.reindex(self.index))
+        if name in [self.clonekey, 'sample_id']:
+            columns = [name]
         else:
-            multi[i] = 'unassigned'
-        if len(multihc) > 0:
-            if len(multilc) > 0:
-                multic[i] = multihc + ' + ' + multilc
+            columns = self._chains(name)
+        out = out.reindex(index=self.index, columns=columns).fillna('')
+        if name == self.clonekey:
+            out = self._clone_sizes(out)
+        if name == 'd_call':
+            _, suffix_l = self.suffix()
+            if out.shape[0] > 0 and 'd_call' + suffix_l in out:
+                out = out.drop('d_call' + suffix_l, axis=1)
+        return (out)
+
+    def _chains(self, query: str) -> list:
+        """Columns of a 'split and unique only' retrieval, as `Query.retrieve` orders them."""
+        querier = self.querier
+        contigs = querier.contigs[querier.keep]
+        first = contigs.groupby('chain')['cell'].min().sort_values(
+            kind='stable')
+        suffix = {0: '_VDJ', 1: '_VJ'}
+        return ([query + suffix[c] for c in first.index])
+
+    def _output(self, name: str) -> pd.DataFrame:
+        out = self.field(name)
+        if name == 'isotype' and 'isotype' in out:
+            if all(out['isotype'] == 'unassigned'):
+                out = out.drop(['isotype', 'isotype_summary'], axis=1)
+        return (out)
+
+    def _names(self, name: str, column: str) -> bool:
+        """Whether `column` belongs to a field, without computing it."""
+        if name in self.derived:
+            return (column in self.derived[name])
+        if name.startswith('retrieve:'):
+            return (column in self.field(name))
+        if name.endswith('_split') and name[:-6] in self.count_cols:
+            return (re.fullmatch(
+                re.escape(name[:-6]) + '_(VDJ|VJ)_[0-9]+', column)
+                    is not None)
+        if name in [self.clonekey, 'sample_id']:
+            return (column in [name, name + '_by_size'])
+        return (column in [name + '_VDJ', name + '_VJ'])
+
+    def columns(self, keys: Optional[Sequence] = None) -> pd.DataFrame:
+        """
+        Materialise metadata columns.
+
+        Parameters
+        ----------
+        keys : Sequence, Optional
+            metadata columns to compute. None returns the whole `.metadata`.
+
+        Returns
+        -------
+        `pandas.DataFrame` of the requested columns.
+        """
+        self.refresh()
+        retrieve = [k for k in self.fields if k.startswith('retrieve:')]
+        if keys is None:
+            out = pd.concat([
+                self._output(name)
+                for name in self.fields if name not in retrieve
+            ],
+                            axis=1)
+            for name in retrieve:
+                ret = self._output(name)
+                for r in ret:
+                    out[r] = ret[r]
+            self.materialised = self._signature(self.cols +
+                                                list(self.retrieve))
+            return (out.copy())
+        order = retrieve[::-1] + [
+            name for name in self.fields if name not in retrieve
+        ]
+        out = {}
+        for key in keys:
+            name = next(
+                (name for name in order if self._names(name, key)), None)
+            if name is None or key not in self._output(name):
+                raise KeyError(key)
+            out[key] = self._output(name)[key]
+        return (pd.DataFrame(out, index=self.index))
+
+    def suffix(self) -> Tuple[str, str]:
+        if self._suffix is None:
+            if 'locus' in self.fields and 'locus_VDJ' in self.field('locus'):
+                self._suffix = ('_VDJ', '_VJ')
             else:
-                multic[i] = multihc
+                self._suffix = ('', '')
+        return (self._suffix)
+
+    def _get(self, col: str) -> Optional[pd.Series]:
+        """Metadata column derived from a `.data` column, if any."""
+        for name in self.fields:
+            if name not in self.derived and name != 'retrieve':
+                if self._names(name, col):
+                    return (self.field(name).get(col))
+        return (None)
+
+    def _frame(self, cols: Sequence) -> pd.DataFrame:
+        out = pd.DataFrame(index=self.index)
+        for col in cols:
+            x = self._get(col)
+            if x is not None:
+                out[col] = x
+        return (out)
+
+    def _query(self, name: str) -> pd.DataFrame:
+        querier = self.querier
+        if name.endswith('_split') and name[:-6] in self.count_cols:
+            out = querier.retrieve(name[:-6], 'split')
+        elif name in [self.clonekey, 'sample_id']:
+            out = querier.retrieve(name, 'merge and unique only')
         else:
-            multic[i] = 'unassigned'
-    tmp_metadata['vdj_status'] = pd.Series(multi)
-    tmp_metadata['vdj_status_summary'] = [
-        'Multi' if 'Multi' + suffix_h in i else 'Single'
-        for i in tmp_metadata['vdj_status']
-    ]
-    tmp_metadata['constant_status_summary'] = [
-        'Multi' if 'Multi' + suffix_h in i else 'Single'
-        for i in pd.Series(multic)
-    ]
-    if 'isotype' in tmp_metadata:
-        if all(tmp_metadata['isotype'] == 'unassigned'):
-            tmp_metadata.drop(['isotype', 'isotype_summary'],
-                              axis=1,
-                              inplace=True)
+            out = querier.retrieve(name, 'split and unique only')
+        out = out.reindex(self.index)
+        if name == self.clonekey:
+            out = self._clones(out)
+        if self.collapse_alleles:
+            for x in self.vdj_gene_calls:
+                if x in self.vdj._peek('data'):
+                    for c in out:
+                        if x in c:
+                            out[c] = _map_unique(_collapse_alleles, out[c])
+        if name == 'd_call':
+            suffix_h, suffix_l = self.suffix()
+            if out.shape[0] > 0 and 'd_call' + suffix_l in out:
+                out = out.drop('d_call' + suffix_l, axis=1)
+        return (out)
+
+    def _clones(self, out: pd.DataFrame) -> pd.DataFrame:
+        clonekey = self.clonekey
+        out[str(clonekey)] = _map_unique(
+            _tidy_clones, out[str(clonekey)].replace('', 'unassigned'))
+        if self.frozen:
+            # clone sizes are counted over all cells once merged
+            return (out)
+        return (self._clone_sizes(out))
+
+    def _clone_sizes(self, out: pd.DataFrame) -> pd.DataFrame:
+        clonekey = self.clonekey
+        tmp = out[str(clonekey)].str.split('|', expand=True).stack()
+        tmp = tmp.reset_index(drop=False)
+        tmp.columns = ['cell_id', 'tmp', str(clonekey)]
+        clone_size = tmp[str(clonekey)].value_counts()
+        if "" in clone_size.index:
+            clone_size = clone_size.drop("", axis=0)
+        clonesize_dict = dict(clone_size)
+        size_of_clone = pd.DataFrame.from_dict(clonesize_dict, orient='index')
+        size_of_clone.reset_index(drop=False, inplace=True)
+        size_of_clone.columns = [str(clonekey), 'clone_size']
+        size_of_clone[str(clonekey) + '_by_size'] = size_of_clone.index + 1
+        size_dict = dict(
+            zip(size_of_clone[clonekey],
+                size_of_clone[str(clonekey) + '_by_size']))
+        size_dict.update({'': 'unassigned'})
+        out[str(clonekey) + '_by_size'] = _map_unique(
+            lambda c: '|'.join(
+                sorted(list(set([str(size_dict[c_]) for c_ in c.split('|')]))))
+            if len(c.split('|')) > 1 else str(size_dict[c]), out[str(clonekey)])
+        out[str(clonekey) +
+            '_by_size'] = out[str(clonekey) + '_by_size'].astype('category')
+        return (out)
+
+    def _locus_status(self) -> pd.DataFrame:
+        suffix_h, suffix_l = self.suffix()
+        h, l = 'locus' + suffix_h, 'locus' + suffix_l
+        tmp = self._frame([h, l])
+        out = pd.DataFrame(index=tmp.index)
+        out['locus_status'] = _map_unique(
+            lambda x, y: _locus_status(x, y, h in tmp, l in tmp),
+            _column(tmp, h), _column(tmp, l))
+        acceptable = [
+            'TRB + TRA', 'TRD + TRG', 'IGH + IGK', 'IGH + IGL', 'IGH_only',
+            'TRB_only', 'TRD_only', 'TRA_only', 'TRG_only', 'IGK_only',
+            'IGL_only', 'Multi', 'unassigned'
+        ]
+        out['locus_status'] = out['locus_status'].where(
+            out['locus_status'].isin(acceptable), 'Multi')
+        out['locus_status_summary'] = out['locus_status']
+        return (out)
+
+    def _productive_status(self) -> pd.DataFrame:
+        suffix_h, suffix_l = self.suffix()
+        tmp = self._frame(['productive' + suffix_h, 'productive' + suffix_l])
+        out = pd.DataFrame(index=tmp.index)
+        out['productive'] = _map_unique(_productive_status,
+                                        _column(tmp, 'productive' + suffix_h),
+                                        _column(tmp, 'productive' + suffix_l))
+        out['productive_summary'] = _map_unique(
+            lambda x: 'Multi' if '|' in x else x, out['productive'])
+        return (out)
+
+    def _isotype(self) -> pd.DataFrame:
+        suffix_h, _ = self.suffix()
+        tmp = self._frame(['c_call' + suffix_h])
+        out = pd.DataFrame(index=tmp.index)
+        if 'c_call' + suffix_h in tmp:
+            out['isotype'] = _map_unique(_isotype, tmp['c_call' + suffix_h])
+            out['isotype_summary'] = _map_unique(
+                lambda x: x if x == 'IgM|IgD' or x == 'IgD|IgM' else 'Multi'
+                if '|' in x else x, out['isotype'])
+        return (out)
+
+    def _vdj_status(self) -> pd.DataFrame:
+        suffix_h, suffix_l = self.suffix()
+        v_call = 'v_call_genotyped' if 'v_call_genotyped' in self.cols else 'v_call'
+        tmp = self._frame([
+            v_call + suffix_h, 'd_call' + suffix_h, 'j_call' + suffix_h,
+            v_call + suffix_l, 'j_call' + suffix_l
+        ])
+        calls = [
+            _call_status(tmp, c) for c in [
+                v_call + suffix_h, 'd_call' + suffix_h, 'j_call' +
+                suffix_h, v_call + suffix_l, 'j_call' + suffix_l
+            ]
+        ]
+        out = pd.DataFrame(index=tmp.index)
+        out['vdj_status'] = _map_unique(
+            lambda *x: _vdj_status(*x, suffix_h=suffix_h, suffix_l=suffix_l),
+            *calls)
+        out['vdj_status_summary'] = np.where(
+            out['vdj_status'].str.contains('Multi' + suffix_h, regex=False),
+            'Multi', 'Single')
+        return (out)
+
+    def _constant_status(self) -> pd.DataFrame:
+        suffix_h, suffix_l = self.suffix()
+        tmp = self._frame(['c_call' + suffix_h, 'c_call' + suffix_l])
+        isotype = self.field('isotype')
+        constant_status = _map_unique(
+            lambda *x: _constant_status(*x,
+                                        has_isotype='isotype_summary'
+                                        in isotype,
+                                        suffix_h=suffix_h,
+                                        suffix_l=suffix_l),
+            _call_status(tmp, 'c_call' + suffix_h),
+            _call_status(tmp, 'c_call' + suffix_l),
+            _column(isotype, 'isotype_summary'))
+        out = pd.DataFrame(index=tmp.index)
+        out['constant_status_summary'] = np.where(
+            pd.Series(constant_status,
+                      dtype=object).str.contains('Multi' + suffix_h,
+                                                 regex=False), 'Multi',
+            'Single')
+        return (out)
+
+    def _retrieve(self, col: str) -> pd.DataFrame:
+        mode, collapse_alleles = self.retrieve[col]
+        return (_retrieve_metadata(self.querier, self.vdj._peek('data'), {col: mode},
+                                   collapse_alleles))
 
-    self.metadata = tmp_metadata.copy()
+
+def _retrieve_metadata(querier: Query, data: pd.DataFrame, retrieve: Dict,
+                       collapse_alleles: bool) -> pd.DataFrame:
+    """Retrieve additional `.data` columns, as {column: retrieve_mode}, into cell-level columns."""
+    vdj_gene_ret = ['v_call', 'd_call', 'j_call']
+
+    retrieve_ = defaultdict(dict)
+    for k, v in retrieve.items():
+        if k in data.columns:
+            retrieve_[k] = querier.retrieve(query=k, retrieve_mode=v)
+        else:
+            raise KeyError('Cannot retrieve \'%s\' : Unknown column name.' %
+                           k)
+    ret_metadata = pd.concat(retrieve_.values(), axis=1, join="inner")
+    ret_metadata.dropna(axis=1, how='all', inplace=True)
+    for col in ret_metadata:
+        if all_missing(ret_metadata[col]):
+            ret_metadata.drop(col, axis=1, inplace=True)
+
+    if collapse_alleles:
+        for k in retrieve.keys():
+            if k in vdj_gene_ret:
+                for c in ret_metadata:
+                    if k in c:
+                        ret_metadata[c] = _map_unique(_collapse_alleles,
+                                                      ret_metadata[c])
+    return (ret_metadata)
+
+
+def initialize_metadata(self, cols: Sequence, clonekey: str,
+                        collapse_alleles: bool) -> Dandelion:
+    builder = LazyMetadata(self, cols, clonekey, collapse_alleles)
+    self.metadata = builder.columns()
+    self._metadata_builder = builder
 
 
 def update_metadata(self: Dandelion,
@@ -1070,6 +1946,7 @@ def update_metadata(self: Dandelion,
                         'sum', 'average'] = 'split and unique only',
                     collapse_alleles: bool = True,
                     reinitialize: bool = False,
+                    lazy: bool = False,
                     verbose: bool = False) -> Dandelion:
     """
     A `Dandelion` initialisation function to update and populate the `.metadata` slot.
@@ -1096,6 +1973,9 @@ def update_metadata(self: Dandelion,
         Returns the V(D)J genes with allelic calls if False.
     reinitialize : bool
         Whether or not to reinitialize the current metadata. Useful when updating older versions of `dandelion` to newer version.
+    lazy : bool
+        Whether or not to defer building the metadata until it is first accessed, and then only the requested
+        columns with `Dandelion.get_metadata`. Objects already in lazy mode stay lazy.
     Returns
     -------
     `Dandelion` object with `.metadata` slot initialized.
@@ -1111,52 +1991,44 @@ def update_metadata(self: Dandelion,
         'j_call', 'c_call', 'duplicate_count', 'junction_aa'
     ]
 
-    if 'duplicate_count' not in self.data:
+    if 'duplicate_count' not in self._peek('data'):
         try:
-            self.data['duplicate_count'] = self.data['umi_count']
+            data = self._get_slot('data', expose=False)
+            data['duplicate_count'] = data['umi_count']
         except:
             cols = list(
                 map(lambda x: 'umi_count'
                     if x == 'duplicate_count' else x, cols))
-            if 'umi_count' not in self.data:
+            if 'umi_count' not in self._peek('data'):
                 raise ValueError(
                     "Unable to initialize metadata due to missing keys. Please ensure either 'umi_count' or 'duplicate_count' is in the input data."
                 )
-    if 'cell_id' not in self.data:  # shortcut for bulk data to pretend every unique sequence is a cell?
-        self.data['cell_id'] = self.data['sequence_id']
+    if 'cell_id' not in self._peek('data'):  # shortcut for bulk data to pretend every unique sequence is a cell?
+        data = self._get_slot('data', expose=False)
+        data['cell_id'] = data['sequence_id']
 
-    if not all([c in self.data for c in cols]):
+    data = self._peek('data')
+    if not all([c in data for c in cols]):
         raise ValueError(
             'Unable to initialize metadata due to missing keys. Please ensure the input data contains all the following columns: {}'
             .format(cols))
 
-    if 'sample_id' in self.data:
+    if 'sample_id' in data:
         cols = ['sample_id'] + cols
 
-    if 'v_call_genotyped' in self.data:
+    if 'v_call_genotyped' in data:
         cols = list(
             map(lambda x: 'v_call_genotyped' if x == 'v_call' else x, cols))
 
     for c in ['sequence_id', 'cell_id']:
         cols.remove(c)
 
-    if clonekey in self.data:
-        if not all(pd.isnull(self.data[clonekey])):
+    if clonekey in data:
+        if not all(pd.isnull(data[clonekey])):
             cols = [clonekey] + cols
 
-    metadata_status = self.metadata
-    if (metadata_status is None) or reinitialize:
-        initialize_metadata(self, cols, clonekey, collapse_alleles)
-
-    tmp_metadata = self.metadata.copy()
-
+    ret_dict = {}
     if retrieve is not None:
-        if self.querier is None:
-            querier = Query(self.data)
-            self.querier = querier
-        else:
-            querier = self.querier
-        ret_dict = {}
         if type(retrieve) is str:
             retrieve = [retrieve]
         if type(retrieve_mode) is str:
@@ -1164,42 +2036,47 @@ def update_metadata(self: Dandelion,
             if len(retrieve) > len(retrieve_mode):
                 retrieve_mode = [x for x in retrieve_mode for i in retrieve]
         for ret, mode in zip(retrieve, retrieve_mode):
-            ret_dict.update({ret: {
-                'query': ret,
-                'retrieve_mode': mode,
-            }})
-
-        vdj_gene_ret = ['v_call', 'd_call', 'j_call']
+            if ret not in data.columns:
+                raise KeyError(
+                    'Cannot retrieve \'%s\' : Unknown column name.' % ret)
+            ret_dict.update({ret: mode})
+
+    builder = self._metadata_builder
+    if builder is not None:
+        # rehash by content, so that values edited in place are noticed
+        builder.rehash()
+    config = (tuple(cols), clonekey, collapse_alleles)
+    if reinitialize or (lazy and not self._lazy) or (not self._lazy and
+                                                     self._metadata is None):
+        if builder is None or builder.config != config:
+            builder = LazyMetadata(self, cols, clonekey, collapse_alleles)
+        builder.retrieve = {}
+        self._metadata_builder = builder
+        if lazy or self._lazy:
+            self._set_slot('metadata', None)
+            self._lazy = True
+        else:
+            # only the fields whose source columns changed are recomputed
+            self.metadata = builder.columns()
 
-        retrieve_ = defaultdict(dict)
+    if len(ret_dict) > 0:
+        if builder is None:
+            builder = LazyMetadata(self, cols, clonekey, collapse_alleles)
+            self._metadata_builder = builder
         for k, v in ret_dict.items():
-            if k in self.data.columns:
-                retrieve_[k] = querier.retrieve(**v)
-            else:
-                raise KeyError(
-                    'Cannot retrieve \'%s\' : Unknown column name.' % k)
-        ret_metadata = pd.concat(retrieve_.values(), axis=1, join="inner")
-        ret_metadata.dropna(axis=1, how='all', inplace=True)
-        for col in ret_metadata:
-            if all_missing(ret_metadata[col]):
-                ret_metadata.drop(col, axis=1, inplace=True)
-
-        if collapse_alleles:
-            for k in ret_dict.keys():
-                if k in vdj_gene_ret:
-                    for c in ret_metadata:
-                        if k in c:
-                            ret_metadata[c] = [
-                                '|'.join([
-                                    '|'.join(list(set(yy.split(','))))
-                                    for yy in list(
-                                        set([
-                                            re.sub('[*][0-9][0-9]', '', tx)
-                                            for tx in t.split('|')
-                                        ]))
-                                ]) for t in ret_metadata[c]
-                            ]
-
-        for r in ret_metadata:
-            tmp_metadata[r] = pd.Series(ret_metadata[r])
-        self.metadata = tmp_metadata.copy()
+            if builder.retrieve.get(k) != (v, collapse_alleles):
+                builder.cache.pop('retrieve:' + k, None)
+            builder.retrieve[k] = (v, collapse_alleles)
+        builder.refresh()
+        if self._metadata is not None and not (self._lazy and
+                                               builder.stale()):
+            # merged into the existing metadata, keeping any columns added to it
+            tmp_metadata = self._peek('metadata').copy()
+            for k in ret_dict:
+                ret_metadata = builder.field('retrieve:' + k)
+                for r in ret_metadata:
+                    tmp_metadata[r] = pd.Series(ret_metadata[r])
+            self._set_slot('metadata', tmp_metadata)
+            if self._lazy:
+                builder.materialised = builder._signature(
+                    builder.cols + list(builder.retrieve))
@@ -4,21 +4,27 @@
 # @Last Modified by:   Kelvin
 # @Last Modified time: 2022-03-11 22:19:55
 
+import io
 import os
 import json
+import struct
 import re
 import bz2
 import gzip
 import pandas as pd
 import numpy as np
+import h5py
 import scipy.sparse
 import networkx as nx
 import _pickle as cPickle
 from ..utilities._utilities import *
 from ..utilities._core import *
+from ..utilities._utilities import _compression, _COMPRESSION_MAGIC
+from ..utilities._core import _PARQUET_MANIFEST, _PICKLE_BUFFERS
 from os import PathLike
 from typing import Union, Sequence, Optional
 from collections import defaultdict, OrderedDict
+from collections.abc import Mapping, MutableMapping
 
 AIRR = [
     'cell_id',
@@ -97,6 +103,14 @@ CELLRANGER = [
     'exact_subclonotype_id',
 ]
 
+# magic numbers of the compressed formats read by `read_pkl`
+_PICKLE_MAGIC = {**_COMPRESSION_MAGIC, b'\x04\x22\x4d\x18': 'lz4'}
+# slots that `read_h5` can read
+_H5_SLOTS = [
+    'data', 'metadata', 'edges', 'germline', 'layout', 'graph', 'distance',
+    'clone_index'
+]
+
 
 def fasta_iterator(fh: str):
     """Read in a fasta file as an iterator."""
@@ -134,25 +148,64 @@ def read_pkl(filename: str = 'dandelion_data.pkl.pbz2') -> Dandelion:
     Parameters
     ----------
     filename : str
-        path to `.pkl` file. Depending on the extension, it will try to unzip accordingly.
+        path to `.pkl` file. The compression, bz2, gzip, zstd, lz4 or none, is detected from the first bytes of
+        the file.
 
     Returns
     -------
     Dandelion object.
     """
-    if isBZIP(filename):
-        data = bz2.BZ2File(filename, 'rb')
-        data = cPickle.load(data)
-    elif isGZIP(filename):
-        data = gzip.open(filename, 'rb')
-        data = cPickle.load(data)
+    compression = _compression(filename, _PICKLE_MAGIC)
+    if compression == 'bz2':
+        f = bz2.BZ2File(filename, 'rb')
+    elif compression == 'gzip':
+        f = gzip.open(filename, 'rb')
+    elif compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('Please install zstandard. pip install zstandard')
+        f = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(
+            open(filename, 'rb')))
+    elif compression == 'lz4':
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError('Please install lz4. pip install lz4')
+        f = lz4.frame.open(filename, 'rb')
     else:
-        with open(filename, 'rb') as f:
+        f = open(filename, 'rb')
+    with f:
+        head = f.peek(len(_PICKLE_BUFFERS))[:len(_PICKLE_BUFFERS)]
+        if head == _PICKLE_BUFFERS:
+            f.read(len(_PICKLE_BUFFERS))
+            data = _load_buffers(f)
+        else:
             data = cPickle.load(f)
     return (data)
 
 
-def read_h5(filename: str = 'dandelion_data.h5') -> Dandelion:
+def _load_buffers(f) -> Dandelion:
+    """Unpickle what `_dump_buffers` wrote after `_PICKLE_BUFFERS`, reading each buffer into its own bytearray."""
+    payload_size, n_buffers = struct.unpack('<QQ', f.read(16))
+    sizes = struct.unpack('<{}Q'.format(n_buffers), f.read(8 * n_buffers))
+    payload = f.read(payload_size)
+    buffers = []
+    for size in sizes:
+        buffer = bytearray(size)
+        view, read = memoryview(buffer), 0
+        while read < size:
+            n = f.readinto(view[read:])
+            if not n:
+                raise EOFError('pickle ended before all of its buffers.')
+            read += n
+        buffers.append(buffer)
+    return (cPickle.loads(payload, buffers=buffers))
+
+
+def read_h5(filename: str = 'dandelion_data.h5',
+            slots: Optional[Sequence] = None,
+            backed: bool = False) -> Dandelion:
     """
     Read in and returns a `Dandelion` class from .h5 format.
 
@@ -160,104 +213,324 @@ def read_h5(filename: str = 'dandelion_data.h5') -> Dandelion:
     ----------
     filename : str
         path to `.h5` file
+    slots : Sequence, Optional
+        slots to read, among 'data', 'metadata', 'edges', 'germline', 'layout', 'graph', 'distance' and
+        'clone_index'. None reads every slot.
+    backed : bool
+        whether to leave the distances and layouts on disk. Each distance matrix is read when it is first
+        accessed and the layouts are memory-mapped. The file should not be overwritten by other objects while
+        the returned object is in use.
 
     Returns
     -------
     `Dandelion` object.
     """
-    try:
-        data = pd.read_hdf(filename, 'data')
-        data = sanitize_data(data)
-
-        if check_mix_dtype(data):
-            for x in return_mix_dtype(data):
-                data[x].replace('', pd.NA, inplace=True)
+    if slots is None:
+        slots = _H5_SLOTS
+    constructor = {}
+    if 'data' in slots:
+        try:
+            data = pd.read_hdf(filename, 'data')
             data = sanitize_data(data)
-    except:
-        raise AttributeError(
-            '{} does not contain attribute `data`'.format(filename))
-    try:
-        metadata = pd.read_hdf(filename, 'metadata')
-    except:
-        pass
 
-    try:
-        edges = pd.read_hdf(filename, 'edges')
-    except:
-        pass
-
-    try:
-        g_0 = pd.read_hdf(filename, 'graph/graph_0')
-        g_1 = pd.read_hdf(filename, 'graph/graph_1')
-        g_0 = g_0 + 1
-        g_0 = g_0.fillna(0)
-        g_1 = g_1 + 1
-        g_1 = g_1.fillna(0)
-        graph0 = nx.from_pandas_adjacency(g_0)
-        graph1 = nx.from_pandas_adjacency(g_1)
-        for u, v, d in graph0.edges(data=True):
-            d['weight'] = d['weight'] - 1
-        for u, v, d in graph1.edges(data=True):
-            d['weight'] = d['weight'] - 1
-        graph = (graph0, graph1)
-    except:
-        pass
-
-    with h5py.File(filename, 'r') as hf:
-        try:
-            layout0 = {}
-            for k in hf['layout/layout_0'].attrs.keys():
-                layout0.update({k: np.array(hf['layout/layout_0'].attrs[k])})
-            layout1 = {}
-            for k in hf['layout/layout_1'].attrs.keys():
-                layout1.update({k: np.array(hf['layout/layout_1'].attrs[k])})
-            layout = (layout0, layout1)
+            if check_mix_dtype(data):
+                for x in return_mix_dtype(data):
+                    data[x].replace('', pd.NA, inplace=True)
+                data = sanitize_data(data)
         except:
-            pass
-
-        germline = {}
+            raise AttributeError(
+                '{} does not contain attribute `data`'.format(filename))
+        constructor['data'] = data
+    if 'metadata' in slots:
         try:
-            for g in hf['germline'].attrs:
-                germline.update({g: hf['germline'].attrs[g]})
+            constructor['metadata'] = pd.read_hdf(filename, 'metadata')
         except:
             pass
-
-        distance = Tree()
+    if 'edges' in slots:
         try:
-            for d in hf['distance'].keys():
-                d_ = pd.read_hdf(filename, 'distance/' + d)
-                distance[d] = scipy.sparse.csr_matrix(d_.values)
+            constructor['edges'] = pd.read_hdf(filename, 'edges')
         except:
             pass
 
+    with h5py.File(filename, 'r') as hf:
+        if 'graph' in slots and 'graph' in hf:
+            if hf['graph/graph_0'].attrs.get('format') == 'edgelist':
+                constructor['graph'] = tuple(
+                    _read_graph_h5(hf['graph/graph_' + str(i)])
+                    for i in range(len(hf['graph'])))
+            else:
+                # files written as dense adjacency matrices
+                try:
+                    g_0 = pd.read_hdf(filename, 'graph/graph_0')
+                    g_1 = pd.read_hdf(filename, 'graph/graph_1')
+                    g_0 = g_0 + 1
+                    g_0 = g_0.fillna(0)
+                    g_1 = g_1 + 1
+                    g_1 = g_1.fillna(0)
+                    graph0 = nx.from_pandas_adjacency(g_0)
+                    graph1 = nx.from_pandas_adjacency(g_1)
+                    for u, v, d in graph0.edges(data=True):
+                        d['weight'] = d['weight'] - 1
+                    for u, v, d in graph1.edges(data=True):
+                        d['weight'] = d['weight'] - 1
+                    constructor['graph'] = (graph0, graph1)
+                except:
+                    pass
+
+        if 'layout' in slots and 'layout' in hf:
+            constructor['layout'] = tuple(
+                _read_layout_h5(hf['layout/layout_' + str(i)], backed)
+                for i in range(len(hf['layout'])))
+
+        if 'germline' in slots:
+            germline = {}
+            try:
+                for g in hf['germline'].attrs:
+                    germline.update({g: hf['germline'].attrs[g]})
+            except:
+                pass
+            constructor['germline'] = germline
+
+        if 'distance' in slots:
+            distance = Tree()
+            try:
+                keys = list(hf['distance'].keys())
+                if backed and all(hf['distance/' + d].attrs.get('format') ==
+                                  'csr' for d in keys):
+                    distance = _BackedDistance(filename, keys)
+                else:
+                    for d in keys:
+                        if hf['distance/' +
+                              d].attrs.get('format') == 'csr':
+                            distance[d] = _read_sparse_h5(hf['distance/' +
+                                                             d])
+                        else:
+                            d_ = pd.read_hdf(filename, 'distance/' + d)
+                            distance[d] = scipy.sparse.csr_matrix(d_.values)
+            except:
+                pass
+            constructor['distance'] = distance
+
+        if 'clone_index' in slots:
+            clone_index = {}
+            try:
+                for k in hf['clone_index'].keys():
+                    clone_index[k] = pd.read_hdf(filename, 'clone_index/' + k)
+            except:
+                pass
+            constructor['clone_index'] = clone_index
+
         try:
-            threshold = np.float(np.array(hf['threshold']))
+            threshold = float(np.array(hf['threshold']))
         except:
             threshold = None
 
-    constructor = {}
-    constructor['data'] = data
-    if 'metadata' in locals():
-        constructor['metadata'] = metadata
-    if 'germline' in locals():
-        constructor['germline'] = germline
-    if 'edges' in locals():
-        constructor['edges'] = edges
-    if 'distance' in locals():
-        constructor['distance'] = distance
-    if 'layout' in locals():
-        constructor['layout'] = layout
-    if 'graph' in locals():
-        constructor['graph'] = graph
+    # metadata left out of `slots` is not recomputed
     try:
-        res = Dandelion(**constructor)
+        res = Dandelion(**constructor, initialize='metadata' in slots)
     except:
         res = Dandelion(**constructor, initialize=False)
+    if 'data' not in slots and res.metadata is not None:
+        res.n_obs = res.metadata.shape[0]
 
-    if 'threshold' in locals():
-        res.threshold = threshold
-    else:
-        pass
+    res.threshold = threshold
+    return (res)
+
+
+class _BackedDistance(MutableMapping):
+    """Distance matrices of a `.h5ddl` file, each read from disk when it is first accessed."""
+    def __init__(self, filename: str, keys: Sequence):
+        self._filename = os.path.abspath(filename)
+        self._keys = list(keys)
+        self._loaded = {}
+
+    def __getitem__(self, key: str) -> scipy.sparse.csr_matrix:
+        if key not in self._loaded:
+            if key not in self._keys:
+                raise KeyError(key)
+            with h5py.File(self._filename, 'r') as hf:
+                self._loaded[key] = _read_sparse_h5(hf['distance/' + key])
+        return (self._loaded[key])
+
+    def __setitem__(self, key: str, value):
+        if key not in self._keys:
+            self._keys.append(key)
+        self._loaded[key] = value
+
+    def __delitem__(self, key: str):
+        if key not in self._keys:
+            raise KeyError(key)
+        self._keys.remove(key)
+        self._loaded.pop(key, None)
+
+    def __iter__(self):
+        return (iter(list(self._keys)))
+
+    def __len__(self) -> int:
+        return (len(self._keys))
+
+
+class _MappedLayout(Mapping):
+    """Layout of a `.h5ddl` file, with the coordinates memory-mapped."""
+    def __init__(self, nodes: np.ndarray, coordinates: np.ndarray):
+        self._position = dict(zip(nodes, range(len(nodes))))
+        self._coordinates = coordinates
+
+    def __getitem__(self, node: str) -> np.ndarray:
+        return (np.asarray(self._coordinates[self._position[node]]))
+
+    def __iter__(self):
+        return (iter(self._position))
+
+    def __len__(self) -> int:
+        return (len(self._position))
+
+
+def _read_layout_h5(group: h5py.Group,
+                    backed: bool = False) -> Union[dict, _MappedLayout]:
+    """Read a layout written by `Dandelion.write_h5`, memory-mapping the coordinates if `backed`."""
+    if group.attrs.get('format') != 'coordinates':
+        # files with the coordinates of each node as an attribute
+        return ({k: np.array(group.attrs[k]) for k in group.attrs})
+    nodes = group['nodes'].asstr()[()]
+    coordinates = group['coordinates']
+    offset = coordinates.id.get_offset()
+    if backed and offset is not None:
+        return (_MappedLayout(
+            nodes,
+            np.memmap(group.file.filename,
+                      dtype=coordinates.dtype,
+                      mode='r',
+                      offset=offset,
+                      shape=coordinates.shape)))
+    return (dict(zip(nodes, coordinates[()])))
+
+
+def _read_sparse_h5(group: h5py.Group) -> scipy.sparse.csr_matrix:
+    """Read a sparse matrix written by `_write_sparse_h5`."""
+    return (scipy.sparse.csr_matrix(
+        (group['data'][()], group['indices'][()], group['indptr'][()]),
+        shape=tuple(group.attrs['shape'])))
+
+
+def _read_graph_h5(group: h5py.Group) -> nx.Graph:
+    """Read a graph written by `_write_graph_h5`."""
+    nodes = group['nodes'].asstr()[()]
+    attrs = {
+        key: group['edge_' + key][()]
+        for key in group.attrs['edge_attrs']
+    }
+    G = nx.Graph()
+    G.add_nodes_from(nodes)
+    G.add_edges_from(
+        (nodes[u], nodes[v], {key: attrs[key][i].item()
+                              for key in attrs})
+        for i, (u, v) in enumerate(
+            zip(group['source'][()], group['target'][()])))
+    return (G)
+
+
+def read_parquet(path: str = 'dandelion_data.parquet',
+                 slots: Optional[Sequence] = None,
+                 columns: Optional[Sequence] = None,
+                 row_groups: Optional[Sequence] = None) -> Dandelion:
+    """
+    Read in and returns a `Dandelion` class from a directory written by `Dandelion.write_parquet`.
+
+    Parameters
+    ----------
+    path : str
+        path to the directory.
+    slots : Sequence, Optional
+        slots to read, among 'data', 'metadata', 'edges', 'germline', 'layout', 'graph', 'distance' and
+        'clone_index'. None reads every slot.
+    columns : Sequence, Optional
+        columns of the data to read. sequence_id is always read, columns not in the file are skipped. None reads
+        all columns.
+    row_groups : Sequence, Optional
+        row groups of the data to read, of about `row_group_size` contigs each and never splitting a cell. The
+        metadata is then restricted to the cells read; the other slots are read whole. None reads all contigs.
+
+    Returns
+    -------
+    `Dandelion` object.
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('Please install pyarrow. pip install pyarrow')
+
+    with open(os.path.join(path, _PARQUET_MANIFEST)) as f:
+        manifest = json.load(f)
+    stored = manifest['slots']
+    slots = list(stored) if slots is None else [s for s in slots if s in stored]
+
+    def read_table(name: str,
+                   columns: Optional[Sequence] = None,
+                   row_groups: Optional[Sequence] = None) -> pd.DataFrame:
+        file = pq.ParquetFile(os.path.join(path, name))
+        if columns is not None:
+            columns = set(columns) | {'sequence_id'}
+            columns = [c for c in file.schema_arrow.names if c in columns]
+        if row_groups is None:
+            table = file.read(columns=columns)
+        else:
+            table = file.read_row_groups(row_groups, columns=columns)
+        return (table.to_pandas())
+
+    constructor = {}
+    if 'data' in slots:
+        data = read_table(stored['data'], columns, row_groups)
+        data.set_index('sequence_id', drop=False, inplace=True)
+        # blanks of integer fields were written as nan
+        constructor['data'] = sanitize_data(data, validate='none')
+    if 'metadata' in slots:
+        metadata = read_table(stored['metadata'])
+        if row_groups is not None:
+            cells = read_table(stored['data'], ['cell_id'],
+                               row_groups)['cell_id']
+            metadata = metadata[metadata.index.isin(cells)]
+        constructor['metadata'] = metadata
+    if 'edges' in slots:
+        constructor['edges'] = read_table(stored['edges'])
+    if 'germline' in slots:
+        germline = read_table(stored['germline'])
+        constructor['germline'] = dict(
+            zip(germline['gene'], germline['sequence']))
+    if 'layout' in slots:
+        layout = [read_table(l) for l in stored['layout']]
+        constructor['layout'] = tuple(
+            dict(zip(l.index, l.to_numpy())) for l in layout)
+    if 'graph' in slots:
+        graph = []
+        for g in stored['graph']:
+            nodes, edges = read_table(g['nodes']), read_table(g['edges'])
+            attrs = [c for c in edges if c not in ['source', 'target']]
+            G = nx.Graph()
+            G.add_nodes_from(nodes['node'])
+            G.add_edges_from(
+                zip(edges['source'], edges['target'],
+                    edges[attrs].to_dict('records')))
+            graph.append(G)
+        constructor['graph'] = tuple(graph)
+    if 'distance' in slots:
+        distance = Tree()
+        for d, spec in stored['distance'].items():
+            coo = read_table(spec['file'])
+            distance[d] = scipy.sparse.csr_matrix(
+                (coo['value'].values, (coo['row'].values, coo['col'].values)),
+                shape=tuple(spec['shape']))
+        constructor['distance'] = distance
+    if 'clone_index' in slots:
+        constructor['clone_index'] = {
+            k: read_table(f)
+            for k, f in stored['clone_index'].items()
+        }
+
+    res = Dandelion(**constructor, initialize=False)
+    if res.metadata is not None:
+        res.n_obs = res.metadata.shape[0]
+    res.threshold = manifest.get('threshold')
     return (res)
 
 
@@ -371,6 +644,9 @@ def concat(arrays: Sequence[Union[pd.DataFrame, Dandelion]],
     """
     Concatenate dataframe and return as `Dandelion` object.
 
+    If exactly one of the `Dandelion` objects has a clone index from `find_clones`, it is carried over so that
+    the new contigs can be assigned with `find_clones(..., incremental=True)`.
+
     Parameters
     ----------
     arrays : Sequence
@@ -402,10 +678,16 @@ def concat(arrays: Sequence[Union[pd.DataFrame, Dandelion]],
             df = pd.concat(arrays_, verify_integrity=True)
     else:
         df = pd.concat(arrays_)
+    clone_indices = [
+        x.clone_index for x in arrays
+        if len(getattr(x, 'clone_index', {})) > 0
+    ]
     try:
-        out = Dandelion(df)
+        out = Dandelion(df, lazy=True)
     except:
         out = Dandelion(df, initialize=False)
+    if len(clone_indices) == 1:
+        out.clone_index.update(clone_indices[0])
     return (out)
 
 
@@ -554,7 +836,7 @@ def read_10x_vdj(path: Union[str, PathLike],
     # quick check if locus is malformed
     res = res[~res['locus'].str.contains('[|]')]
     if return_dandelion:
-        return (Dandelion(res))
+        return (Dandelion(res, lazy=True))
     else:
         return (res)
 
@@ -6,6 +6,7 @@
 
 import os
 import re
+import hashlib
 import pandas as pd
 import numpy as np
 
@@ -16,10 +17,10 @@ try:
 except ImportError:
     from collections import Iterable
 
-from airr import RearrangementSchema
+from airr import RearrangementSchema, ValidationError
 from subprocess import run
 
-from typing import Sequence, Tuple, Dict, Union, Optional
+from typing import Sequence, Tuple, Dict, Union, Optional, Iterator
 try:
     from typing import Literal
 except ImportError:
@@ -324,52 +325,207 @@ def return_mix_dtype(data):
     return (check)
 
 
-def sanitize_data(data, ignore='clone_id'):
-    """Quick sanitize dtypes."""
-    data = data.astype('object')
-    data = data.infer_objects()
-    for d in data:
-        if d in RearrangementSchema.properties:
-            if RearrangementSchema.properties[d]['type'] in [
-                    'string', 'boolean', 'integer'
-            ]:
-                data[d].replace([None, np.nan, pd.NA, 'nan', ''],
-                                '',
-                                inplace=True)
-                if RearrangementSchema.properties[d]['type'] == 'integer':
-                    data[d] = [
-                        int(x) if present(x) else ''
-                        for x in pd.to_numeric(data[d])
-                    ]
-            else:
-                data[d].replace([None, pd.NA, np.nan, 'nan', ''],
-                                np.nan,
-                                inplace=True)
+_AIRR_TYPES = {
+    field: spec.get('type')
+    for field, spec in RearrangementSchema.properties.items()
+}
+_MISSING = [None, np.nan, pd.NA, 'nan', '']
+_AIRR_CONVERTERS = {
+    'boolean': 'to_bool',
+    'integer': 'to_int',
+    'number': 'to_float'
+}
+_VALIDATION_POLICIES = ['none', 'header', 'sample', 'full']
+_AIRR_VALIDATION = {'policy': 'sample', 'sample': 1000}
+# magic numbers of the compressed formats read by `read_airr`
+_COMPRESSION_MAGIC = {
+    b'\x1f\x8b': 'gzip',
+    b'BZh': 'bz2',
+    b'\x28\xb5\x2f\xfd': 'zstd',
+    b'\xfd7zXZ\x00': 'xz',
+    b'PK\x03\x04': 'zip'
+}
+_TRAVDV_COLUMNS = [
+    'sequence_id', 'cell_id', 'v_call', 'd_call', 'j_call', 'c_call', 'locus'
+]
+
+
+def _to_int(values: pd.Series) -> pd.Series:
+    """Whole numbers, with blanks for missing values."""
+    values = pd.to_numeric(values)
+    present_ = values.notna().values
+    if present_.all():
+        return (pd.Series(values.values.astype('int64'), index=values.index))
+    out = np.full(values.shape[0], '', dtype=object)
+    out[present_] = values.values[present_].astype('int64')
+    return (pd.Series(out, index=values.index))
+
+
+def _sanitize_column(values: pd.Series,
+                     column: str,
+                     ignore: str = 'clone_id') -> pd.Series:
+    """
+    Sanitize the dtype of one column according to the AIRR schema.
+
+    Parameters
+    ----------
+    values : pd.Series
+        column to sanitize.
+    column : str
+        name of the column.
+    ignore : str
+        column to leave as is if it is not in the AIRR schema.
+
+    Returns
+    -------
+    sanitized `pandas.Series`.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # sanitize the categories, with nan standing for missing values
+        categories = _sanitize_column(
+            pd.Series(list(values.cat.categories) + [np.nan], dtype=object),
+            column, ignore)
+        codes = np.where(values.cat.codes.values < 0, categories.shape[0] - 1,
+                         values.cat.codes.values)
+        if categories.dtype != object:
+            return (pd.Series(categories.values[codes],
+                              index=values.index,
+                              name=values.name))
+        new_codes, uniques = pd.factorize(categories.values)
+        return (pd.Series(pd.Categorical.from_codes(new_codes[codes],
+                                                    categories=uniques),
+                          index=values.index,
+                          name=values.name))
+    if isinstance(values.dtype, pd.StringDtype):
+        # long strings, only missing values need blanking
+        missing = values.isna().values | (values == 'nan').fillna(False).values
+        if missing.any():
+            values = values.copy()
+            values[missing] = ''
+        return (values)
+    values = values.astype('object').infer_objects()
+    if column in _AIRR_TYPES:
+        if _AIRR_TYPES[column] in ['string', 'boolean', 'integer']:
+            values = values.replace(_MISSING, '')
+            if _AIRR_TYPES[column] == 'integer':
+                values = _to_int(values)
         else:
-            if d != ignore:
-                try:
-                    data[d] = pd.to_numeric(data[d])
-                except:
-                    data[d].replace(
-                        to_replace=[None, np.nan, pd.NA, 'nan', ''],
-                        value='',
-                        inplace=True)
-        if re.search('mu_freq', d):
-            data[d] = [
-                float(x) if present(x) else np.nan
-                for x in pd.to_numeric(data[d])
-            ]
-        if re.search('mu_count', d):
-            data[d] = [
-                int(x) if present(x) else '' for x in pd.to_numeric(data[d])
-            ]
-    try:
-        data = check_travdv(data)
-    except:
-        pass
+            values = values.replace(_MISSING, np.nan)
+    elif column != ignore:
+        try:
+            values = pd.to_numeric(values)
+        except:
+            values = values.replace(_MISSING, '')
+    if re.search('mu_freq', column):
+        values = pd.to_numeric(values).astype('float64')
+    if re.search('mu_count', column):
+        values = _to_int(values)
+    return (values)
+
+
+def _column_digest(values: Union[pd.Series, pd.Index]) -> str:
+    """
+    Digest of the values of a column. Object columns are digested by the hashes of their values, along with the
+    kinds of values they hold, as values that aren't strings are hashed as their str.
+    """
+    array = values.values
+    if isinstance(array, np.ndarray):
+        array = np.ascontiguousarray(array)
+        if array.nbytes == 0:
+            buffer = b''
+        elif array.dtype == object:
+            hashes = pd.util.hash_pandas_object(pd.Series(array),
+                                                index=False).values
+            buffer = hashes.tobytes() + pd.api.types.infer_dtype(
+                array, skipna=False).encode()
+        else:
+            buffer = array.view(np.uint8)
+    elif isinstance(array, pd.Categorical):
+        buffer = _column_digest(pd.Index(array.categories)).encode(
+        ) + array.codes.tobytes()
+    else:
+        buffer = pd.util.hash_pandas_object(pd.Series(array),
+                                            index=False).values
+    digest = hashlib.blake2b(buffer, digest_size=16).hexdigest()
+    return (str(values.dtype) + ':' + str(len(values)) + ':' + digest)
+
+
+def _fingerprint(data: pd.DataFrame) -> Dict:
+    """Digest of every column and of the index of a data frame."""
+    return ({
+        'index': _column_digest(data.index),
+        'columns': {d: _column_digest(data[d])
+                    for d in data},
+    })
+
+
+def _dirty_columns(data: pd.DataFrame, ignore: str) -> Tuple[list, bool]:
+    """
+    Columns that changed since `data` was last sanitized and whether the index changed too. Everything is dirty
+    if `data` was not sanitized before.
+    """
+    previous = data.attrs.get('sanitized')
+    if previous is None or not data.columns.is_unique:
+        return (list(data.columns), True)
+    current = _fingerprint(data)
+    dirty = [
+        d for d in data
+        if previous['columns'].get(d) != current['columns'][d] or (
+            previous['ignore'] != ignore and d in [previous['ignore'], ignore])
+    ]
+    return (dirty, previous['index'] != current['index'])
+
+
+def sanitize_data(data: pd.DataFrame,
+                  ignore: str = 'clone_id',
+                  validate: Optional[Literal['none', 'header', 'sample',
+                                             'full']] = None,
+                  sample: Optional[int] = None) -> pd.DataFrame:
+    """
+    Quick sanitize dtypes.
+
+    The sanitized data frame carries a digest of its columns in `.attrs`. Sanitizing it, or a copy of it, again
+    only coerces the columns that changed in the meantime, and only validates it if something changed or
+    `validate` is given.
 
-    # check if airr-standards is happy
-    validate_airr(data)
+    Parameters
+    ----------
+    data : pd.DataFrame
+        AIRR data frame.
+    ignore : str
+        column to leave as is if it is not in the AIRR schema.
+    validate : Literal['none', 'header', 'sample', 'full'], Optional
+        how to validate the data against the AIRR schema. See `validate_airr`.
+    sample : int, Optional
+        number of contigs validated with the 'sample' policy. See `validate_airr`.
+
+    Returns
+    -------
+    sanitized `pandas.DataFrame`.
+    """
+    dirty, index_changed = _dirty_columns(data, ignore)
+    if len(dirty) > 0 and data.columns.is_unique:
+        data = pd.concat([
+            _sanitize_column(data[d], d, ignore) if d in dirty else data[d]
+            for d in data
+        ],
+                         axis=1,
+                         keys=data.columns)
+    else:
+        data = data.copy()
+        for d in dirty:
+            data[d] = _sanitize_column(data[d], d, ignore)
+    if index_changed or any(d in dirty for d in _TRAVDV_COLUMNS):
+        try:
+            data = check_travdv(data)
+        except:
+            pass
+    if len(dirty) > 0 or index_changed or validate is not None:
+        # check if airr-standards is happy
+        validate_airr(data, policy=validate, sample=sample)
+    fingerprint = _fingerprint(data)
+    fingerprint.update({'ignore': ignore})
+    data.attrs['sanitized'] = fingerprint
     return (data)
 
 
@@ -431,96 +587,246 @@ def sanitize_data_for_saving(data):
     return (tmp)
 
 
-def validate_airr(data):
-    """Validate dtypes in airr table."""
-    tmp = data.copy()
+def set_airr_validation(policy: Literal['none', 'header', 'sample',
+                                       'full'] = 'sample',
+                        sample: int = 1000):
+    """
+    Set how AIRR tables are validated against the schema when they are sanitized, e.g. when a `Dandelion` object
+    is created.
+
+    Parameters
+    ----------
+    policy : Literal['none', 'header', 'sample', 'full']
+        'none' skips validation. 'header' checks that the required columns are there. 'sample' also validates
+        the values of `sample` random contigs and 'full' those of every contig.
+    sample : int
+        number of contigs validated with the 'sample' policy.
+    """
+    if policy not in _VALIDATION_POLICIES:
+        raise ValueError('policy must be one of {}.'.format(
+            ', '.join(_VALIDATION_POLICIES)))
+    _AIRR_VALIDATION.update({'policy': policy, 'sample': sample})
+
+
+def _filled_columns(data: pd.DataFrame) -> list:
+    """Columns whose missing values are blanked, and so skipped, before validation."""
     int_columns = []
-    for d in tmp:
+    for d in data:
+        if data[d].dtype.kind == 'f' and data[d].isna().any():
+            # nan is swapped for pd.NA, which float columns can't hold
+            continue
         try:
-            tmp[d].replace(np.nan, pd.NA).astype("Int64")
+            data[d].astype("Int64")
             int_columns.append(d)
         except:
             pass
     bool_columns = [
         'rev_comp', 'productive', 'vj_in_frame', 'stop_codon', 'complete_vdj'
     ]
-    str_columns = list(tmp.dtypes[tmp.dtypes == 'object'].index)
-    columns = [
+    str_columns = list(data.dtypes[data.dtypes == 'object'].index)
+    return ([
         c for c in list(set(int_columns + str_columns + bool_columns))
-        if c in tmp
+        if c in data
+    ])
+
+
+def _validate_column(values: pd.Series, field: str, filled: bool = True):
+    """Validate the values of a column against the type of its AIRR field, once per unique value."""
+    spec = _AIRR_TYPES.get(field)
+    if spec not in _AIRR_CONVERTERS:
+        return
+    if values.dtype.kind in 'biu' or (spec == 'number'
+                                      and values.dtype.kind == 'f'):
+        return
+    if filled:
+        values = values[values.notna()]
+    try:
+        uniques = pd.unique(values.values)
+    except TypeError:
+        uniques = values.values
+    convert = getattr(RearrangementSchema, _AIRR_CONVERTERS[spec])
+    for value in uniques:
+        if value is None or (isinstance(value, str) and value == ''):
+            continue
+        try:
+            convert(value, validate=True)
+        except ValidationError as e:
+            raise ValidationError('field %s has %s' % (field, e))
+
+
+def validate_airr(data: pd.DataFrame,
+                  policy: Optional[Literal['none', 'header', 'sample',
+                                           'full']] = None,
+                  sample: Optional[int] = None):
+    """
+    Validate dtypes in airr table.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        AIRR data frame.
+    policy : Literal['none', 'header', 'sample', 'full'], Optional
+        'none' skips validation. 'header' checks that the required columns are there. 'sample' also validates
+        the values of `sample` random contigs and 'full' those of every contig. None uses the policy set with
+        `set_airr_validation`, 'sample' by default.
+    sample : int, Optional
+        number of contigs validated with the 'sample' policy. None uses the number set with
+        `set_airr_validation`, 1000 by default.
+    """
+    policy = _AIRR_VALIDATION['policy'] if policy is None else policy
+    sample = _AIRR_VALIDATION['sample'] if sample is None else sample
+    if policy not in _VALIDATION_POLICIES:
+        raise ValueError('policy must be one of {}.'.format(
+            ', '.join(_VALIDATION_POLICIES)))
+    if policy == 'none':
+        return
+    header = list(data.columns) + [
+        required for required in [
+            'sequence', 'rev_comp', 'sequence_alignment', 'germline_alignment',
+            'v_cigar', 'd_cigar', 'j_cigar'
+        ] if required not in data
     ]
-    if len(columns) > 0:
-        for c in columns:
-            tmp[c].fillna('', inplace=True)
-    for _, row in tmp.iterrows():
-        contig = Contig(row).contig
-        for required in [
-                'sequence', 'rev_comp', 'sequence_alignment',
-                'germline_alignment', 'v_cigar', 'd_cigar', 'j_cigar'
-        ]:
-            if required not in contig:
-                contig.update({required: ''})
-    RearrangementSchema.validate_header(contig.keys())
-    RearrangementSchema.validate_row(contig)
+    RearrangementSchema.validate_header(header)
+    if policy == 'header':
+        return
+    if policy == 'sample' and sample < data.shape[0]:
+        data = data.sample(sample, random_state=0)
+    filled = _filled_columns(data)
+    for d in data:
+        _validate_column(data[d], d, filled=d in filled)
 
 
 def check_travdv(data):
     data = load_data(data)
     contig = [x for x in data['sequence_id']]
-    v = [x for x in data['v_call']]
-    d = [x for x in data['d_call']]
-    j = [x for x in data['j_call']]
-    c = [x for x in data['c_call']]
     l = [x for x in data['locus']]
-    v_dict = dict(zip(contig, v))
-    d_dict = dict(zip(contig, d))
-    j_dict = dict(zip(contig, j))
-    c_dict = dict(zip(contig, c))
-    l_dict = dict(zip(contig, l))
-    for co in contig:
-        if re.search('TRAV.*/DV', v_dict[co]):
-            if same_call(j_dict[co], c_dict[co], d_dict[co], 'TRA'):
-                if not re.search('TRA', l_dict[co]):
-                    l_dict[co] = 'TRA'
-            elif same_call(j_dict[co], c_dict[co], d_dict[co], 'TRD'):
-                if not re.search('TRD', l_dict[co]):
-                    l_dict[co] = 'TRD'
-    data['locus'] = pd.Series(l_dict)
+    j, c, d = (data[x].values for x in ['j_call', 'c_call', 'd_call'])
+    travdv = data['v_call'].str.contains('TRAV.*/DV', na=False).values
+    for i in np.flatnonzero(travdv):
+        if same_call(j[i], c[i], d[i], 'TRA'):
+            if not re.search('TRA', l[i]):
+                l[i] = 'TRA'
+        elif same_call(j[i], c[i], d[i], 'TRD'):
+            if not re.search('TRD', l[i]):
+                l[i] = 'TRD'
+    data['locus'] = pd.Series(dict(zip(contig, l)))
     return (data)
 
 
-def load_data(obj: Union[pd.DataFrame, str]) -> pd.DataFrame:
+def _compression(file: str, magic: Optional[Dict] = None) -> Optional[str]:
+    """Compression of a file, from its first bytes rather than its extension; None if none of `magic` match."""
+    if magic is None:
+        magic = _COMPRESSION_MAGIC
+    with open(file, 'rb') as f:
+        head = f.read(max(len(m) for m in magic))
+    for m, compression in magic.items():
+        if head.startswith(m):
+            return (compression)
+    return (None)
+
+
+def _airr_csv_kwargs(file: str, usecols: Optional[Sequence] = None) -> Dict:
+    """Arguments of `pd.read_csv` to read the `usecols` columns of an AIRR file, with AIRR string fields as str."""
+    # other formats, e.g. tar, are left to pandas to infer from the extension
+    compression = _compression(file) or 'infer'
+    header = pd.read_csv(file, sep='\t', nrows=0,
+                         compression=compression).columns
+    if usecols is not None:
+        usecols = set(usecols) | {'sequence_id'}
+        header = [c for c in header if c in usecols]
+    return ({
+        'sep': '\t',
+        'compression': compression,
+        'usecols': None if usecols is None else header,
+        'dtype': {c: str
+                  for c in header if _AIRR_TYPES.get(c) == 'string'},
+    })
+
+
+def _format_airr(obj_: pd.DataFrame) -> pd.DataFrame:
+    """Set sequence_id as index without dropping and fill cell_id from it."""
+    if 'sequence_id' in obj_.columns:
+        obj_.set_index('sequence_id', drop=False, inplace=True)
+        obj_['cell_id'] = obj_['sequence_id'].astype(str).str.split(
+            '_contig', n=1).str[0]
+    else:
+        raise KeyError("'sequence_id' not found in columns of input")
+    return (obj_)
+
+
+def read_airr(file: str, usecols: Optional[Sequence] = None) -> pd.DataFrame:
+    """
+    Read an AIRR rearrangement .tsv file, optionally compressed with gzip, bz2, zstd, xz or zip.
+
+    Parameters
+    ----------
+    file : str
+        path to .tsv file. The compression is detected from the content of the file.
+    usecols : Sequence, Optional
+        columns to read. sequence_id is always read, columns not in the file are skipped. None reads all columns.
+
+    Returns
+    -------
+    pandas DataFrame object with sequence_id as index.
+    """
+    return (_format_airr(pd.read_csv(file, **_airr_csv_kwargs(file,
+                                                             usecols))))
+
+
+def iter_airr(file: str,
+              chunksize: int = 100000,
+              usecols: Optional[Sequence] = None) -> Iterator[pd.DataFrame]:
+    """
+    Read an AIRR rearrangement .tsv file in chunks of contigs, without holding the whole table in memory.
+
+    Parameters
+    ----------
+    file : str
+        path to .tsv file, optionally compressed with gzip, bz2, zstd, xz or zip.
+    chunksize : int
+        number of contigs per chunk. Contigs of the same cell can be split across chunks.
+    usecols : Sequence, Optional
+        columns to read. sequence_id is always read, columns not in the file are skipped. None reads all columns.
+
+    Yields
+    ------
+    pandas DataFrame objects with sequence_id as index, as returned by `read_airr`.
+    """
+    with pd.read_csv(file, chunksize=chunksize,
+                     **_airr_csv_kwargs(file, usecols)) as reader:
+        for chunk in reader:
+            yield (_format_airr(chunk))
+
+
+def load_data(obj: Union[pd.DataFrame, str],
+              usecols: Optional[Sequence] = None) -> pd.DataFrame:
     """
     Read in or copy dataframe object and set sequence_id as index without dropping.
 
     Parameters
     ----------
     obj : DataFrame, str
-        file path to .tsv file or pandas DataFrame object.
+        file path to .tsv file, optionally compressed with gzip, bz2, zstd, xz or zip, or pandas DataFrame object.
+    usecols : Sequence, Optional
+        columns to keep. sequence_id is always kept, columns not in the data are skipped. None keeps all columns.
 
     Returns
     -------
     pandas DataFrame object.
     """
-    if os.path.isfile(str(obj)):
-        try:
-            obj_ = pd.read_csv(obj, sep='\t')
-        except FileNotFoundError as e:
-            print(e)
-    elif isinstance(obj, pd.DataFrame):
-        obj_ = obj.copy()
+    if isinstance(obj, pd.DataFrame):
+        if usecols is not None:
+            usecols = set(usecols) | {'sequence_id'}
+            obj_ = obj[[c for c in obj if c in usecols]].copy()
+        else:
+            obj_ = obj.copy()
+    elif os.path.isfile(str(obj)):
+        return (read_airr(obj, usecols=usecols))
     else:
         raise FileNotFoundError(
             "Either input is not of <class 'pandas.core.frame.DataFrame'> or file does not exist."
         )
-
-    if 'sequence_id' in obj_.columns:
-        obj_.set_index('sequence_id', drop=False, inplace=True)
-        obj_['cell_id'] = [c.split('_contig')[0] for c in obj_['sequence_id']]
-    else:
-        raise KeyError("'sequence_id' not found in columns of input")
-
-    return (obj_)
+    return (_format_airr(obj_))
 
 
 class ContigDict(dict):
@@ -1078,6 +1078,21 @@ def airr_reannotated():
     return (annotated)
 
 
+@pytest.fixture
+def airr_reannotated_copies(airr_reannotated):
+    """Make a table of `n` copies of the cells in airr_reannotated, with the ids of the copies prefixed by b, c, ..."""
+    def copies(n):
+        dat = []
+        for i in [''] + list('bcdefgh')[:n - 1]:
+            tmp = airr_reannotated.copy()
+            tmp['sequence_id'] = i + tmp['sequence_id']
+            tmp['cell_id'] = i + tmp['cell_id']
+            dat.append(tmp)
+        return (pd.concat(dat, ignore_index=True))
+
+    return (copies)
+
+
 @pytest.fixture
 def fasta_10x_tr1():
     """Standard cellranger fasta file to test the preprocessing."""
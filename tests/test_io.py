@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+import pytest
+import h5py
+import pandas as pd
+import dandelion as ddl
+
+from fixtures import airr_reannotated, airr_reannotated_copies
+
+
+def test_read_airr(airr_reannotated, tmp_path):
+    f = tmp_path / 'airr.tsv.gz'
+    airr_reannotated.to_csv(f, sep='\t', index=False)
+    dat = ddl.load_data(str(f))
+    assert dat.shape == airr_reannotated.shape
+    assert (dat.index == airr_reannotated['sequence_id']).all()
+    dat = ddl.read_airr(str(f), usecols=['cell_id', 'locus', 'not_a_column'])
+    assert list(dat.columns) == ['sequence_id', 'locus', 'cell_id']
+    chunks = list(ddl.iter_airr(str(f), chunksize=4, usecols=['locus']))
+    assert [c.shape[0] for c in chunks] == [4, 4, 1]
+    pd.testing.assert_frame_equal(pd.concat(chunks), dat)
+    for ext in ['tsv', 'tsv.xz', 'tsv.zip']:
+        f = tmp_path / ('airr.' + ext)
+        airr_reannotated.to_csv(f, sep='\t', index=False)
+        assert ddl.load_data(str(f)).shape == airr_reannotated.shape
+
+
+@pytest.mark.parametrize("extension,compression,module",
+                         [('pkl', 'none', None), ('pkl.pbz2', 'bz2', None),
+                          ('pkl.gz', 'gzip', None),
+                          ('pkl.zst', 'zstd', 'zstandard'),
+                          ('pkl.lz4', 'lz4', 'lz4')])
+def test_write_pkl(airr_reannotated, tmp_path, extension, compression,
+                   module):
+    if module is not None:
+        pytest.importorskip(module)
+    vdj = ddl.Dandelion(airr_reannotated)
+    f = tmp_path / ('vdj.' + extension)
+    vdj.write_pkl(f)
+    vdj2 = ddl.read_pkl(f)
+    assert vdj2.data.equals(vdj.data)
+    assert vdj2.metadata.equals(vdj.metadata)
+    # read_pkl detects the compression from the file, not the extension
+    f = tmp_path / 'vdj'
+    vdj.write_pkl(f, compression=compression)
+    assert ddl.read_pkl(f).data.equals(vdj.data)
+
+
+def test_write_parquet(airr_reannotated_copies, tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    vdj = ddl.Dandelion(airr_reannotated_copies(2))
+    ddl.tl.find_clones(vdj)
+    ddl.tl.generate_network(vdj)
+    vdj.threshold = 0.1
+    f = tmp_path / 'vdj.parquet'
+    vdj.write_parquet(str(f), row_group_size=4)
+    vdj2 = ddl.read_parquet(str(f))
+    pd.testing.assert_frame_equal(vdj2.data, vdj.data)
+    pd.testing.assert_frame_equal(vdj2.metadata, vdj.metadata)
+    pd.testing.assert_frame_equal(vdj2.edges, vdj.edges)
+    for x in vdj.distance:
+        assert (vdj2.distance[x] != vdj.distance[x]).nnz == 0
+    for g, g2 in zip(vdj.graph, vdj2.graph):
+        assert sorted(g.edges(data=True)) == sorted(g2.edges(data=True))
+    assert list(vdj2.layout[0]) == list(vdj.layout[0])
+    assert vdj2.threshold == 0.1
+    # only some slots, columns and row groups
+    vdj3 = ddl.read_parquet(str(f),
+                            slots=['data', 'metadata'],
+                            columns=['cell_id', 'v_call'],
+                            row_groups=[0])
+    assert set(vdj3.data.columns) == {'sequence_id', 'cell_id', 'v_call'}
+    assert vdj3.distance is None
+    # row groups hold whole cells, and the metadata follows the cells read
+    pf = pq.ParquetFile(str(f / 'data.parquet'))
+    assert pf.num_row_groups > 1
+    cells = [
+        set(pf.read_row_group(i, columns=['cell_id'])['cell_id'].to_pylist())
+        for i in range(pf.num_row_groups)
+    ]
+    assert sum(len(c) for c in cells) == len(set.union(*cells))
+    assert set(vdj3.data['cell_id']) == cells[0]
+    assert set(vdj3.metadata.index) == cells[0]
+    assert vdj3.n_obs == len(cells[0])
+
+
+def test_write_h5_sparse(airr_reannotated_copies, tmp_path):
+    vdj = ddl.Dandelion(airr_reannotated_copies(2))
+    ddl.tl.find_clones(vdj)
+    ddl.tl.generate_network(vdj)
+    f = tmp_path / 'vdj.h5ddl'
+    vdj.write_h5(f, keep_distance=True)
+    with h5py.File(f, 'r') as hf:
+        assert 'indptr' in hf['distance/' + list(vdj.distance)[0]]
+        assert 'source' in hf['graph/graph_0']
+    vdj2 = ddl.read_h5(f)
+    for x in vdj.distance:
+        assert (vdj2.distance[x] != vdj.distance[x]).nnz == 0
+    for g, g2 in zip(vdj.graph, vdj2.graph):
+        assert list(g.nodes) == list(g2.nodes)
+        assert sorted(g.edges(data=True)) == sorted(g2.edges(data=True))
+    vdj3 = ddl.read_h5(f, slots=['metadata', 'layout', 'distance'],
+                       backed=True)
+    assert vdj3.data is None
+    assert vdj3.n_obs == vdj.n_obs
+    assert vdj3.threshold == vdj.threshold
+    for x in vdj.distance:
+        assert (vdj3.distance[x] != vdj.distance[x]).nnz == 0
+    for l, l3 in zip(vdj.layout, vdj3.layout):
+        assert list(l) == list(l3)
+        assert all((l[k] == l3[k]).all() for k in l)
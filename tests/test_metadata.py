@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+import pandas as pd
+import dandelion as ddl
+
+from fixtures import airr_reannotated, airr_reannotated_copies
+
+
+def test_query(airr_reannotated):
+    from dandelion.utilities._core import Query
+    q = Query(airr_reannotated)
+    out = q.retrieve('locus', 'split and unique only')
+    assert list(out.columns) == ['locus_VJ', 'locus_VDJ']
+    assert list(out.index) == list(airr_reannotated['cell_id'].unique())
+    assert list(out['locus_VDJ']) == ['', 'IGH', 'IGH', 'IGH', 'IGH']
+    out = q.retrieve('umi_count', 'split and average')
+    assert list(out['umi_count_VJ']) == [68, 43, 90, 22, 8]
+    out = q.retrieve('umi_count', 'sum')
+    assert list(out['umi_count']) == [68, 94, 137, 102, 26]
+    out = q.retrieve('umi_count', 'split')
+    assert out.loc['AAACCTGTCATATCGG-1'].isnull().tolist() == [False, True]
+    out = q.retrieve('locus', 'merge and unique only')
+    assert out.loc['AAACCTGTCGAGAACG-1', 'locus'] == 'IGH|IGL'
+
+
+def test_metadata_order(airr_reannotated):
+    # cells in reverse order, each with its contigs in the same order
+    cells = airr_reannotated['cell_id'].unique()[::-1]
+    dat = pd.concat(
+        [airr_reannotated[airr_reannotated['cell_id'] == c] for c in cells])
+    # clones A and B tie on size
+    dat['clone_id'] = dat['cell_id'].map(
+        dict(zip(sorted(cells), ['A', 'A', 'B', 'B', 'C'])))
+    vdj = ddl.Dandelion(dat)
+    assert list(vdj.metadata.index) == sorted(cells)
+    assert list(vdj.metadata['clone_id_by_size']) == ['1', '1', '2', '2', '3']
+    # columns follow the chains of the first cell
+    vdj2 = ddl.Dandelion(dat.sort_values('cell_id', kind='stable'))
+    pd.testing.assert_frame_equal(vdj.metadata,
+                                  vdj2.metadata[vdj.metadata.columns])
+
+
+def test_metadata_status(airr_reannotated):
+    vdj = ddl.Dandelion(airr_reannotated)
+    assert list(vdj.metadata['locus_status']) == [
+        'IGK_only', 'IGH + IGK', 'IGH + IGL', 'IGH + IGK', 'IGH + IGL'
+    ]
+    assert list(vdj.metadata['productive']) == [
+        'T', 'T + T', 'T + T', 'T + T', 'T + F'
+    ]
+    assert list(vdj.metadata['vdj_status_summary']) == [
+        'Single', 'Multi', 'Multi', 'Multi', 'Single'
+    ]
+    dat = airr_reannotated.copy()
+    dat.loc[dat['locus'] == 'IGH', 'c_call'] = 'IGHM,IGHD'
+    vdj = ddl.Dandelion(dat)
+    assert set(vdj.metadata['isotype_summary']) <= {
+        'IgM|IgD', 'IgD|IgM', 'unassigned'
+    }
+    assert list(vdj.metadata['constant_status_summary']) == ['Single'] * 5
+
+
+def test_lazy_metadata(airr_reannotated):
+    vdj = ddl.Dandelion(airr_reannotated)
+    lazy = ddl.Dandelion(airr_reannotated, lazy=True)
+    assert lazy.n_obs == vdj.n_obs
+    assert lazy._metadata is None
+    status = lazy.get_metadata(['locus_status', 'isotype'])
+    assert lazy._metadata is None
+    assert 'productive_status' not in lazy._metadata_builder.cache
+    assert status.equals(vdj.metadata[['locus_status', 'isotype']])
+    pd.testing.assert_frame_equal(lazy.metadata, vdj.metadata)
+    # replacing a column in .data only rebuilds the columns derived from it
+    lazy.data['c_call'] = 'IGHG1'
+    assert list(lazy.metadata['isotype']) == ['unassigned'] + ['IgG'] * 4
+    assert lazy.metadata['vdj_status'].equals(vdj.metadata['vdj_status'])
+    lazy.metadata = vdj.metadata
+    assert not lazy._lazy
+
+
+def test_update_metadata_incremental(airr_reannotated_copies):
+    dat = ddl.Dandelion(airr_reannotated_copies(4)).data
+    cells = dat['cell_id'].unique()
+    vdj = ddl.Dandelion(dat[dat['cell_id'] != cells[-1]])
+    builder = vdj._metadata_builder
+    # append a cell, drop another and edit the constant calls of a third
+    tmp = pd.concat([vdj.data[vdj.data['cell_id'] != cells[0]],
+                     dat[dat['cell_id'] == cells[-1]]])
+    tmp.loc[tmp['cell_id'] == cells[1], 'c_call'] = 'IGHA1'
+    vdj.data = tmp
+    ddl.update_metadata(vdj, reinitialize=True)
+    assert vdj._metadata_builder is builder
+    pd.testing.assert_frame_equal(vdj.metadata, ddl.Dandelion(tmp).metadata)
+    assert vdj.metadata.loc[cells[1], 'isotype'] == 'IgA'
+    # columns derived from unchanged .data columns are not rebuilt
+    vdj_status = builder.cache['vdj_status']
+    vdj.data['c_call'] = 'IGHM'
+    ddl.update_metadata(vdj, reinitialize=True)
+    assert builder.cache['vdj_status'] is vdj_status
+    pd.testing.assert_frame_equal(vdj.metadata,
+                                  ddl.Dandelion(vdj.data).metadata)
+    # values edited in place are picked up by an explicit update
+    vdj.data.loc[vdj.data.index[0], 'c_call'] = 'IGHG1'
+    ddl.update_metadata(vdj, reinitialize=True)
+    pd.testing.assert_frame_equal(vdj.metadata,
+                                  ddl.Dandelion(vdj.data).metadata)
@@ -2,13 +2,16 @@
 import sys
 import pytest
 import json
+import numpy as np
 import pandas as pd
 import dandelion as ddl
 import scanpy as sc
 from pathlib import Path
+from airr import ValidationError
 
 from fixtures import (
     airr_reannotated,
+    airr_reannotated_copies,
     dummy_adata,
     create_testfolder,
     json_10x_cr6,
@@ -359,3 +362,300 @@ def test_setup(create_testfolder, airr_reannotated, dummy_adata):
 #                                  method=method,
 #                                  update_obs_meta=False)
 #     assert isinstance(tmp, pd.DataFrame)
+
+
+@pytest.mark.parametrize("method", ['dense', 'index'])
+def test_cluster_sequences(method):
+    from dandelion.tools._clustering import cluster_sequences
+    seqs = ['CARDYW', 'CARDFW', 'CAKDFW', 'CTTTTW', 'GGGGGG']
+    clones = cluster_sequences(seqs, 1, block_size=2, method=method)
+    assert clones == [('CAKDFW', 'CARDFW', 'CARDYW'), ('CTTTTW', ),
+                      ('GGGGGG', )]
+    # sequences too short to cut into threshold + 1 segments
+    clones = cluster_sequences(['AB', 'CD', 'AC'], 2, method=method)
+    assert clones == [('AB', 'AC', 'CD')]
+
+
+@pytest.mark.parametrize("max_distance", [None, 0, 2])
+def test_levenshtein_distances(max_distance):
+    from polyleven import levenshtein
+    from dandelion.tools._clustering import levenshtein_distances
+    query = 'CARDYW' * 12
+    targets = ['', 'CARDYW', query, query[1:], query + 'GG', query[::-1]]
+    expected = [levenshtein(query, t) for t in targets]
+    if max_distance is not None:
+        expected = [min(e, max_distance + 1) for e in expected]
+    assert list(levenshtein_distances(query, targets,
+                                      max_distance)) == expected
+    expected = [len(t) for t in targets]
+    if max_distance is not None:
+        expected = [min(e, max_distance + 1) for e in expected]
+    assert list(levenshtein_distances('', targets,
+                                      max_distance)) == expected
+
+
+def test_sanitize_data(airr_reannotated):
+    dat = ddl.utl.sanitize_data(airr_reannotated)
+    assert 'sanitized' in dat.attrs
+    assert dat['junction_length'].dtype == 'int64'
+    # a copy is recognised as clean, a changed column is sanitized again
+    dat2 = dat.copy()
+    dat2.loc[dat2.index[0], 'c_call'] = None
+    dat2 = ddl.utl.sanitize_data(dat2)
+    assert dat2['c_call'].iloc[0] == ''
+    pd.testing.assert_frame_equal(dat2.drop('c_call', axis=1),
+                                  dat.drop('c_call', axis=1))
+    dat2.loc[dat2.index[0], 'productive'] = 'maybe'
+    with pytest.raises(ValidationError):
+        ddl.utl.sanitize_data(dat2, sample=dat2.shape[0])
+    # columns are digested by their values, not by the objects holding them
+    from dandelion.utilities._utilities import _column_digest
+    rebuilt = dat['v_call'].map(lambda x: (x + '.')[:-1])
+    assert _column_digest(rebuilt) == _column_digest(dat['v_call'])
+    assert _column_digest(pd.Series(['1', '2'])) != _column_digest(
+        pd.Series([1, 2], dtype=object))
+
+
+def test_validate_airr(airr_reannotated):
+    dat = ddl.utl.sanitize_data(airr_reannotated)
+    dat.loc[dat.index[0], 'productive'] = 'maybe'
+    ddl.utl.validate_airr(dat, policy='none')
+    ddl.utl.validate_airr(dat, policy='header')
+    with pytest.raises(ValidationError):
+        ddl.utl.validate_airr(dat, policy='full')
+    with pytest.raises(ValidationError):
+        ddl.utl.validate_airr(dat.drop('junction', axis=1), policy='header')
+    ddl.utl.set_airr_validation('header')
+    try:
+        ddl.utl.sanitize_data(dat)
+        with pytest.raises(ValidationError):
+            ddl.utl.sanitize_data(dat, validate='full')
+    finally:
+        ddl.utl.set_airr_validation()
+    with pytest.raises(ValueError):
+        ddl.utl.set_airr_validation('some')
+
+
+def test_compact_storage(airr_reannotated, tmp_path):
+    vdj = ddl.Dandelion(airr_reannotated)
+    ddl.tl.find_clones(vdj)
+    compact = ddl.Dandelion(airr_reannotated)
+    compact.compact(max_categories=1, min_length=50, store=str(tmp_path))
+    assert compact.data['v_call'].dtype == 'category'
+    assert compact.data['sequence'].dtype == 'string[pyarrow]'
+    files = sorted(f.name for f in tmp_path.iterdir())
+    assert 'sequence.arrow' in files
+    assert compact.data['sequence'].iloc[0] == vdj.data['sequence'].iloc[0]
+    ddl.tl.find_clones(compact)
+    # assigned .data is compacted too
+    assert compact.data['clone_id'].dtype == 'category'
+    # the offloaded files are replaced, not added to
+    assert sorted(f.name for f in tmp_path.iterdir()) == files
+    pd.testing.assert_frame_equal(ddl.utl.expand_data(compact.data),
+                                  vdj.data,
+                                  check_dtype=False)
+    pd.testing.assert_frame_equal(compact.metadata,
+                                  vdj.metadata,
+                                  check_dtype=False,
+                                  check_categorical=False)
+    ddl.tl.generate_network(compact)
+    assert compact.distance is not None
+    f = tmp_path / 'compact.h5'
+    compact.write_h5(f)
+    assert ddl.read_h5(f).data['sequence'].dtype == object
+
+
+def test_copy_on_write(airr_reannotated):
+    vdj = ddl.Dandelion(airr_reannotated)
+    ddl.tl.find_clones(vdj)
+    ddl.tl.generate_network(vdj)
+    vdj2 = vdj.copy()
+    # slots are shared until accessed
+    assert vdj2.__dict__['_graph'] is vdj.__dict__['_graph']
+    vdj2.data.loc[vdj2.data.index[0], 'c_call'] = 'IGHG1'
+    vdj2.graph[0].add_node('new')
+    assert vdj.data['c_call'].iloc[0] != 'IGHG1'
+    assert 'new' not in vdj.graph[0]
+    # references taken before the copy don't reach it
+    data = vdj.data
+    vdj3 = vdj.copy()
+    data['x'] = 1
+    assert 'x' not in vdj3.data
+    assert 'x' in vdj.data
+    # a fresh object is not exposed by its own construction
+    fresh = ddl.Dandelion(airr_reannotated)
+    repr(fresh)
+    fresh2 = fresh.copy()
+    assert fresh2.__dict__['_data'] is fresh.__dict__['_data']
+    assert fresh2.__dict__['_metadata'] is fresh.__dict__['_metadata']
+    fresh2.data['c_call'] = 'IGHG1'
+    assert fresh2.__dict__['_data'] is not fresh.__dict__['_data']
+    assert 'IGHG1' not in set(fresh.data['c_call'])
+    lazy =ddl.Dandelion(airr_reannotated, lazy=True)
+    lazy2 = lazy.copy()
+    lazy2.data['c_call'] = 'IGHG1'
+    assert lazy2._metadata_builder.vdj is lazy2
+    assert set(lazy2.metadata['isotype']) == {'IgG', 'unassigned'}
+    assert 'IgM' in set(lazy.metadata['isotype'])
+
+
+def test_filter_contigs_engine():
+    dat = pd.DataFrame({
+        'sequence_id': ['a1', 'a2', 'a3', 'b1', 'b2', 'b3', 'c1', 'c2'],
+        'cell_id': ['a', 'a', 'a', 'b', 'b', 'b', 'c', 'c'],
+        'locus': ['IGH', 'IGH', 'IGK', 'IGH', 'IGH', 'IGL', 'IGK', 'IGH'],
+        'productive': ['T', 'T', 'T', 'T', 'T', 'T', 'T', 'F'],
+        'v_call': ['IGHV1*01'] * 2 + ['IGKV1*01'] + ['IGHV1*01'] * 2 +
+        ['IGLV1*01', 'IGKV1*01', 'IGHV1*01'],
+        'd_call': ['', '', '', '', '', '', '', ''],
+        'j_call': ['IGHJ1*01'] * 2 + ['IGKJ1*01'] + ['IGHJ1*01'] * 2 +
+        ['IGLJ1*01', 'IGKJ1*01', 'IGHJ1*01'],
+        'c_call': ['IGHM', 'IGHM', 'IGKC', 'IGHM', 'IGHM', 'IGLC', 'IGKC', ''],
+        'duplicate_count': [3, 2, 5, 2, 20, 5, 5, 1],
+        'sequence_alignment': ['AAA', 'AAA', 'CCC', 'AAA', 'GGG', 'CCC', 'CCC',
+                               'TTT'],
+    })
+    tofilter = ddl.pp._preprocessing.FilterContigs(dat, True, 2, True)
+    # identical heavy chains are merged into the one of highest umi count
+    assert tofilter.umi_adjustment == {'a1': 5}
+    # the heavy chain of low umi count is dropped, cell c has no productive heavy chain
+    assert set(tofilter.drop_contig) == {'a1', 'a2', 'b1', 'c1'}
+    assert tofilter.poor_qual == ['c']
+    assert 'a' not in tofilter.h_doublet
+    # tied umi counts
+    dat.loc[dat['sequence_id'] == 'b1', 'duplicate_count'] = 20
+    tofilter = ddl.pp._preprocessing.FilterContigs(dat, True, 2, True)
+    assert tofilter.h_doublet == ['b']
+    assert 'b1' not in tofilter.drop_contig
+    lite = ddl.pp._preprocessing.FilterContigsLite(dat)
+    assert set(lite.drop_contig) == {'a1', 'a2'}
+    assert lite.poor_qual == []
+
+
+def test_filter_contigs_n_jobs(airr_reannotated, dummy_adata):
+    vdj, adata = ddl.pp.filter_contigs(airr_reannotated,
+                                       dummy_adata,
+                                       filter_poorqualitycontig=True)
+    vdj2, adata2 = ddl.pp.filter_contigs(airr_reannotated,
+                                         dummy_adata,
+                                         filter_poorqualitycontig=True,
+                                         n_jobs=2,
+                                         chunk_size=2)
+    pd.testing.assert_frame_equal(vdj.data, vdj2.data)
+    pd.testing.assert_frame_equal(adata.obs, adata2.obs)
+
+
+def test_find_clones_n_jobs(airr_reannotated):
+    vdj = ddl.Dandelion(airr_reannotated)
+    ddl.tl.find_clones(vdj)
+    vdj2 = ddl.Dandelion(airr_reannotated)
+    ddl.tl.find_clones(vdj2, n_jobs=2)
+    assert vdj.data['clone_id'].equals(vdj2.data['clone_id'])
+
+
+def test_find_clones_incremental(airr_reannotated):
+    dat = ddl.utl.load_data(airr_reannotated)
+    cells = dat['cell_id'].unique()
+    vdj = ddl.Dandelion(dat[dat['cell_id'].isin(cells[:3])])
+    ddl.tl.find_clones(vdj)
+    assert 'clone_id' in vdj.clone_index
+    before = vdj.data['clone_id'].copy()
+    vdj_new = ddl.Dandelion(dat[~dat['cell_id'].isin(cells[:3])])
+    vdj = ddl.concat([vdj, vdj_new])
+    ddl.tl.find_clones(vdj, incremental=True)
+    assert vdj.data.loc[before.index, 'clone_id'].equals(before)
+    assert len(set(x for x in vdj.metadata['clone_id'] if x != '')) == 4
+    # contigs that can't be clustered don't make their cell pending
+    from dandelion.tools._tools import _pending_cells
+    data = vdj.data[vdj.data['productive'] == 'T'].copy()
+    loci = (['IGH'], ['IGK', 'IGL'])
+    assert len(_pending_cells(data, 'clone_id', 'junction_aa', *loci)) == 0
+    heavy = data.index[data['locus'] == 'IGH'][0]
+    data.loc[heavy, 'clone_id'] = ''
+    assert list(_pending_cells(data, 'clone_id', 'junction_aa',
+                               *loci)) == [data.loc[heavy, 'cell_id']]
+    data.loc[heavy, 'j_call'] = ''
+    assert len(_pending_cells(data, 'clone_id', 'junction_aa', *loci)) == 0
+    with pytest.raises(ValueError):
+        ddl.tl.find_clones(vdj_new, incremental=True)
+
+
+def test_find_clones_incremental_after_network(airr_reannotated):
+    dat = ddl.utl.load_data(airr_reannotated)
+    cells = dat['cell_id'].unique()
+    vdj = ddl.Dandelion(dat[dat['cell_id'].isin(cells[:3])])
+    ddl.tl.find_clones(vdj)
+    ddl.tl.generate_network(vdj)
+    assert 'clone_id' in vdj.clone_index
+    before = vdj.data['clone_id'].copy()
+    vdj_new = ddl.Dandelion(dat[~dat['cell_id'].isin(cells[:3])])
+    vdj = ddl.concat([vdj, vdj_new])
+    ddl.tl.find_clones(vdj, incremental=True)
+    assert vdj.data.loc[before.index, 'clone_id'].equals(before)
+
+
+def test_generate_network_sparse(airr_reannotated_copies):
+    # make clones out of three copies of each cell, the last one mutated
+    dat = airr_reannotated_copies(3)
+    mutated = dat['cell_id'].str.startswith('c')
+    dat.loc[mutated, 'sequence_alignment_aa'] = [
+        s[:10] + 'W' + s[11:] for s in dat.loc[mutated, 'sequence_alignment_aa']
+    ]
+    vdj = ddl.Dandelion(dat)
+    ddl.tl.find_clones(vdj)
+    vdj2 = vdj.copy()
+    ddl.tl.generate_network(vdj, distance_backend='dense')
+    ddl.tl.generate_network(vdj2)
+    for x in vdj.distance:
+        # only distances within clones are stored
+        d = vdj2.distance[x].tocoo()
+        assert vdj2.distance[x].nnz <= vdj.distance[x].nnz
+        assert (vdj.distance[x].toarray()[d.row, d.col] == d.data).all()
+    assert vdj2.edges.shape[0] == 15
+    assert vdj.edges.equals(vdj2.edges)
+    vdj3 = vdj2.copy()
+    ddl.tl.generate_network(vdj3, distance_kernel='polyleven', n_jobs=2)
+    for x in vdj2.distance:
+        assert (vdj2.distance[x] != vdj3.distance[x]).nnz == 0
+    assert vdj2.edges.equals(vdj3.edges)
+    with pytest.raises(ValueError):
+        ddl.tl.generate_network(vdj, distance_backend='foo')
+
+
+@pytest.mark.parametrize("isolates", ['simulate', 'analytic'])
+def test_generate_layout_barnes_hut(isolates):
+    import networkx as nx
+    from dandelion.tools._network import _fruchterman_reingold_layout
+    G = nx.path_graph(50)
+    G.add_nodes_from(range(50, 100))
+    pos = _fruchterman_reingold_layout(G,
+                                       method='barnes_hut',
+                                       isolates=isolates,
+                                       seed=1)
+    pos = np.array([pos[n] for n in G])
+    assert pos.shape == (100, 2)
+    assert np.abs(pos).max() == pytest.approx(1)
+    assert G.graph['layout']['method'] == 'barnes_hut'
+    assert G.graph['layout']['iterations'] <= 50
+    # the approximation is opt-in
+    _fruchterman_reingold_layout(G, seed=1)
+    assert G.graph['layout']['method'] == 'exact'
+
+
+@pytest.mark.parametrize("trimmed_layout", ['refine', 'subset', 'independent'])
+def test_generate_layout_trimmed(trimmed_layout):
+    from dandelion.tools._network import generate_layout
+    edges = pd.DataFrame({
+        'source': ['a', 'b', 'd'],
+        'target': ['b', 'c', 'e'],
+        'weight': [1, 2, 0]
+    })
+    G, G_, pos, pos_ = generate_layout(list('abcdefgh'),
+                                       edges,
+                                       verbose=False,
+                                       trimmed_layout=trimmed_layout,
+                                       seed=1)
+    assert len(pos) == 8
+    assert set(pos_) == set('abcde')
+    if trimmed_layout == 'refine':
+        assert G_.graph['layout']['iterations'] <= 10